@@ -1,5 +1,9 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate, stamp, upgrade
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
 from flask_cors import CORS
 import os
 from flask import request, jsonify
@@ -7,13 +11,38 @@ from flask_bcrypt import Bcrypt
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user, UserMixin
 from werkzeug.utils import secure_filename
 from flask import send_from_directory
+from flask import Response, stream_with_context
+from flask import g
 from datetime import timedelta, datetime
-from openai import OpenAI
 from dotenv import load_dotenv
 import secrets
 import qrcode
 import io
 import base64
+import json
+import uuid
+import hashlib
+import hmac
+import time
+import re
+import threading
+import socket
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from model_client import get_model_client
+from model_router import TIER_FAST, TIERS, ModelUnavailableError, choose_tier, get_model_router
+from twilio_client import get_twilio_client
+from frame_sampler import SAMPLING_STRATEGIES, extract_keyframes, extract_segments, select_uniform
+from video_ingest import hash_file, probe_video, make_thumbnail
+from vector_index import HashingEmbedder, ModelEmbedder, VectorIndex, tokenize
+from whatsapp_router import NameIndex, route_message
+from scheduler import BACKGROUND, INTERACTIVE, WHATSAPP, DeadlineExceeded, current_work, deadline_remaining, scheduled
+from single_flight import SingleFlight
+from metrics import COALESCED_REQUESTS, REQUEST_LATENCY, SLOW_OPERATIONS, finish_trace, format_stages, record, render_metrics, span, start_trace, traced_job
+from zoneinfo import ZoneInfo
+import numpy as np
+import sqlite3
+from config import Config
 
 load_dotenv()  # Load environment variables from .env if present
 
@@ -21,13 +50,128 @@ app = Flask(__name__)
 CORS(app)
 
 # Configurations
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///cctv_chat.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = Config.get_database_url()
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = Config.get_engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev_secret_key')
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=24)  # Session timeout
 
+# Number of background threads running analysis jobs
+ANALYSIS_WORKERS = int(os.environ.get('ANALYSIS_WORKERS', 4))
+# Number of background threads probing and thumbnailing new uploads
+INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', 2))
+# Number of background threads captioning videos for the timeline index
+INDEX_WORKERS = int(os.environ.get('INDEX_WORKERS', 1))
+# Number of background threads describing frame batches from remote stream ingestors
+STREAM_WORKERS = int(os.environ.get('STREAM_WORKERS', 2))
+# Number of background threads answering WhatsApp messages
+WHATSAPP_WORKERS = int(os.environ.get('WHATSAPP_WORKERS', 4))
+# Seconds after a WhatsApp message arrives by which its model calls must have answered; a call still
+# queued or running then gives a "busy" reply. Replies sent in the webhook response must beat Twilio's
+# 15 second webhook timeout.
+WHATSAPP_DEADLINE_SECONDS = float(os.environ.get('WHATSAPP_DEADLINE_SECONDS', 120))
+WHATSAPP_WEBHOOK_DEADLINE_SECONDS = float(os.environ.get('WHATSAPP_WEBHOOK_DEADLINE_SECONDS', 10))
+# Time zone for date phrases in WhatsApp messages ("yesterday", "last night") and the times in replies
+WHATSAPP_TIMEZONE = ZoneInfo(os.environ.get('WHATSAPP_TIMEZONE', 'UTC'))
+# Seconds a cached per-user video name index is trusted before it is rebuilt (renames in other processes)
+NAME_INDEX_TTL = int(os.environ.get('NAME_INDEX_TTL', 60))
+# Seconds after which background work claimed by a server process (job, ingestion, indexing) is
+# assumed lost with that process and may be picked up by another one
+STALE_WORK_SECONDS = int(os.environ.get('STALE_WORK_SECONDS', 1800))
+# Chunked upload limits (bytes)
+UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', 4 * 1024 * 1024))
+MAX_UPLOAD_CHUNK_SIZE = int(os.environ.get('MAX_UPLOAD_CHUNK_SIZE', 32 * 1024 * 1024))
+MAX_UPLOAD_SIZE = int(os.environ.get('MAX_UPLOAD_SIZE', 2 * 1024 * 1024 * 1024))
+# Video file serving: lifetime of signed URLs, browser cache lifetime, and
+# PUBLIC_VIDEO_FILES=true to serve files without a session or signature
+VIDEO_URL_TTL = int(os.environ.get('VIDEO_URL_TTL', 3600))
+VIDEO_FILE_MAX_AGE = int(os.environ.get('VIDEO_FILE_MAX_AGE', 3600))
+PUBLIC_VIDEO_FILES = os.environ.get('PUBLIC_VIDEO_FILES', 'false').lower() == 'true'
+# Let a fronting server (Apache mod_xsendfile, lighttpd) stream files via X-Sendfile
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', 'false').lower() == 'true'
+# Answer cache limits (seconds before an entry expires, max rows kept)
+ANSWER_CACHE_TTL = int(os.environ.get('ANSWER_CACHE_TTL', 7 * 24 * 3600))
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get('ANSWER_CACHE_MAX_ENTRIES', 10000))
+# Identical analysis requests running at once share one model call; other server processes wait up to
+# ANALYSIS_LOCK_SECONDS for the process holding the lock, checking every ANALYSIS_LOCK_POLL seconds
+ANALYSIS_LOCK_SECONDS = int(os.environ.get('ANALYSIS_LOCK_SECONDS', 300))
+ANALYSIS_LOCK_POLL = float(os.environ.get('ANALYSIS_LOCK_POLL', 0.5))
+# Keyframe sampling sent to the model instead of the full video ('none' sends the video URL)
+FRAME_SAMPLING_STRATEGY = os.environ.get('FRAME_SAMPLING_STRATEGY', 'scene')
+MAX_FRAMES_PER_REQUEST = int(os.environ.get('MAX_FRAMES_PER_REQUEST', 16))
+# Most questions /api/analyze_video/batch answers with one model call
+BATCH_MAX_QUESTIONS = int(os.environ.get('BATCH_MAX_QUESTIONS', 10))
+# Motion gate sensitivity (0-1) for uploaded videos and new cameras; empty disables the gate
+MOTION_SENSITIVITY = os.environ.get('MOTION_SENSITIVITY', '0.5')
+MOTION_SENSITIVITY = float(MOTION_SENSITIVITY) if MOTION_SENSITIVITY else None
+# Timeline index: segment length, keyframes captioned per segment, segments sent with a question,
+# and AUTO_INDEX_VIDEOS=true to caption new uploads after ingestion
+SEGMENT_SECONDS = float(os.environ.get('SEGMENT_SECONDS', 10))
+FRAMES_PER_SEGMENT = int(os.environ.get('FRAMES_PER_SEGMENT', 4))
+INDEX_SEGMENTS_PER_QUESTION = int(os.environ.get('INDEX_SEGMENTS_PER_QUESTION', 3))
+AUTO_INDEX_VIDEOS = os.environ.get('AUTO_INDEX_VIDEOS', 'true').lower() == 'true'
+# Semantic search embeddings: 'local' uses the offline hashing embedder, anything else is an
+# embedding model name on the DashScope-compatible endpoint (e.g. text-embedding-v3)
+EMBEDDING_MODEL = os.environ.get('EMBEDDING_MODEL', 'local')
+EMBEDDING_DIM = int(os.environ.get('EMBEDDING_DIM', 384 if EMBEDDING_MODEL == 'local' else 1024))
+# Seconds of embeddings re-read on each index refresh, for rows committed late or by a host with a skewed clock
+EMBEDDING_REFRESH_OVERLAP = float(os.environ.get('EMBEDDING_REFRESH_OVERLAP', 300))
+# Most recent full-text matches ranked per chat search
+FULLTEXT_RANK_WINDOW = int(os.environ.get('FULLTEXT_RANK_WINDOW', 1000))
+# Requests and background jobs slower than these (seconds) are logged with a per-stage breakdown
+SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_SECONDS', 2.0))
+SLOW_JOB_SECONDS = float(os.environ.get('SLOW_JOB_SECONDS', 60.0))
+# Bearer token required by /metrics when set
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+# SQLite journal mode; WAL lets readers carry on while a worker writes
+SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+
 db = SQLAlchemy(app)
 
+def include_schema_object(obj, name, type_, reflected, compare_to):
+    # The SQLite FTS5 tables are managed by create_fulltext_index, not by migrations
+    return not (type_ == 'table' and name.startswith(('video_fts', 'chat_fts')))
+
+# render_as_batch lets migrations alter SQLite tables (by copying them)
+migrate = Migrate(app, db, render_as_batch=True, include_object=include_schema_object)
+
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f'PRAGMA journal_mode={SQLITE_JOURNAL_MODE}')
+    # WAL is safe against corruption with NORMAL; only the last commits can be lost on power failure
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.close()
+
+# Time every SQL statement as the 'db' stage
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    record('db', time.perf_counter() - conn.info['query_start'].pop())
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    start_trace()
+
+@app.after_request
+def record_request_latency(response):
+    if 'request_start' not in g:
+        return response
+    elapsed = time.perf_counter() - g.request_start
+    stages = finish_trace()
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    REQUEST_LATENCY.labels(request.method, endpoint, response.status_code).observe(elapsed)
+    if elapsed >= SLOW_REQUEST_SECONDS:
+        SLOW_OPERATIONS.labels('request').inc()
+        print(f"Slow request {request.method} {request.path} {response.status_code}: {elapsed:.3f}s {format_stages(stages)}")
+    return response
+
 bcrypt = Bcrypt(app)
 login_manager = LoginManager(app)
 
@@ -57,6 +201,14 @@ def load_user(user_id):
 def root():
     return jsonify({'message': 'CCTV Chat Backend is running!', 'status': 'healthy'}), 200
 
+# Prometheus metrics endpoint
+@app.route('/metrics')
+def metrics_endpoint():
+    if METRICS_TOKEN and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {METRICS_TOKEN}'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    body, content_type = render_metrics()
+    return body, 200, {'Content-Type': content_type}
+
 # Health check endpoint with environment status
 @app.route('/health')
 def health_check():
@@ -114,14 +266,49 @@ class Video(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     video_name = db.Column(db.String(256))
     video_type = db.Column(db.String(32)) # upload/camera/url
-    file_path_or_url = db.Column(db.String(512))
+    file_path_or_url = db.Column(db.String(512), index=True)  # looked up per request when serving files
     upload_date = db.Column(db.DateTime, server_default=db.func.now())
     file_size = db.Column(db.Integer)
     duration = db.Column(db.Integer)
     thumbnail_path = db.Column(db.String(512))
     is_processed = db.Column(db.Boolean, default=False)
     is_favorite = db.Column(db.Boolean, default=False)
+    content_hash = db.Column(db.String(64))
+    processing_error = db.Column(db.String(256))
+    index_status = db.Column(db.String(16), default='none')  # none/queued/indexing/indexed/failed
+    indexed_at = db.Column(db.DateTime)
+    # When a worker process claimed ingestion/indexing; claims older than STALE_WORK_SECONDS are retaken
+    ingest_started_at = db.Column(db.DateTime)
+    index_started_at = db.Column(db.DateTime)
     chats = db.relationship('ChatHistory', backref='video', lazy=True)
+    segments = db.relationship('VideoSegment', backref='video', lazy=True, cascade='all, delete-orphan',
+                               order_by='VideoSegment.segment_index')
+    # Matches the library listing: filter by owner, order by favorite then upload date (id breaks ties)
+    __table_args__ = (db.Index('ix_video_user_favorite_upload', 'user_id', 'is_favorite', 'upload_date', 'id'),)
+
+# Timestamped caption of one fixed-length segment of a video (the timeline index)
+class VideoSegment(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    video_id = db.Column(db.Integer, db.ForeignKey('video.id'), nullable=False, index=True)
+    segment_index = db.Column(db.Integer, nullable=False)
+    start_time = db.Column(db.Float, nullable=False)  # seconds from the start of the video
+    end_time = db.Column(db.Float, nullable=False)
+    caption = db.Column(db.Text)
+    has_activity = db.Column(db.Boolean, default=True, nullable=False)
+    frames = db.Column(db.Text)  # JSON list of keyframe {'path', 'frame_index', 'timestamp'}
+    model_used = db.Column(db.String(64))
+    created_at = db.Column(db.DateTime, server_default=db.func.now())
+    __table_args__ = (db.UniqueConstraint('video_id', 'segment_index'),)
+
+    def to_dict(self):
+        return {
+            'segment_index': self.segment_index,
+            'start_time': self.start_time,
+            'end_time': self.end_time,
+            'caption': self.caption,
+            'has_activity': self.has_activity,
+            'model_used': self.model_used
+        }
 
 # Chat history model
 class ChatHistory(db.Model):
@@ -132,6 +319,8 @@ class ChatHistory(db.Model):
     answer = db.Column(db.Text)
     timestamp = db.Column(db.DateTime, server_default=db.func.now())
     model_used = db.Column(db.String(64))
+    # Matches a video's conversation: filter by video and owner, order by time (id breaks ties)
+    __table_args__ = (db.Index('ix_chat_history_video_user_time', 'video_id', 'user_id', 'timestamp', 'id'),)
 
 class WhatsAppLinkToken(db.Model):
     token = db.Column(db.String(16), primary_key=True)
@@ -140,10 +329,205 @@ class WhatsAppLinkToken(db.Model):
     used = db.Column(db.Boolean, default=False, nullable=False)
     created_at = db.Column(db.DateTime, server_default=db.func.now())
 
-UPLOAD_FOLDER = os.path.join(os.getcwd(), 'upload')
+# Incoming WhatsApp message, keyed on Twilio's MessageSid so webhook retries are processed once
+class WhatsAppMessage(db.Model):
+    message_sid = db.Column(db.String(64), primary_key=True)
+    from_number = db.Column(db.String(64), nullable=False)
+    body = db.Column(db.Text)
+    status = db.Column(db.String(16), default='received', nullable=False, index=True)  # received/processing/replied/failed
+    reply = db.Column(db.Text)
+    reply_sid = db.Column(db.String(64))  # SID of the reply sent through the REST API
+    error = db.Column(db.String(256))
+    created_at = db.Column(db.DateTime, server_default=db.func.now())
+    started_at = db.Column(db.DateTime)
+    replied_at = db.Column(db.DateTime)
+
+# Analysis job model (queued Qwen-VL requests)
+class AnalysisJob(db.Model):
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    video_id = db.Column(db.Integer, db.ForeignKey('video.id'), nullable=False)
+    question = db.Column(db.Text, nullable=False)
+    video_url = db.Column(db.String(1024))
+    status = db.Column(db.String(16), default='queued', nullable=False)  # queued/running/completed/failed
+    answer = db.Column(db.Text)
+    error = db.Column(db.Text)
+    model_used = db.Column(db.String(64))
+    model_tier = db.Column(db.String(16))  # fast/max
+    sampling = db.Column(db.String(16))
+    max_frames = db.Column(db.Integer)
+    cache_key = db.Column(db.String(64))
+    use_index = db.Column(db.Boolean, default=True, nullable=False)
+    answered_from_index = db.Column(db.Boolean, default=False, nullable=False)
+    chat_id = db.Column(db.Integer, db.ForeignKey('chat_history.id'), nullable=True)
+    created_at = db.Column(db.DateTime, server_default=db.func.now())
+    started_at = db.Column(db.DateTime)
+    completed_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'video_id': self.video_id,
+            'question': self.question,
+            'status': self.status,
+            'answer': self.answer,
+            'error': self.error,
+            'model_used': self.model_used,
+            'model_tier': self.model_tier,
+            'sampling': self.sampling,
+            'answered_from_index': self.answered_from_index,
+            'chat_id': self.chat_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+        }
+
+# Embedding of a chat answer or segment caption, used by semantic search
+class Embedding(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    video_id = db.Column(db.Integer, db.ForeignKey('video.id'), nullable=False, index=True)
+    kind = db.Column(db.String(16), nullable=False)  # chat/segment
+    ref_id = db.Column(db.Integer, nullable=False)  # ChatHistory.id or VideoSegment.id
+    model = db.Column(db.String(64), nullable=False)
+    start_time = db.Column(db.Float)  # segment span within the video, in seconds
+    end_time = db.Column(db.Float)
+    vector = db.Column(db.LargeBinary, nullable=False)  # float32 bytes, L2-normalised
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        db.UniqueConstraint('kind', 'ref_id', 'model'),
+        db.Index('ix_embedding_model_created', 'model', 'created_at'),
+    )
+
+# Cached model answers keyed on video content, question, model and prompt
+class AnswerCache(db.Model):
+    key = db.Column(db.String(64), primary_key=True)
+    answer = db.Column(db.Text, nullable=False)
+    model_used = db.Column(db.String(64))
+    answered_from_index = db.Column(db.Boolean)
+    hit_count = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    last_accessed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+# Held while one server process computes the answer for an answer cache key
+class AnalysisLock(db.Model):
+    key = db.Column(db.String(64), primary_key=True)
+    owner = db.Column(db.String(128), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+# Resumable chunked upload in progress
+class UploadSession(db.Model):
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    filename = db.Column(db.String(256), nullable=False)
+    total_size = db.Column(db.BigInteger, nullable=False)
+    received_bytes = db.Column(db.BigInteger, default=0, nullable=False)
+    status = db.Column(db.String(16), default='active', nullable=False)  # active/completed
+    video_id = db.Column(db.Integer, db.ForeignKey('video.id'), nullable=True)
+    created_at = db.Column(db.DateTime, server_default=db.func.now())
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'upload_id': self.id,
+            'filename': self.filename,
+            'total_size': self.total_size,
+            'received_bytes': self.received_bytes,
+            'status': self.status,
+            'video_id': self.video_id,
+            'chunk_size': UPLOAD_CHUNK_SIZE
+        }
+
+# Camera configuration, plus health reported by the stream supervisor
+class Camera(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    name = db.Column(db.String(128), nullable=False)
+    rtsp_url = db.Column(db.String(512), nullable=False)  # RTSP URL, or a local file standing in for one
+    sampling_rate = db.Column(db.Float, default=1.0, nullable=False)
+    batch_interval = db.Column(db.Float, default=60.0, nullable=False)
+    is_enabled = db.Column(db.Boolean, default=True, nullable=False)
+    motion_sensitivity = db.Column(db.Float)  # 0-1; NULL sends every batch to the model
+    created_at = db.Column(db.DateTime, server_default=db.func.now())
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    status = db.Column(db.String(16), default='stopped')  # connecting/running/reconnecting/stopped
+    fps = db.Column(db.Float)
+    lag_seconds = db.Column(db.Float)
+    frames_read = db.Column(db.BigInteger, default=0)
+    frames_sampled = db.Column(db.BigInteger, default=0)
+    batches_submitted = db.Column(db.Integer, default=0)
+    reconnects = db.Column(db.Integer, default=0)
+    frames_gated = db.Column(db.BigInteger, default=0)  # sampled frames the motion gate kept from the model
+    batches_skipped = db.Column(db.Integer, default=0)  # idle batches, i.e. model calls avoided
+    last_frame_at = db.Column(db.DateTime)
+    last_error = db.Column(db.String(256))
+    status_updated_at = db.Column(db.DateTime)
+    __table_args__ = (db.UniqueConstraint('user_id', 'name'),)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'rtsp_url': self.rtsp_url,
+            'sampling_rate': self.sampling_rate,
+            'batch_interval': self.batch_interval,
+            'is_enabled': self.is_enabled,
+            'motion_sensitivity': self.motion_sensitivity,
+            'health': {
+                'status': self.status,
+                'fps': self.fps,
+                'lag_seconds': self.lag_seconds,
+                'frames_read': self.frames_read,
+                'frames_sampled': self.frames_sampled,
+                'batches_submitted': self.batches_submitted,
+                'reconnects': self.reconnects,
+                'frames_gated': self.frames_gated,
+                'batches_skipped': self.batches_skipped,
+                'last_frame_at': self.last_frame_at.isoformat() if self.last_frame_at else None,
+                'last_error': self.last_error,
+                'updated_at': self.status_updated_at.isoformat() if self.status_updated_at else None
+            }
+        }
+
+# Timestamped event description produced from a batch of live stream frames
+class StreamEvent(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    camera_name = db.Column(db.String(128), nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False)
+    ended_at = db.Column(db.DateTime, nullable=False)
+    stream_offset_start = db.Column(db.Float)
+    stream_offset_end = db.Column(db.Float)
+    frame_count = db.Column(db.Integer)
+    description = db.Column(db.Text)
+    model_used = db.Column(db.String(64))
+    created_at = db.Column(db.DateTime, server_default=db.func.now())
+    # Matches event lookups for one camera over a time window
+    __table_args__ = (db.Index('ix_stream_event_user_camera_started', 'user_id', 'camera_name', 'started_at'),)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'camera_name': self.camera_name,
+            'started_at': self.started_at.isoformat(),
+            'ended_at': self.ended_at.isoformat(),
+            'stream_offset_start': self.stream_offset_start,
+            'stream_offset_end': self.stream_offset_end,
+            'frame_count': self.frame_count,
+            'description': self.description,
+            'model_used': self.model_used
+        }
+
+# Must be shared storage when several server processes or hosts serve the API
+UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', os.path.join(os.getcwd(), 'upload'))
 ALLOWED_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv', 'flv', 'wmv'}
+FRAMES_FOLDER = os.path.join(UPLOAD_FOLDER, 'frames')
+THUMBNAIL_FOLDER = os.path.join(UPLOAD_FOLDER, 'thumbnails')
+PARTIAL_UPLOAD_FOLDER = os.path.join(UPLOAD_FOLDER, 'partial')
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+os.makedirs(THUMBNAIL_FOLDER, exist_ok=True)
+os.makedirs(PARTIAL_UPLOAD_FOLDER, exist_ok=True)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -160,20 +544,157 @@ def upload_video():
     if file and allowed_file(file.filename):
         filename = secure_filename(file.filename)
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        with span('file_io'):
+            file.save(filepath)
+        # Size, duration, thumbnail and hash are filled in by the ingestion pipeline
         video = Video(
             user_id=current_user.id,
             video_name=filename,
             video_type='upload',
             file_path_or_url=filepath,
-            file_size=os.path.getsize(filepath),
             is_processed=False
         )
         db.session.add(video)
         db.session.commit()
-        return jsonify({'message': 'Video uploaded successfully', 'video_id': video.id}), 201
+        submit_ingestion(video.id)
+        return jsonify({'message': 'Video uploaded successfully', 'video_id': video.id, 'is_processed': False}), 201
     return jsonify({'error': 'Invalid file type'}), 400
 
+# Incremental SHA-256 state for chunked uploads, keyed by upload id: (hasher, offset).
+# Process-local; finalize rehashes the file when the state is missing or out of step.
+upload_hashers = {}
+upload_hashers_lock = threading.Lock()
+
+def partial_upload_path(upload_id):
+    return os.path.join(PARTIAL_UPLOAD_FOLDER, f'{upload_id}.part')
+
+def unique_upload_path(filename, suffix):
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    if os.path.exists(filepath):
+        name, ext = os.path.splitext(filename)
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], f'{name}_{suffix}{ext}')
+    return filepath
+
+# Start a resumable chunked upload
+@app.route('/api/uploads', methods=['POST'])
+@login_required
+def create_upload():
+    data = request.json or {}
+    filename = secure_filename(data.get('filename') or '')
+    total_size = data.get('total_size')
+    if not filename or not allowed_file(filename):
+        return jsonify({'error': 'Invalid file type'}), 400
+    if not isinstance(total_size, int) or total_size <= 0:
+        return jsonify({'error': 'total_size must be a positive integer'}), 400
+    if total_size > MAX_UPLOAD_SIZE:
+        return jsonify({'error': f'File exceeds the {MAX_UPLOAD_SIZE} byte limit'}), 413
+    upload = UploadSession(id=uuid.uuid4().hex, user_id=current_user.id, filename=filename, total_size=total_size)
+    db.session.add(upload)
+    db.session.commit()
+    open(partial_upload_path(upload.id), 'wb').close()
+    with upload_hashers_lock:
+        upload_hashers[upload.id] = (hashlib.sha256(), 0)
+    return jsonify(upload.to_dict()), 201
+
+# Get upload progress (the offset to resume from)
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+@login_required
+def get_upload(upload_id):
+    upload = UploadSession.query.filter_by(id=upload_id, user_id=current_user.id).first()
+    if not upload:
+        return jsonify({'error': 'Upload not found or not owned by user'}), 404
+    return jsonify(upload.to_dict()), 200
+
+# Append a chunk at the given offset, streaming the body to disk
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+@login_required
+def put_upload_chunk(upload_id):
+    upload = UploadSession.query.filter_by(id=upload_id, user_id=current_user.id).first()
+    if not upload:
+        return jsonify({'error': 'Upload not found or not owned by user'}), 404
+    if upload.status != 'active':
+        return jsonify({'error': 'Upload already finalized'}), 409
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        offset = request.headers.get('Upload-Offset', type=int)
+    if offset != upload.received_bytes:
+        # Client is out of step (e.g. a retried chunk); tell it where to resume
+        return jsonify({'error': 'Offset mismatch', **upload.to_dict()}), 409
+    length = request.content_length
+    if length is None or length > MAX_UPLOAD_CHUNK_SIZE:
+        return jsonify({'error': f'Chunks must declare Content-Length of at most {MAX_UPLOAD_CHUNK_SIZE} bytes'}), 413
+    if offset + length > upload.total_size:
+        return jsonify({'error': 'Chunk exceeds declared total_size'}), 400
+
+    with upload_hashers_lock:
+        hasher, hashed = upload_hashers.pop(upload_id, (None, None))
+    if hashed != offset:
+        hasher = None
+
+    written = 0
+    with open(partial_upload_path(upload_id), 'r+b') as f:
+        f.seek(offset)
+        f.truncate()
+        while written < length:
+            block = request.stream.read(min(1024 * 1024, length - written))
+            if not block:
+                break
+            with span('file_io'):
+                f.write(block)
+            if hasher:
+                hasher.update(block)
+            written += len(block)
+
+    upload.received_bytes = offset + written
+    db.session.commit()
+    if hasher:
+        with upload_hashers_lock:
+            upload_hashers[upload_id] = (hasher, upload.received_bytes)
+    return jsonify(upload.to_dict()), 200
+
+# Finish a chunked upload and register the video
+@app.route('/api/uploads/<upload_id>/finalize', methods=['POST'])
+@login_required
+def finalize_upload(upload_id):
+    upload = UploadSession.query.filter_by(id=upload_id, user_id=current_user.id).first()
+    if not upload:
+        return jsonify({'error': 'Upload not found or not owned by user'}), 404
+    if upload.status == 'completed':
+        return jsonify({'message': 'Video uploaded successfully', 'video_id': upload.video_id, 'is_processed': False}), 201
+    if upload.received_bytes != upload.total_size:
+        return jsonify({'error': 'Upload incomplete', **upload.to_dict()}), 409
+
+    part_path = partial_upload_path(upload_id)
+    with upload_hashers_lock:
+        hasher, hashed = upload_hashers.pop(upload_id, (None, None))
+    if hasher and hashed == upload.total_size:
+        content_hash = hasher.hexdigest()
+    else:
+        with span('file_io'):
+            content_hash = hash_file(part_path)
+    expected_hash = (request.json or {}).get('sha256') if request.is_json else None
+    if expected_hash and expected_hash.lower() != content_hash:
+        return jsonify({'error': 'Checksum mismatch', 'sha256': content_hash}), 400
+
+    filepath = unique_upload_path(upload.filename, upload_id[:8])
+    os.replace(part_path, filepath)
+    video = Video(
+        user_id=current_user.id,
+        video_name=os.path.basename(filepath),
+        video_type='upload',
+        file_path_or_url=filepath,
+        file_size=upload.total_size,
+        content_hash=content_hash,
+        is_processed=False
+    )
+    db.session.add(video)
+    db.session.flush()
+    upload.status = 'completed'
+    upload.video_id = video.id
+    db.session.commit()
+    submit_ingestion(video.id)
+    return jsonify({'message': 'Video uploaded successfully', 'video_id': video.id, 'sha256': content_hash, 'is_processed': False}), 201
+
 # Video upload endpoint (URL or camera)
 @app.route('/api/add_video', methods=['POST'])
 @login_required
@@ -195,15 +716,164 @@ def add_video():
     db.session.commit()
     return jsonify({'message': 'Video added successfully', 'video_id': video.id}), 201
 
+# Full-text index (SQLite FTS5) over video names and chat questions/answers. External-content
+# tables keep only the index; triggers keep it in step with the video and chat_history rows.
+FULLTEXT_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS video_fts USING fts5(video_name, content='video', content_rowid='id', tokenize='porter unicode61', prefix='2 3')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS chat_fts USING fts5(question, answer, content='chat_history', content_rowid='id', tokenize='porter unicode61', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS video_fts_ai AFTER INSERT ON video BEGIN INSERT INTO video_fts(rowid, video_name) VALUES (new.id, new.video_name); END",
+    "CREATE TRIGGER IF NOT EXISTS video_fts_ad AFTER DELETE ON video BEGIN INSERT INTO video_fts(video_fts, rowid, video_name) VALUES ('delete', old.id, old.video_name); END",
+    "CREATE TRIGGER IF NOT EXISTS video_fts_au AFTER UPDATE OF video_name ON video BEGIN "
+    "INSERT INTO video_fts(video_fts, rowid, video_name) VALUES ('delete', old.id, old.video_name); "
+    "INSERT INTO video_fts(rowid, video_name) VALUES (new.id, new.video_name); END",
+    "CREATE TRIGGER IF NOT EXISTS chat_fts_ai AFTER INSERT ON chat_history BEGIN INSERT INTO chat_fts(rowid, question, answer) VALUES (new.id, new.question, new.answer); END",
+    "CREATE TRIGGER IF NOT EXISTS chat_fts_ad AFTER DELETE ON chat_history BEGIN INSERT INTO chat_fts(chat_fts, rowid, question, answer) VALUES ('delete', old.id, old.question, old.answer); END",
+    "CREATE TRIGGER IF NOT EXISTS chat_fts_au AFTER UPDATE OF question, answer ON chat_history BEGIN "
+    "INSERT INTO chat_fts(chat_fts, rowid, question, answer) VALUES ('delete', old.id, old.question, old.answer); "
+    "INSERT INTO chat_fts(rowid, question, answer) VALUES (new.id, new.question, new.answer); END",
+]
+fulltext_state = {'checked': False, 'enabled': False}
+fulltext_lock = threading.Lock()
+
+def create_fulltext_index():
+    """Create the FTS5 tables and triggers if missing, rebuilding any index whose triggers were absent.
+
+    Returns False (and search falls back to LIKE) on other databases or SQLite builds without FTS5.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    try:
+        with db.engine.begin() as conn:
+            triggers = set(conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'trigger'").scalars().all())
+            for statement in FULLTEXT_DDL:
+                conn.exec_driver_sql(statement)
+            # Without triggers the index may have missed writes (new index, or recreated tables)
+            if 'video_fts_ai' not in triggers:
+                conn.exec_driver_sql("INSERT INTO video_fts(video_fts) VALUES ('rebuild')")
+            if 'chat_fts_ai' not in triggers:
+                conn.exec_driver_sql("INSERT INTO chat_fts(chat_fts) VALUES ('rebuild')")
+    except Exception as e:
+        print(f"Full-text index unavailable, using LIKE search: {str(e)}")  # Debug logging
+        return False
+    return True
+
+def fulltext_available():
+    if not fulltext_state['checked']:
+        with fulltext_lock:
+            if not fulltext_state['checked']:
+                fulltext_state['enabled'] = create_fulltext_index()
+                fulltext_state['checked'] = True
+    return fulltext_state['enabled']
+
+def fulltext_query(text, prefix=True):
+    """Turn free text into an FTS5 query where every word must match, optionally the last one as a prefix"""
+    words = re.findall(r'\w+', text.lower())
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    if prefix:
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+def highlight_snippet(text, search, width=16):
+    """Short excerpt of text around the first query word, with matched words in [brackets]"""
+    words = re.findall(r'\w+', search.lower())
+    tokens = (text or '').split()
+    pattern = re.compile(r'^\W*(' + '|'.join(re.escape(word) for word in words) + r')', re.IGNORECASE) if words else None
+    hits = [i for i, token in enumerate(tokens) if pattern and pattern.match(token)]
+    if not hits:
+        return None
+    start = max(0, hits[0] - width // 2)
+    excerpt = [re.sub(r'(\w+)', r'[\1]', token, count=1) if i in hits else token
+               for i, token in enumerate(tokens[start:start + width], start)]
+    return ('… ' if start else '') + ' '.join(excerpt) + (' …' if start + width < len(tokens) else '')
+
+def ranked_video_matches(search):
+    """Subquery of (video_id, rank) for videos whose name matches, best first by bm25"""
+    return db.text(
+        "SELECT rowid AS video_id, bm25(video_fts) AS rank FROM video_fts WHERE video_fts MATCH :match"
+    ).bindparams(match=fulltext_query(search)).columns(video_id=db.Integer, rank=db.Float).subquery()
+
+def ranked_chat_ids(match, user_id, video_id, limit, offset):
+    # bm25 has to score every match, so only the most recent matches are ranked; this keeps
+    # very common words fast on large histories
+    sql = (
+        "SELECT id, rank FROM ("
+        "SELECT c.id AS id, bm25(chat_fts, 2.0, 1.0) AS rank "
+        "FROM chat_fts JOIN chat_history c ON c.id = chat_fts.rowid "
+        "WHERE chat_fts MATCH :match AND c.user_id = :user_id"
+        + (" AND c.video_id = :video_id" if video_id else "")
+        + " ORDER BY chat_fts.rowid DESC LIMIT :window"
+        ") ORDER BY rank LIMIT :limit OFFSET :offset"
+    )
+    params = {'match': match, 'user_id': user_id, 'video_id': video_id, 'limit': limit, 'offset': offset,
+              'window': max(FULLTEXT_RANK_WINDOW, offset + limit)}
+    return db.session.execute(db.text(sql), params).all()
+
+def search_chats(user_id, search, video_id=None, limit=20, offset=0):
+    """Ranked chat matches over questions and answers (questions weighted double), with highlighted snippets"""
+    match = fulltext_query(search, prefix=False)
+    if not match:
+        return []
+    if fulltext_available():
+        # Whole-word matches stream straight from the index; a prefix query on the last word
+        # (search-as-you-type) has to merge every matching term, so it only runs when needed
+        rows = ranked_chat_ids(match, user_id, video_id, limit, offset)
+        if len(rows) < limit:
+            rows = ranked_chat_ids(fulltext_query(search), user_id, video_id, limit, offset)
+        chats = {c.id: c for c in ChatHistory.query.filter(ChatHistory.id.in_([row.id for row in rows])).all()} if rows else {}
+        return [{'id': c.id, 'video_id': c.video_id, 'question': c.question, 'answer': c.answer, 'timestamp': c.timestamp,
+                 'model_used': c.model_used, 'snippet': highlight_snippet(f'{c.question} {c.answer}', search),
+                 'rank': round(row.rank, 4)}
+                for row in rows for c in [chats.get(row.id)] if c is not None]
+    # Fallback without FTS5: unranked substring match
+    pattern = f'%{search}%'
+    chats = ChatHistory.query.filter(ChatHistory.user_id == user_id, db.or_(ChatHistory.question.ilike(pattern), ChatHistory.answer.ilike(pattern)))
+    if video_id:
+        chats = chats.filter(ChatHistory.video_id == video_id)
+    chats = chats.order_by(ChatHistory.timestamp.desc()).limit(limit).offset(offset).all()
+    return [{'id': c.id, 'video_id': c.video_id, 'question': c.question, 'answer': c.answer, 'timestamp': c.timestamp,
+             'model_used': c.model_used, 'snippet': highlight_snippet(f'{c.question} {c.answer}', search), 'rank': None}
+            for c in chats]
+
+def encode_cursor(*values):
+    """Opaque keyset cursor holding the sort key of the last row on a page"""
+    raw = json.dumps([value.isoformat() if isinstance(value, datetime) else value for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, size):
+    """Inverse of encode_cursor; raises ValueError for anything malformed"""
+    values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError('Malformed cursor')
+    return values
+
+def cursor_value(column, value):
+    # SQLite keeps server-default timestamps as text without microseconds, while SQLAlchemy binds
+    # datetimes with them; bind in the stored form so ties on the same second compare equal
+    if isinstance(value, datetime) and not value.microsecond and db.engine.dialect.name == 'sqlite':
+        return db.literal(value.strftime('%Y-%m-%d %H:%M:%S'))
+    return db.literal(value, column.type)
+
+def keyset_filter(columns, values, descending=False):
+    """Rows strictly past the cursor in (columns) order, as one row-value comparison an index can range-scan"""
+    left = db.tuple_(*columns)
+    right = db.tuple_(*[cursor_value(column, value) for column, value in zip(columns, values)])
+    return left < right if descending else left > right
+
 # Get all videos for current user with search and filter
 @app.route('/api/videos', methods=['GET'])
 @login_required
 def get_videos():
     videos = Video.query.filter_by(user_id=current_user.id)
     
-    # Search by video name
+    # Search by video name (ranked full-text match when available)
     search = request.args.get('search', '').strip()
-    if search:
+    ranked = None
+    if search and fulltext_query(search) and fulltext_available():
+        ranked = ranked_video_matches(search)
+        videos = videos.join(ranked, Video.id == ranked.c.video_id)
+    elif search:
         videos = videos.filter(Video.video_name.ilike(f'%{search}%'))
     
     # Filter by video type
@@ -218,18 +888,45 @@ def get_videos():
     elif favorite.lower() == 'false':
         videos = videos.filter_by(is_favorite=False)
     
-    # Sort by favorite status and upload date
-    videos = videos.order_by(Video.is_favorite.desc(), Video.upload_date.desc())
+    # Sort by match quality when searching, otherwise by favorite status and upload date
+    sort_key = (Video.is_favorite, Video.upload_date, Video.id)
+    if ranked is not None:
+        videos = videos.order_by(ranked.c.rank.asc(), Video.upload_date.desc(), Video.id.desc())
+    else:
+        videos = videos.order_by(*[column.desc() for column in sort_key])
     
-    # Pagination
-    page = request.args.get('page', 1, type=int)
+    # Pagination: ?cursor= continues after the last row of the previous page via the index (same cost
+    # at any depth); ?page= still works with OFFSET. The COUNT(*) for totals is skipped with
+    # include_total=false, which is the default in cursor mode.
     per_page = request.args.get('per_page', 10, type=int)
-    per_page = min(per_page, 50)  # Limit max items per page
-    
-    pagination = videos.paginate(page=page, per_page=per_page, error_out=False)
+    per_page = max(1, min(per_page, 50))  # Limit max items per page
+    cursor = request.args.get('cursor', '').strip()
+    include_total = request.args.get('include_total', 'false' if cursor else 'true').lower() != 'false'
+    total = videos.order_by(None).count() if include_total else None
+    if cursor:
+        if ranked is not None:
+            return jsonify({'error': 'Cursor pagination is not available for ranked search, use page'}), 400
+        try:
+            is_favorite, upload_date, last_id = decode_cursor(cursor, 3)
+            values = (bool(is_favorite), datetime.fromisoformat(upload_date), int(last_id))
+        except (ValueError, TypeError):
+            return jsonify({'error': 'Invalid cursor'}), 400
+        videos = videos.filter(keyset_filter(sort_key, values, descending=True))
+        page = None
+    else:
+        page = max(1, request.args.get('page', 1, type=int))
+        videos = videos.offset((page - 1) * per_page)
+    # One extra row tells whether another page follows without counting
+    rows = videos.limit(per_page + 1).all()
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+    next_cursor = None
+    if has_next and ranked is None:
+        last = rows[-1]
+        next_cursor = encode_cursor(bool(last.is_favorite), last.upload_date, last.id)
     
     video_list = []
-    for video in pagination.items:
+    for video in rows:
         video_data = {
             'id': video.id,
             'video_name': video.video_name,
@@ -240,6 +937,8 @@ def get_videos():
             'duration': video.duration,
             'thumbnail_path': video.thumbnail_path,
             'is_processed': video.is_processed,
+            'processing_error': video.processing_error,
+            'index_status': video.index_status,
             'is_favorite': video.is_favorite
         }
         video_list.append(video_data)
@@ -249,17 +948,67 @@ def get_videos():
         'pagination': {
             'page': page,
             'per_page': per_page,
-            'total': pagination.total,
-            'pages': pagination.pages,
-            'has_next': pagination.has_next,
-            'has_prev': pagination.has_prev
+            'total': total,
+            'pages': -(-total // per_page) if total is not None else None,
+            'has_next': has_next,
+            # A cursor always comes from an earlier page; a first page is requested without one
+            'has_prev': bool(cursor) if page is None else page > 1,
+            'next_cursor': next_cursor
         }
     })
 
-# Serve uploaded video files
+# Serve a video's thumbnail
+@app.route('/api/video/<int:video_id>/thumbnail')
+@login_required
+def get_video_thumbnail(video_id):
+    video = Video.query.filter_by(id=video_id, user_id=current_user.id).first()
+    if not video or not video.thumbnail_path:
+        return jsonify({'error': 'Thumbnail not found'}), 404
+    return send_from_directory(THUMBNAIL_FOLDER, os.path.basename(video.thumbnail_path), max_age=86400)
+
+def video_file_signature(filename, expires):
+    message = f'{filename}:{expires}'.encode('utf-8')
+    return hmac.new(app.config['SECRET_KEY'].encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+def sign_video_url(url, ttl=None):
+    """Append an expiring signature to a /api/video_file/ URL so it can be fetched without a session"""
+    if not url or '/api/video_file/' not in url:
+        return url
+    filename = url.rsplit('/', 1)[-1].split('?', 1)[0]
+    expires = int(time.time()) + (ttl or VIDEO_URL_TTL)
+    return f"{url.split('?', 1)[0]}?expires={expires}&sig={video_file_signature(filename, expires)}"
+
+def has_valid_video_signature(filename):
+    expires = request.args.get('expires', type=int)
+    sig = request.args.get('sig', '')
+    if not expires or not sig or expires < time.time():
+        return False
+    return hmac.compare_digest(sig, video_file_signature(filename, expires))
+
+# Serve uploaded video files (Range/206, ETag from the content hash, signed URLs)
 @app.route('/api/video_file/<filename>')
 def get_video_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    filename = secure_filename(filename)
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    video = Video.query.filter_by(file_path_or_url=filepath).first()
+    signed = has_valid_video_signature(filename)
+    owner = current_user.is_authenticated and video is not None and video.user_id == current_user.id
+    if not (PUBLIC_VIDEO_FILES or signed or owner):
+        return jsonify({'error': 'Video not found or link expired'}), 404
+
+    # conditional=True answers If-None-Match/If-Modified-Since with 304 and Range with 206;
+    # full responses go through the server's wsgi.file_wrapper (sendfile under gunicorn)
+    response = send_from_directory(
+        app.config['UPLOAD_FOLDER'],
+        filename,
+        conditional=True,
+        etag=video.content_hash if video is not None and video.content_hash else True,
+        max_age=VIDEO_FILE_MAX_AGE
+    )
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
 
 # Save a chat/question for a video
 @app.route('/api/chat', methods=['POST'])
@@ -293,7 +1042,31 @@ def get_chat_history(video_id):
     video = Video.query.filter_by(id=video_id, user_id=current_user.id).first()
     if not video:
         return jsonify({'error': 'Video not found or not owned by user'}), 404
-    chats = ChatHistory.query.filter_by(video_id=video_id, user_id=current_user.id).order_by(ChatHistory.timestamp.asc()).all()
+    search = request.args.get('search', '').strip()
+    if search:
+        # Ranked matches within this video's chats
+        matches = search_chats(current_user.id, search, video_id=video_id, limit=min(request.args.get('limit', 50, type=int), 200))
+        return jsonify({'chats': matches}), 200
+    chats = ChatHistory.query.filter_by(video_id=video_id, user_id=current_user.id).order_by(ChatHistory.timestamp.asc(), ChatHistory.id.asc())
+    # Optional keyset paging: ?limit= returns one page, ?cursor= continues after its last chat
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor', '').strip()
+    if cursor:
+        try:
+            timestamp, last_id = decode_cursor(cursor, 2)
+            values = (datetime.fromisoformat(timestamp), int(last_id))
+        except (ValueError, TypeError):
+            return jsonify({'error': 'Invalid cursor'}), 400
+        chats = chats.filter(keyset_filter((ChatHistory.timestamp, ChatHistory.id), values))
+    next_cursor = None
+    if limit or cursor:
+        limit = max(1, min(limit or 50, 200))
+        chats = chats.limit(limit + 1).all()
+        if len(chats) > limit:
+            chats = chats[:limit]
+            next_cursor = encode_cursor(chats[-1].timestamp, chats[-1].id)
+    else:
+        chats = chats.all()
     chat_list = [
         {
             'id': c.id,
@@ -303,7 +1076,22 @@ def get_chat_history(video_id):
             'model_used': c.model_used
         } for c in chats
     ]
-    return jsonify({'chats': chat_list}), 200
+    return jsonify({'chats': chat_list, 'next_cursor': next_cursor}), 200
+
+# Search questions and answers across all of the user's videos
+@app.route('/api/chat_history/search', methods=['GET'])
+@login_required
+def search_chat_history():
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Search query is required'}), 400
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    offset = max(0, request.args.get('offset', 0, type=int))
+    matches = search_chats(current_user.id, query, limit=limit, offset=offset)
+    names = dict(db.session.query(Video.id, Video.video_name).filter(Video.id.in_({m['video_id'] for m in matches})).all()) if matches else {}
+    for match in matches:
+        match['video_name'] = names.get(match['video_id'])
+    return jsonify({'query': query, 'chats': matches}), 200
 
 # Delete a specific chat Q&A pair
 @app.route('/api/chat/<int:chat_id>', methods=['DELETE'])
@@ -323,8 +1111,17 @@ def delete_video(video_id):
     video = Video.query.filter_by(id=video_id, user_id=current_user.id).first()
     if not video:
         return jsonify({'error': 'Video not found or not owned by user'}), 404
+    # Rows pointing at the video go first; jobs before the chat rows they reference
+    embeddings = delete_embeddings(video_id=video.id)
+    for model in (AnalysisJob, ChatHistory, VideoSegment, UploadSession):
+        model.query.filter_by(video_id=video.id).delete(synchronize_session=False)
+    content_hash = video.content_hash
     db.session.delete(video)
     db.session.commit()
+    drop_from_vector_index(embeddings)
+    # Keyframes and segment frames are stored per content hash, so keep them while another video has the same file
+    if content_hash and not Video.query.filter_by(content_hash=content_hash).first():
+        shutil.rmtree(os.path.join(FRAMES_FOLDER, content_hash), ignore_errors=True)
     return jsonify({'message': 'Video deleted successfully'}), 200
 
 # Rename a video
@@ -340,6 +1137,7 @@ def rename_video(video_id):
         return jsonify({'error': 'Video not found or not owned by user'}), 404
     video.video_name = new_name
     db.session.commit()
+    invalidate_name_index(current_user.id)
     return jsonify({'message': 'Video name updated successfully'}), 200
 
 # Toggle favorite status for a video
@@ -410,80 +1208,1290 @@ def change_password():
     
     return jsonify({'message': 'Password changed successfully'}), 200
 
-# Analyze video endpoint
-@app.route('/api/analyze_video', methods=['POST'])
+ANALYSIS_SYSTEM_PROMPT = "You are Qwen-VL, an expert video analysis assistant. Answer concisely and factually based on the provided video."
+STREAM_SYSTEM_PROMPT = "You are Qwen-VL monitoring a CCTV camera. Describe notable events, people, vehicles and activities in these frames in chronological order. Reply 'No notable activity.' if nothing happens."
+TIMELINE_SYSTEM_PROMPT = "You are Qwen-VL, an expert video analysis assistant. You are given a timestamped timeline of captions for a video, and frames from the segments most relevant to the question. Answer concisely and factually, citing timestamps where useful. If the timeline and frames do not show the answer, say so."
+
+def build_video_url(video, base_url=None):
+    """Build a URL the model provider can fetch the video from"""
+    if video.video_type == 'upload' and video.file_path_or_url:
+        filename = os.path.basename(video.file_path_or_url)
+        base_url = base_url or os.environ.get('APP_BASE_URL', 'http://localhost:5000')
+        return f"{base_url}/api/video_file/{filename}"
+    return video.file_path_or_url
+
+def parse_sampling(value):
+    """Validate a requested sampling strategy, falling back to the configured default"""
+    sampling = (value or FRAME_SAMPLING_STRATEGY).lower()
+    if sampling != 'none' and sampling not in SAMPLING_STRATEGIES:
+        raise ValueError(f"Invalid sampling strategy. Use one of: none, {', '.join(SAMPLING_STRATEGIES)}")
+    return sampling
+
+def parse_motion_sensitivity(value):
+    """Validate a motion gate sensitivity; None (or an empty value) disables the gate"""
+    if value is None or value == '':
+        return None
+    try:
+        sensitivity = float(value)
+    except (TypeError, ValueError):
+        raise ValueError('motion_sensitivity must be a number between 0 and 1')
+    if not 0 <= sensitivity <= 1:
+        raise ValueError('motion_sensitivity must be a number between 0 and 1')
+    return sensitivity
+
+def frames_variant(sampling, max_frames):
+    """Identify which frames a request sends, for frame and answer cache keys"""
+    gate = f'm{MOTION_SENSITIVITY:g}' if MOTION_SENSITIVITY is not None else 'all'
+    return f'{sampling}:{max_frames}:{gate}'
+
+def prepare_video_frames(video, sampling, max_frames):
+    """Return cached keyframes for an uploaded video, or None to send the full video URL"""
+    if sampling == 'none' or video.video_type != 'upload' or not video.file_path_or_url:
+        return None
+    if not os.path.exists(video.file_path_or_url):
+        return None
+    output_dir = os.path.join(FRAMES_FOLDER, get_video_content_hash(video), frames_variant(sampling, max_frames).replace(':', '_'))
+    stats = {}
+    try:
+        with span('frames'):
+            frames = extract_keyframes(video.file_path_or_url, output_dir, strategy=sampling, max_frames=max_frames,
+                                       motion_sensitivity=MOTION_SENSITIVITY, stats=stats)
+        if stats:
+            count_motion_gate_event('frames_considered', stats['frames_considered'])
+            count_motion_gate_event('frames_skipped', stats['frames_idle'])
+        return frames or None
+    except Exception as e:
+        print(f"Keyframe extraction failed for video {video.id}, sending full video: {str(e)}")  # Debug logging
+        return None
+
+def frame_content_parts(frames):
+    """Inline JPEG keyframes (files or in-memory bytes) as image parts, preceded by their timestamps"""
+    timestamps = ', '.join(f"{frame['timestamp']}s" for frame in frames)
+    parts = [{"type": "text", "text": f"The following {len(frames)} frames were sampled from the video at: {timestamps}."}]
+    for frame in frames:
+        if 'jpeg' in frame:
+            data = frame['jpeg']
+        else:
+            with span('file_io'), open(frame['path'], 'rb') as f:
+                data = f.read()
+        encoded = base64.b64encode(data).decode()
+        parts.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{encoded}"}})
+    return parts
+
+def run_qwen_analysis(video_url, question, system_prompt=ANALYSIS_SYSTEM_PROMPT, tier=TIER_FAST, frames=None, stream=False, route=None):
+    """Send a question about a video (or its sampled keyframes) to a Qwen-VL model of `tier` and return the answer text.
+
+    With stream=True, returns a generator yielding the answer in pieces as the model produces them.
+    `route` (a dict) receives the model that answered; see ModelRouter.
+    """
+    if frames:
+        video_parts = frame_content_parts(frames)
+    elif video_url:
+        video_parts = [{"type": "video_url", "video_url": {"url": sign_video_url(video_url)}}]
+    else:
+        video_parts = []  # Text-only question, e.g. answered from the timeline index
+
+    # Compose request to Qwen-VL (OpenAI-compatible schema)
+    messages = [
+        {
+            "role": "system",
+            "content": [
+                {"type": "text", "text": system_prompt}
+            ],
+        },
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": question},
+            ] + video_parts,
+        },
+    ]
+
+    # Shared pooled client (DASHSCOPE_BASE_URL can point it at a local stub); the router picks the model
+    client = get_model_client()
+
+    def request_options(model, timeout):
+        options = {'model': model, 'messages': messages, 'temperature': 0.2}
+        remaining = deadline_remaining()
+        if remaining is not None:
+            # The answer must arrive before the work's deadline (e.g. Twilio's webhook timeout)
+            if remaining <= 0:
+                raise DeadlineExceeded('Deadline passed before the model answered')
+            timeout = min(timeout or remaining, remaining)
+        if timeout:
+            # A fallback model is next in line, or no time for a retry is left, so don't retry this one
+            options.update(timeout=timeout, retries=0)
+        return options
+
+    if stream:
+        return get_model_router().stream(tier, lambda model, timeout: client.stream_chat_completion(**request_options(model, timeout)), route)
+
+    def complete(model, timeout):
+        completion = client.chat_completion(**request_options(model, timeout))
+        return completion.choices[0].message.content if completion and completion.choices else "No answer generated."
+
+    return get_model_router().complete(tier, complete, route)
+
+# Answer cache hit/miss counters (per process)
+answer_cache_stats = {'hits': 0, 'misses': 0, 'bypassed': 0, 'stores': 0, 'evictions': 0, 'coalesced': 0}
+answer_cache_lock = threading.Lock()
+
+def count_cache_event(name, amount=1):
+    with answer_cache_lock:
+        answer_cache_stats[name] += amount
+
+# Motion gate counters for uploaded-video keyframe extraction (per process)
+motion_gate_stats = {'frames_considered': 0, 'frames_skipped': 0, 'segments_skipped': 0}
+motion_gate_lock = threading.Lock()
+
+def count_motion_gate_event(name, amount=1):
+    with motion_gate_lock:
+        motion_gate_stats[name] += amount
+
+def get_video_content_hash(video):
+    """Return (and remember) the SHA-256 of the video file, or of its URL for remote videos"""
+    if video.content_hash:
+        return video.content_hash
+    if video.video_type == 'upload' and video.file_path_or_url and os.path.exists(video.file_path_or_url):
+        with span('file_io'):
+            video.content_hash = hash_file(video.file_path_or_url)
+    else:
+        video.content_hash = hashlib.sha256((video.file_path_or_url or '').encode('utf-8')).hexdigest()
+    db.session.commit()
+    return video.content_hash
+
+def normalize_question(question):
+    """Lowercase, collapse whitespace and drop trailing punctuation so equivalent questions share a key"""
+    return re.sub(r'\s+', ' ', question).strip().lower().rstrip('?!. ')
+
+def answer_cache_key(video, question, tier, system_prompt, variant=''):
+    parts = [get_video_content_hash(video), normalize_question(question), tier, system_prompt, variant]
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+def get_cached_answer(key):
+    """Return a cached answer for the key, or None when missing or expired"""
+    entry = db.session.get(AnswerCache, key)
+    now = datetime.utcnow()
+    if entry and entry.created_at < now - timedelta(seconds=ANSWER_CACHE_TTL):
+        db.session.delete(entry)
+        db.session.commit()
+        entry = None
+    if not entry:
+        count_cache_event('misses')
+        return None
+    entry.hit_count += 1
+    entry.last_accessed_at = now
+    db.session.commit()
+    count_cache_event('hits')
+    return entry
+
+def store_cached_answer(key, answer, model, from_index=None):
+    """Store an answer and evict the least recently used entries beyond the size limit"""
+    now = datetime.utcnow()
+    entry = db.session.get(AnswerCache, key)
+    if entry:
+        entry.answer = answer
+        entry.model_used = model
+        entry.answered_from_index = from_index
+        entry.created_at = now
+        entry.last_accessed_at = now
+    else:
+        db.session.add(AnswerCache(key=key, answer=answer, model_used=model, answered_from_index=from_index,
+                                   created_at=now, last_accessed_at=now))
+    db.session.flush()
+    count_cache_event('stores')
+
+    overflow = AnswerCache.query.count() - ANSWER_CACHE_MAX_ENTRIES
+    if overflow > 0:
+        stale = db.session.query(AnswerCache.key).order_by(AnswerCache.last_accessed_at.asc()).limit(overflow).subquery()
+        evicted = AnswerCache.query.filter(AnswerCache.key.in_(db.select(stale.c.key))).delete(synchronize_session=False)
+        count_cache_event('evictions', evicted)
+
+# In-flight analysis calls in this process, by answer cache key
+analysis_flights = SingleFlight()
+
+def analysis_lock_owner():
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+def acquire_analysis_lock(key, owner):
+    """Take the cross-process lock for an answer cache key, or an expired one left by a dead process"""
+    db.session.commit()
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=ANALYSIS_LOCK_SECONDS)
+    try:
+        db.session.add(AnalysisLock(key=key, owner=owner, expires_at=expires_at))
+        db.session.commit()
+        return True
+    except IntegrityError:
+        db.session.rollback()
+    taken = AnalysisLock.query.filter(AnalysisLock.key == key, AnalysisLock.expires_at < now).update(
+        {'owner': owner, 'expires_at': expires_at}, synchronize_session=False)
+    db.session.commit()
+    return bool(taken)
+
+def release_analysis_lock(key, owner):
+    AnalysisLock.query.filter_by(key=key, owner=owner).delete(synchronize_session=False)
+    db.session.commit()
+
+def count_coalesced(scope):
+    COALESCED_REQUESTS.labels(scope).inc()
+    count_cache_event('coalesced')
+
+def answer_cached_since(key, since):
+    """(answer, model_used, answered_from_index) cached for `key` at or after `since`, or None"""
+    row = db.session.query(AnswerCache.answer, AnswerCache.model_used, AnswerCache.answered_from_index).filter(
+        AnswerCache.key == key, AnswerCache.created_at >= since).first()
+    return (row.answer, row.model_used, row.answered_from_index) if row else None
+
+def wait_for_analysis(key, since):
+    """Wait while another process holds the lock for `key`; returns the (answer, model_used, answered_from_index) it cached after `since`, or None"""
+    deadline = time.monotonic() + ANALYSIS_LOCK_SECONDS
+    while time.monotonic() < deadline:
+        held = db.session.query(AnalysisLock.key).filter(AnalysisLock.key == key, AnalysisLock.expires_at >= datetime.utcnow()).first()
+        if not held:
+            break
+        time.sleep(ANALYSIS_LOCK_POLL)
+    return answer_cached_since(key, since)
+
+def answer_once_across_processes(key, compute, since=None):
+    """Compute and cache the answer for `key` unless another process is already doing so.
+
+    Answers another process cached after `since` (default: now) are reused. Returns
+    (answer, model_used, answered_from_index, shared). When the other process fails, this one takes over.
+    """
+    owner = analysis_lock_owner()
+    since = since or datetime.utcnow()
+    while True:
+        if acquire_analysis_lock(key, owner):
+            try:
+                # Another process may have finished between our last look and taking the lock
+                cached = answer_cached_since(key, since)
+                if cached is not None:
+                    count_coalesced('process')
+                    return cached + (True,)
+                answer, model_used, from_index = compute()
+                store_cached_answer(key, answer, model_used, from_index)
+                db.session.commit()
+                return answer, model_used, from_index, False
+            except Exception:
+                db.session.rollback()
+                raise
+            finally:
+                release_analysis_lock(key, owner)
+        result = wait_for_analysis(key, since)
+        if result is not None:
+            count_coalesced('process')
+            return result + (True,)
+
+def coalesced_answer(key, compute):
+    """Run compute() -> (answer, model_used, answered_from_index) once for concurrent identical requests
+    (same answer cache key) across threads and server processes, and store its answer in the answer cache.
+
+    Returns (answer, model_used, answered_from_index, shared)."""
+    since = datetime.utcnow()
+    try:
+        (answer, model_used, from_index, shared_remotely), shared = analysis_flights.do(key, lambda: answer_once_across_processes(key, compute, since))
+    except DeadlineExceeded:
+        if current_work()[2] is not None:
+            raise
+        # A WhatsApp request we were sharing gave up at its deadline; this one has none, so answer it ourselves
+        return coalesced_answer(key, compute)
+    if shared:
+        count_coalesced('thread')
+    return answer, model_used, from_index, shared or shared_remotely
+
+def save_chat_answer(video_id, user_id, question, answer, model_used):
+    chat = ChatHistory(
+        video_id=video_id,
+        user_id=user_id,
+        question=question,
+        answer=answer,
+        model_used=model_used
+    )
+    db.session.add(chat)
+    db.session.flush()
+    return chat
+
+# Background worker pool for analysis jobs
+analysis_executor = ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS, thread_name_prefix='analysis')
+
+def stale_work_cutoff():
+    return datetime.utcnow() - timedelta(seconds=STALE_WORK_SECONDS)
+
+@traced_job('analysis', SLOW_JOB_SECONDS)
+def run_analysis_job(job_id):
+    """Run a queued analysis job and store the answer in ChatHistory"""
+    with app.app_context():
+        # Claim the job atomically so only one server process runs it
+        claimed = AnalysisJob.query.filter(AnalysisJob.id == job_id, db.or_(
+            AnalysisJob.status == 'queued',
+            db.and_(AnalysisJob.status == 'running', AnalysisJob.started_at < stale_work_cutoff())
+        )).update({'status': 'running', 'started_at': datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
+        if not claimed:
+            return
+        job = db.session.get(AnalysisJob, job_id)
+
+        try:
+            video = db.session.get(Video, job.video_id)
+            tier = job.model_tier or choose_tier(job.question)[0]
+
+            def compute():
+                route = {}
+                with scheduled(INTERACTIVE, job.user_id):
+                    answer, from_index = answer_question(
+                        video, job.question, job.video_url, tier, job.sampling or 'none',
+                        job.max_frames or MAX_FRAMES_PER_REQUEST, use_index=job.use_index, route=route
+                    )
+                return answer, route['model'], from_index
+
+            if job.cache_key:
+                # Share the answer with identical requests already in flight
+                answer, model_used, from_index, _ = coalesced_answer(job.cache_key, compute)
+            else:
+                answer, model_used, from_index = compute()
+            job = db.session.get(AnalysisJob, job_id)
+            job.answered_from_index = bool(from_index)
+            chat = save_chat_answer(job.video_id, job.user_id, job.question, answer, model_used)
+            job.answer = answer
+            job.model_used = model_used
+            job.chat_id = chat.id
+            job.status = 'completed'
+        except Exception as e:
+            print(f"Error in analysis job {job_id}: {str(e)}")  # Debug logging
+            import traceback
+            traceback.print_exc()  # Print full stack trace
+            db.session.rollback()
+            job = db.session.get(AnalysisJob, job_id)
+            job.error = f'AI analysis failed: {str(e)}'
+            job.status = 'failed'
+        job.completed_at = datetime.utcnow()
+        db.session.commit()
+        if job.status == 'completed':
+            schedule_embedding_sync(job.user_id)
+
+def submit_analysis_job(job_id):
+    return analysis_executor.submit(run_analysis_job, job_id)
+
+def resume_pending_jobs():
+    """Submit queued jobs and jobs whose process died mid-run; safe to call from every server process"""
+    jobs = AnalysisJob.query.filter(db.or_(
+        AnalysisJob.status == 'queued',
+        db.and_(AnalysisJob.status == 'running', AnalysisJob.started_at < stale_work_cutoff())
+    )).order_by(AnalysisJob.created_at.asc()).all()
+    for job in jobs:
+        submit_analysis_job(job.id)
+    if jobs:
+        print(f"Resumed {len(jobs)} pending analysis job(s)")
+
+# Background worker pool for post-upload ingestion
+ingestion_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix='ingest')
+
+@traced_job('ingestion', SLOW_JOB_SECONDS)
+def run_ingestion(video_id):
+    """Probe an uploaded video, generate its thumbnail and hash, then mark it processed"""
+    with app.app_context():
+        claimed = Video.query.filter(
+            Video.id == video_id, Video.video_type == 'upload', Video.is_processed.is_(False),
+            db.or_(Video.ingest_started_at.is_(None), Video.ingest_started_at < stale_work_cutoff())
+        ).update({'ingest_started_at': datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
+        if not claimed:
+            return
+        video = db.session.get(Video, video_id)
+        try:
+            path = video.file_path_or_url
+            video.file_size = os.path.getsize(path)
+            video.duration = probe_video(path)['duration']
+            thumbnail_path = os.path.join(THUMBNAIL_FOLDER, f'{video.id}.jpg')
+            if make_thumbnail(path, thumbnail_path):
+                video.thumbnail_path = thumbnail_path
+            get_video_content_hash(video)
+            # Warm the keyframe cache for the default sampling strategy
+            prepare_video_frames(video, FRAME_SAMPLING_STRATEGY, MAX_FRAMES_PER_REQUEST)
+            video.processing_error = None
+            video.is_processed = True
+            if AUTO_INDEX_VIDEOS and os.environ.get('DASHSCOPE_API_KEY'):
+                video.index_status = 'queued'
+        except Exception as e:
+            print(f"Ingestion failed for video {video_id}: {str(e)}")  # Debug logging
+            db.session.rollback()
+            video = db.session.get(Video, video_id)
+            video.processing_error = str(e)[:256]
+        db.session.commit()
+        if video.index_status == 'queued':
+            submit_indexing(video_id)
+
+def submit_ingestion(video_id):
+    return ingestion_executor.submit(run_ingestion, video_id)
+
+def resume_pending_ingestion():
+    """Requeue uploads that were never processed or indexed, e.g. after a restart"""
+    cutoff = stale_work_cutoff()
+    videos = Video.query.filter(
+        Video.video_type == 'upload', Video.is_processed.is_(False), Video.processing_error.is_(None),
+        db.or_(Video.ingest_started_at.is_(None), Video.ingest_started_at < cutoff)
+    ).all()
+    for video in videos:
+        submit_ingestion(video.id)
+    if videos:
+        print(f"Resumed ingestion for {len(videos)} video(s)")
+    indexing = Video.query.filter(Video.is_processed.is_(True), db.or_(
+        Video.index_status == 'queued',
+        db.and_(Video.index_status == 'indexing', db.or_(Video.index_started_at.is_(None), Video.index_started_at < cutoff))
+    )).all()
+    for video in indexing:
+        submit_indexing(video.id)
+    if indexing:
+        print(f"Resumed indexing for {len(indexing)} video(s)")
+
+# Background worker pool for timeline indexing (kept apart so long videos don't hold up ingestion)
+indexing_executor = ThreadPoolExecutor(max_workers=INDEX_WORKERS, thread_name_prefix='index')
+
+def format_timestamp(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    return f'{minutes:02d}:{seconds:02d}'
+
+@traced_job('indexing', SLOW_JOB_SECONDS)
+def run_video_indexing(video_id, tier=TIER_FAST):
+    """Caption each segment of an uploaded video once and store the captions as its timeline index"""
+    with app.app_context():
+        claimed = Video.query.filter(Video.id == video_id, Video.video_type == 'upload', db.or_(
+            Video.index_status == 'queued',
+            db.and_(Video.index_status == 'indexing', db.or_(Video.index_started_at.is_(None), Video.index_started_at < stale_work_cutoff()))
+        )).update({'index_status': 'indexing', 'index_started_at': datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
+        video = db.session.get(Video, video_id)
+        if not claimed or not video.file_path_or_url:
+            return
+        replaced = []
+        try:
+            output_dir = os.path.join(FRAMES_FOLDER, get_video_content_hash(video), f'segments_{SEGMENT_SECONDS:g}_{FRAMES_PER_SEGMENT}')
+            with span('frames'):
+                segments = extract_segments(video.file_path_or_url, output_dir, SEGMENT_SECONDS, FRAMES_PER_SEGMENT,
+                                            motion_sensitivity=MOTION_SENSITIVITY)
+            rows = []
+            for segment in segments:
+                route = {}
+                if segment['frames']:
+                    question = f"Describe what happens between {format_timestamp(segment['start'])} and {format_timestamp(segment['end'])}."
+                    with scheduled(BACKGROUND, video.user_id):
+                        caption = run_qwen_analysis(None, question, system_prompt=STREAM_SYSTEM_PROMPT, tier=tier, frames=segment['frames'], route=route)
+                else:
+                    # The motion gate saw nothing happen, so skip the model call
+                    caption = 'No notable activity.'
+                    count_motion_gate_event('segments_skipped')
+                rows.append(VideoSegment(
+                    video_id=video.id,
+                    segment_index=segment['index'],
+                    start_time=segment['start'],
+                    end_time=segment['end'],
+                    caption=caption,
+                    has_activity=segment['active'],
+                    frames=json.dumps(segment['frames']),
+                    model_used=route.get('model')
+                ))
+            VideoSegment.query.filter_by(video_id=video.id).delete()
+            replaced = delete_embeddings(video_id=video.id, kind='segment')
+            db.session.add_all(rows)
+            video.index_status = 'indexed'
+            video.indexed_at = datetime.utcnow()
+        except Exception as e:
+            print(f"Indexing failed for video {video_id}: {str(e)}")  # Debug logging
+            db.session.rollback()
+            video = db.session.get(Video, video_id)
+            video.index_status = 'failed'
+        db.session.commit()
+        if video.index_status == 'indexed':
+            drop_from_vector_index(replaced)
+            schedule_embedding_sync(video.user_id)
+
+def submit_indexing(video_id):
+    return indexing_executor.submit(run_video_indexing, video_id)
+
+# Words that frame a question about footage rather than describe what happened in it
+QUESTION_WORDS = {'when', 'where', 'why', 'which', 'about', 'video', 'footage', 'happen', 'show', 'see', 'seen', 'can', 'you', 'they'}
+
+def caption_terms(text):
+    """Content words for matching questions to captions, tokenized like the embedding index"""
+    return set(tokenize(text)) - QUESTION_WORDS
+
+def select_relevant_segments(segments, question, limit=INDEX_SEGMENTS_PER_QUESTION):
+    """Pick the segments whose captions (or time span, for mm:ss mentions) match the question"""
+    mentioned = [int(m) * 60 + int(s) for m, s in re.findall(r'\b(\d{1,3}):(\d{2})\b', question)]
+    terms = caption_terms(question)
+    scored = []
+    for segment in segments:
+        score = len(terms & caption_terms(segment.caption)) if segment.has_activity else 0
+        if any(segment.start_time <= t < segment.end_time for t in mentioned):
+            score += len(terms) + 1
+        if score:
+            scored.append((score, segment))
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return sorted((segment for _, segment in scored[:limit]), key=lambda segment: segment.start_time)
+
+def answer_from_index(video, question, tier, max_frames, system_prompt=TIMELINE_SYSTEM_PROMPT, stream=False, route=None):
+    """Answer from the stored captions, sending keyframes only for the most relevant segments"""
+    segments = video.segments
+    relevant = select_relevant_segments(segments, question)
+    frames = [frame for segment in relevant for frame in json.loads(segment.frames or '[]') if os.path.exists(frame['path'])]
+    timeline = '\n'.join(f"[{format_timestamp(s.start_time)}-{format_timestamp(s.end_time)}] {s.caption}" for s in segments)
+    prompt = f"Timeline of the video:\n{timeline}\n\nQuestion: {question}"
+    return run_qwen_analysis(None, prompt, system_prompt=system_prompt, tier=tier, frames=frames[:max_frames] or None, stream=stream, route=route)
+
+def has_timeline_index(video):
+    return video.index_status == 'indexed' and video.indexed_at is not None
+
+def answer_variant(video, sampling, max_frames, use_index=True):
+    """Answer cache variant: the index version when the index will be used, else the frames sent"""
+    if use_index and has_timeline_index(video):
+        return f'index:{video.indexed_at.isoformat()}'
+    return frames_variant(sampling, max_frames)
+
+# Semantic search: chat answers and segment captions are embedded once (rows in Embedding)
+# and searched from an in-process index that picks up new rows incrementally
+embedding_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='embed')
+embedding_lock = threading.Lock()
+vector_index_lock = threading.Lock()
+vector_index_state = {'index': None, 'loaded_at': None, 'loaded_ids': set(), 'embedder': None}
+
+def get_embedder():
+    if vector_index_state['embedder'] is None:
+        if EMBEDDING_MODEL == 'local':
+            vector_index_state['embedder'] = HashingEmbedder(EMBEDDING_DIM)
+        else:
+            vector_index_state['embedder'] = ModelEmbedder(get_model_client(), EMBEDDING_MODEL, EMBEDDING_DIM)
+    return vector_index_state['embedder']
+
+def sync_embeddings(user_id=None, batch_size=256):
+    """Embed chats and captioned segments that have no embedding for the current model yet"""
+    embedder = get_embedder()
+    added = 0
+    with embedding_lock:
+        while True:
+            chats = ChatHistory.query.outerjoin(Embedding, db.and_(
+                Embedding.kind == 'chat', Embedding.ref_id == ChatHistory.id, Embedding.model == embedder.name
+            )).filter(Embedding.id.is_(None), ChatHistory.answer.isnot(None))
+            segments = VideoSegment.query.join(Video).outerjoin(Embedding, db.and_(
+                Embedding.kind == 'segment', Embedding.ref_id == VideoSegment.id, Embedding.model == embedder.name
+            )).filter(Embedding.id.is_(None), VideoSegment.has_activity.is_(True))
+            if user_id is not None:
+                chats = chats.filter(ChatHistory.user_id == user_id)
+                segments = segments.filter(Video.user_id == user_id)
+            chats = chats.limit(batch_size).all()
+            segments = segments.limit(batch_size).all()
+            if not chats and not segments:
+                return added
+            vectors = embedder.embed([f"{c.question}\n{c.answer}" for c in chats] + [s.caption or '' for s in segments])
+            rows = [Embedding(user_id=c.user_id, video_id=c.video_id, kind='chat', ref_id=c.id, model=embedder.name,
+                              vector=vector.tobytes()) for c, vector in zip(chats, vectors)]
+            rows += [Embedding(user_id=s.video.user_id, video_id=s.video_id, kind='segment', ref_id=s.id, model=embedder.name,
+                               start_time=s.start_time, end_time=s.end_time, vector=vector.tobytes())
+                     for s, vector in zip(segments, vectors[len(chats):])]
+            db.session.add_all(rows)
+            try:
+                db.session.flush()
+                # Chats and segments deleted (e.g. with their video) while they were being embedded lose their rows again
+                kept = {('chat', ref_id) for (ref_id,) in db.session.query(ChatHistory.id).filter(ChatHistory.id.in_([c.id for c in chats]))}
+                kept |= {('segment', ref_id) for (ref_id,) in db.session.query(VideoSegment.id).filter(VideoSegment.id.in_([s.id for s in segments]))}
+                orphans = [row for row in rows if (row.kind, row.ref_id) not in kept]
+                for row in orphans:
+                    db.session.delete(row)
+                db.session.commit()
+            except Exception:
+                # Another process embedded the same rows first
+                db.session.rollback()
+                return added
+            added += len(rows) - len(orphans)
+
+def refresh_vector_index():
+    """Load embeddings added since the last refresh (by any process) into the in-memory index.
+
+    Ids are not committed in order (concurrent transactions, Postgres sequences), so rows are
+    found by creation time, re-reading EMBEDDING_REFRESH_OVERLAP seconds and skipping loaded ids.
+    """
+    embedder = get_embedder()
+    with vector_index_lock:
+        if vector_index_state['index'] is None:
+            vector_index_state['index'] = VectorIndex(embedder.dim)
+        started = datetime.utcnow()
+        recent = db.session.query(Embedding.id).filter(Embedding.model == embedder.name)
+        if vector_index_state['loaded_at'] is not None:
+            recent = recent.filter(Embedding.created_at >= vector_index_state['loaded_at'] - timedelta(seconds=EMBEDDING_REFRESH_OVERLAP))
+        new_ids = [row.id for row in recent if row.id not in vector_index_state['loaded_ids']]
+        by_user = {}
+        for start in range(0, len(new_ids), 500):
+            for row in db.session.query(Embedding.id, Embedding.user_id, Embedding.vector).filter(Embedding.id.in_(new_ids[start:start + 500])):
+                by_user.setdefault(row.user_id, []).append(row)
+        for owner, owner_rows in by_user.items():
+            vectors = np.stack([np.frombuffer(row.vector, dtype=np.float32) for row in owner_rows])
+            vector_index_state['index'].add(owner, [row.id for row in owner_rows], vectors)
+            vector_index_state['loaded_ids'].update(row.id for row in owner_rows)
+        vector_index_state['loaded_at'] = started
+    return vector_index_state['index']
+
+def delete_embeddings(**filters):
+    """Delete embedding rows (e.g. for a deleted video or replaced segments); returns them for drop_from_vector_index"""
+    rows = db.session.query(Embedding.id, Embedding.user_id).filter_by(**filters).all()
+    if rows:
+        Embedding.query.filter(Embedding.id.in_([row.id for row in rows])).delete(synchronize_session=False)
+    return rows
+
+def drop_from_vector_index(rows):
+    """Remove deleted embedding rows from the in-memory index, once their deletion is committed"""
+    with vector_index_lock:
+        for row in rows:
+            vector_index_state['loaded_ids'].discard(row.id)
+            if vector_index_state['index'] is not None:
+                vector_index_state['index'].remove(row.user_id, [row.id])
+
+@traced_job('embedding', SLOW_JOB_SECONDS)
+def run_embedding_sync(user_id=None):
+    with app.app_context():
+        try:
+            with scheduled(BACKGROUND, user_id):
+                sync_embeddings(user_id)
+            refresh_vector_index()
+        except Exception as e:
+            print(f"Embedding sync failed: {str(e)}")  # Debug logging
+            db.session.rollback()
+
+def schedule_embedding_sync(user_id=None):
+    return embedding_executor.submit(run_embedding_sync, user_id)
+
+def search_footage(user_id, query, limit=10, video_id=None, kind=None):
+    """Rank a user's chat answers and segment captions by semantic similarity to the query.
+
+    Only rows already embedded are searched; new chats and captions are embedded in the background
+    (schedule_embedding_sync), so no embedding work for them happens here.
+    """
+    index = refresh_vector_index()
+    vector = get_embedder().embed([query])[0]
+    # Over-fetch so filters and rows deleted by other processes don't starve the result list
+    hits = index.search(user_id, vector, k=limit * 4 if not (video_id or kind) else limit * 20)
+    rows = {e.id: e for e in Embedding.query.filter(Embedding.id.in_([key for key, _ in hits])).all()} if hits else {}
+    matches = []
+    for key, score in hits:
+        embedding = rows.get(key)
+        if embedding is None or (video_id and embedding.video_id != video_id) or (kind and embedding.kind != kind):
+            continue
+        matches.append((embedding, score))
+        if len(matches) >= limit:
+            break
+
+    videos = {v.id: v for v in Video.query.filter(Video.id.in_({e.video_id for e, _ in matches})).all()} if matches else {}
+    chats = {c.id: c for c in ChatHistory.query.filter(ChatHistory.id.in_([e.ref_id for e, _ in matches if e.kind == 'chat'])).all()}
+    segments = {s.id: s for s in VideoSegment.query.filter(VideoSegment.id.in_([e.ref_id for e, _ in matches if e.kind == 'segment'])).all()}
+    results = []
+    for embedding, score in matches:
+        video = videos.get(embedding.video_id)
+        result = {
+            'video_id': embedding.video_id,
+            'video_name': video.video_name if video else None,
+            'kind': embedding.kind,
+            'score': round(score, 4),
+            'start_time': embedding.start_time,
+            'end_time': embedding.end_time,
+        }
+        if embedding.kind == 'chat' and embedding.ref_id in chats:
+            chat = chats[embedding.ref_id]
+            result.update({'chat_id': chat.id, 'question': chat.question, 'text': chat.answer,
+                           'timestamp': chat.timestamp.isoformat() if chat.timestamp else None})
+        elif embedding.kind == 'segment' and embedding.ref_id in segments:
+            segment = segments[embedding.ref_id]
+            result.update({'text': segment.caption,
+                           'timestamp': f"{format_timestamp(segment.start_time)}-{format_timestamp(segment.end_time)}"})
+        else:
+            continue
+        results.append(result)
+    return results
+
+def answer_question(video, question, video_url, tier, sampling, max_frames, system_prompt=ANALYSIS_SYSTEM_PROMPT,
+                    timeline_prompt=TIMELINE_SYSTEM_PROMPT, use_index=True, stream=False, route=None):
+    """Answer from the timeline index when the video has one, otherwise from keyframes or the full video.
+
+    Returns (answer, answered_from_index); with stream=True the answer is a generator of text pieces.
+    """
+    if use_index and has_timeline_index(video) and video.segments:
+        return answer_from_index(video, question, tier, max_frames, system_prompt=timeline_prompt, stream=stream, route=route), True
+    frames = prepare_video_frames(video, sampling, max_frames)
+    return run_qwen_analysis(video_url, question, system_prompt=system_prompt, tier=tier, frames=frames, stream=stream, route=route), False
+
+def batch_question_prompt(questions):
+    numbered = '\n'.join(f'{i}. {question}' for i, question in enumerate(questions, 1))
+    return (f"Answer each of these {len(questions)} questions about the footage separately:\n{numbered}\n\n"
+            'Reply with only a JSON object whose "answers" list holds one {"id": <question number>, "answer": <text>} '
+            'object per question.')
+
+def split_batch_answers(reply, count):
+    """Parse a reply to batch_question_prompt into `count` answers, with None for any question left unanswered"""
+    answers = [None] * count
+    try:
+        data = json.loads(reply[reply.index('{'):reply.rindex('}') + 1])
+    except (AttributeError, TypeError, ValueError):
+        return answers
+    for item in data.get('answers', []) if isinstance(data, dict) else []:
+        try:
+            position = int(item.get('id')) - 1
+        except (AttributeError, TypeError, ValueError):
+            continue
+        answer = item.get('answer')
+        if 0 <= position < count and isinstance(answer, str) and answer.strip():
+            answers[position] = answer.strip()
+    return answers
+
+def answer_questions(video, questions, video_url, tier, sampling, max_frames, use_index=True):
+    """Answer several questions about one video with a single model call, sharing the frames (or video) between them.
+
+    Questions the model's reply does not answer are retried one at a time.
+    Returns (answers, models_used, answered_from_index).
+    """
+    route = {}
+    if len(questions) == 1:
+        answer, from_index = answer_question(video, questions[0], video_url, tier, sampling, max_frames, use_index=use_index, route=route)
+        return [answer], [route['model']], from_index
+    prompt = batch_question_prompt(questions)
+    from_index = bool(use_index and has_timeline_index(video) and video.segments)
+    if from_index:
+        reply = answer_from_index(video, prompt, tier, max_frames, route=route)
+    else:
+        frames = prepare_video_frames(video, sampling, max_frames)
+        reply = run_qwen_analysis(video_url, prompt, tier=tier, frames=frames, route=route)
+    answers = split_batch_answers(reply, len(questions))
+    models = [route['model']] * len(questions)
+    for position, answer in enumerate(answers):
+        if answer is None:
+            print(f"Batch reply for video {video.id} missed question {position + 1}, asking it alone")  # Debug logging
+            retry_route = {}
+            answers[position], _ = answer_question(video, questions[position], video_url, tier, sampling, max_frames,
+                                                   use_index=use_index, route=retry_route)
+            models[position] = retry_route['model']
+    return answers, models, from_index
+
+# Background worker pool for stream frame batches (kept apart so camera traffic doesn't hold up analysis jobs)
+stream_executor = ThreadPoolExecutor(max_workers=STREAM_WORKERS, thread_name_prefix='stream')
+
+@traced_job('stream_batch', SLOW_JOB_SECONDS)
+def run_stream_batch(user_id, camera_name, batch, tier=TIER_FAST):
+    """Describe a batch of sampled stream frames and store it as a StreamEvent"""
+    frames = [frame for frame in batch['frames'] if frame.get('jpeg')]
+    if not frames:
+        return None
+    with app.app_context():
+        try:
+            route = {}
+            # Long batches are thinned evenly (keeping the first and last frame) like every other analysis path
+            with scheduled(BACKGROUND, user_id):
+                description = run_qwen_analysis(None, "What happened in this stretch of footage?", system_prompt=STREAM_SYSTEM_PROMPT,
+                                                tier=tier, frames=select_uniform(frames, MAX_FRAMES_PER_REQUEST), route=route)
+            event = StreamEvent(
+                user_id=user_id,
+                camera_name=camera_name,
+                started_at=batch['started_at'],
+                ended_at=batch['ended_at'],
+                stream_offset_start=frames[0]['timestamp'],
+                stream_offset_end=frames[-1]['timestamp'],
+                frame_count=len(frames),
+                description=description,
+                model_used=route['model']
+            )
+            db.session.add(event)
+            db.session.commit()
+            return event.id
+        except Exception as e:
+            print(f"Stream batch analysis failed for camera {camera_name}: {str(e)}")  # Debug logging
+            db.session.rollback()
+            return None
+
+# Receive a batch of sampled frames from a remote stream ingestor and queue its analysis
+@app.route('/api/stream_events/batch', methods=['POST'])
 @login_required
-def analyze_video():
-    data = request.json
-    video_id = data.get('video_id')
-    question = data.get('question')
+def submit_stream_batch():
+    camera_name = request.form.get('camera_name', '').strip()
+    files = request.files.getlist('frames')
+    timestamps = request.form.getlist('timestamps', type=float)
+    if not camera_name or not files:
+        return jsonify({'error': 'camera_name and frames are required'}), 400
+    if len(timestamps) != len(files):
+        timestamps = [float(i) for i in range(len(files))]
+    try:
+        started_at = datetime.fromisoformat(request.form['started_at']) if request.form.get('started_at') else datetime.utcnow()
+        ended_at = datetime.fromisoformat(request.form['ended_at']) if request.form.get('ended_at') else datetime.utcnow()
+    except ValueError:
+        return jsonify({'error': 'started_at and ended_at must be ISO timestamps'}), 400
+    batch = {
+        'started_at': started_at,
+        'ended_at': ended_at,
+        'frames': [{'timestamp': ts, 'jpeg': f.read()} for f, ts in zip(files[:MAX_FRAMES_PER_REQUEST * 4], timestamps)]
+    }
+    stream_executor.submit(run_stream_batch, current_user.id, camera_name, batch)
+    return jsonify({'message': 'Batch queued', 'frame_count': len(batch['frames'])}), 202
 
-    if not video_id or not question:
-        return jsonify({'error': 'Video ID and question are required'}), 400
+# List cameras with their supervisor health
+@app.route('/api/cameras', methods=['GET'])
+@login_required
+def get_cameras():
+    cameras = Camera.query.filter_by(user_id=current_user.id).order_by(Camera.name.asc()).all()
+    return jsonify({'cameras': [c.to_dict() for c in cameras]}), 200
 
+# Add a camera
+@app.route('/api/cameras', methods=['POST'])
+@login_required
+def add_camera():
+    data = request.json or {}
+    name = (data.get('name') or '').strip()
+    rtsp_url = (data.get('rtsp_url') or '').strip()
+    if not name or not rtsp_url:
+        return jsonify({'error': 'Camera name and RTSP URL are required'}), 400
+    if Camera.query.filter_by(user_id=current_user.id, name=name).first():
+        return jsonify({'error': 'A camera with this name already exists'}), 409
+    try:
+        sampling_rate = float(data.get('sampling_rate', 1.0))
+        batch_interval = float(data.get('batch_interval', 60.0))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'sampling_rate and batch_interval must be numbers'}), 400
+    if sampling_rate <= 0 or batch_interval <= 0:
+        return jsonify({'error': 'sampling_rate and batch_interval must be positive'}), 400
+    try:
+        motion_sensitivity = parse_motion_sensitivity(data.get('motion_sensitivity', MOTION_SENSITIVITY))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    camera = Camera(
+        user_id=current_user.id,
+        name=name,
+        rtsp_url=rtsp_url,
+        sampling_rate=sampling_rate,
+        batch_interval=batch_interval,
+        motion_sensitivity=motion_sensitivity,
+        is_enabled=bool(data.get('is_enabled', True))
+    )
+    db.session.add(camera)
+    db.session.commit()
+    return jsonify(camera.to_dict()), 201
+
+# Enable or disable a camera
+@app.route('/api/cameras/<int:camera_id>/toggle', methods=['POST'])
+@login_required
+def toggle_camera(camera_id):
+    camera = Camera.query.filter_by(id=camera_id, user_id=current_user.id).first()
+    if not camera:
+        return jsonify({'error': 'Camera not found or not owned by user'}), 404
+    camera.is_enabled = not camera.is_enabled
+    db.session.commit()
+    return jsonify(camera.to_dict()), 200
+
+# Change a camera's motion gate sensitivity (null turns the gate off)
+@app.route('/api/cameras/<int:camera_id>/motion_sensitivity', methods=['PUT'])
+@login_required
+def set_camera_motion_sensitivity(camera_id):
+    camera = Camera.query.filter_by(id=camera_id, user_id=current_user.id).first()
+    if not camera:
+        return jsonify({'error': 'Camera not found or not owned by user'}), 404
+    try:
+        camera.motion_sensitivity = parse_motion_sensitivity((request.json or {}).get('motion_sensitivity'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    db.session.commit()
+    return jsonify(camera.to_dict()), 200
+
+# Delete a camera
+@app.route('/api/cameras/<int:camera_id>', methods=['DELETE'])
+@login_required
+def delete_camera(camera_id):
+    camera = Camera.query.filter_by(id=camera_id, user_id=current_user.id).first()
+    if not camera:
+        return jsonify({'error': 'Camera not found or not owned by user'}), 404
+    db.session.delete(camera)
+    db.session.commit()
+    return jsonify({'message': 'Camera deleted successfully'}), 200
+
+# Query stored stream events, newest first
+@app.route('/api/stream_events', methods=['GET'])
+@login_required
+def get_stream_events():
+    events = StreamEvent.query.filter_by(user_id=current_user.id)
+    camera_name = request.args.get('camera', '').strip()
+    if camera_name:
+        events = events.filter_by(camera_name=camera_name)
+    try:
+        if request.args.get('since'):
+            events = events.filter(StreamEvent.ended_at >= datetime.fromisoformat(request.args['since']))
+        if request.args.get('until'):
+            events = events.filter(StreamEvent.started_at <= datetime.fromisoformat(request.args['until']))
+    except ValueError:
+        return jsonify({'error': 'since and until must be ISO timestamps'}), 400
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    events = events.order_by(StreamEvent.started_at.desc()).limit(limit).all()
+    return jsonify({'events': [e.to_dict() for e in events]}), 200
+
+# Build (or rebuild) a video's timeline index in the background
+@app.route('/api/video/<int:video_id>/index', methods=['POST'])
+@login_required
+def index_video(video_id):
+    video = Video.query.filter_by(id=video_id, user_id=current_user.id).first()
+    if not video:
+        return jsonify({'error': 'Video not found or not owned by user'}), 404
+    if video.video_type != 'upload' or not video.is_processed:
+        return jsonify({'error': 'Only processed uploads can be indexed'}), 400
+    if not os.environ.get('DASHSCOPE_API_KEY'):
+        return jsonify({'error': 'DASHSCOPE_API_KEY not configured on backend'}), 500
+    if video.index_status not in ('queued', 'indexing'):
+        video.index_status = 'queued'
+        db.session.commit()
+        submit_indexing(video.id)
+    return jsonify({'message': 'Indexing queued', 'index_status': video.index_status}), 202
+
+# Get a video's timeline index
+@app.route('/api/video/<int:video_id>/segments', methods=['GET'])
+@login_required
+def get_video_segments(video_id):
     video = Video.query.filter_by(id=video_id, user_id=current_user.id).first()
     if not video:
         return jsonify({'error': 'Video not found or not owned by user'}), 404
+    return jsonify({
+        'index_status': video.index_status,
+        'indexed_at': video.indexed_at.isoformat() if video.indexed_at else None,
+        'segments': [segment.to_dict() for segment in video.segments]
+    }), 200
 
+# Semantic search across a user's chat answers and segment captions
+@app.route('/api/search', methods=['GET'])
+@login_required
+def search():
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Search query is required'}), 400
+    kind = request.args.get('kind', '').strip() or None
+    if kind not in (None, 'chat', 'segment'):
+        return jsonify({'error': 'kind must be chat or segment'}), 400
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
     try:
-        # Build an accessible video URL
-        if video.video_type == 'upload' and video.file_path_or_url:
-            filename = os.path.basename(video.file_path_or_url)
-            # Use APP_BASE_URL if available, otherwise construct from request
-            base_url = os.environ.get('APP_BASE_URL', request.host_url.rstrip('/'))
-            video_url = f"{base_url}/api/video_file/{filename}"
-        else:
-            video_url = video.file_path_or_url
+        results = search_footage(current_user.id, query, limit, request.args.get('video_id', type=int), kind)
+    except Exception as e:
+        print(f"Search failed: {str(e)}")  # Debug logging
+        return jsonify({'error': f'Search failed: {str(e)}'}), 500
+    return jsonify({'query': query, 'results': results}), 200
+
+# Analyze video endpoint (queues a job and returns its id)
+def parse_analysis_request(data, batch=False):
+    """Validate an analyze_video request body for the current user; batch requests carry `questions`.
+
+    Returns (params, None), or (None, error response) when the request is invalid.
+    """
+    data = data or {}
+    video_id = data.get('video_id')
+    if batch:
+        questions = data.get('questions')
+        if not video_id or not isinstance(questions, list):
+            return None, (jsonify({'error': 'Video ID and a list of questions are required'}), 400)
+        # Drop blanks and repeats, keeping the order
+        questions = list(dict.fromkeys(q.strip() for q in questions if isinstance(q, str) and q.strip()))
+        if not questions:
+            return None, (jsonify({'error': 'Video ID and a list of questions are required'}), 400)
+        if len(questions) > BATCH_MAX_QUESTIONS:
+            return None, (jsonify({'error': f'At most {BATCH_MAX_QUESTIONS} questions per batch'}), 400)
+    else:
+        question = data.get('question')
+        if not video_id or not question:
+            return None, (jsonify({'error': 'Video ID and question are required'}), 400)
+        questions = [question]
+
+    try:
+        sampling = parse_sampling(data.get('sampling'))
+        max_frames = min(int(data.get('max_frames') or MAX_FRAMES_PER_REQUEST), MAX_FRAMES_PER_REQUEST)
+    except (TypeError, ValueError) as e:
+        return None, (jsonify({'error': str(e)}), 400)
+    if max_frames < 1:
+        return None, (jsonify({'error': 'max_frames must be at least 1'}), 400)
+
+    video = Video.query.filter_by(id=video_id, user_id=current_user.id).first()
+    if not video:
+        return None, (jsonify({'error': 'Video not found or not owned by user'}), 404)
+
+    use_index = bool(data.get('use_index', True))
+    # An explicit tier wins; otherwise the hardest question decides
+    tier = data.get('tier')
+    if tier not in TIERS:
+        tier = max((choose_tier(question)[0] for question in questions), key=TIERS.index)
+    variant = answer_variant(video, sampling, max_frames, use_index)
+    cache_keys = [answer_cache_key(video, question, tier, ANALYSIS_SYSTEM_PROMPT, variant) for question in questions]
+    return {
+        'video': video,
+        'question': questions[0],
+        'questions': questions,
+        'sampling': sampling,
+        'max_frames': max_frames,
+        'use_index': use_index,
+        'bypass_cache': bool(data.get('bypass_cache', False)),
+        'tier': tier,
+        'cache_key': cache_keys[0],
+        'cache_keys': cache_keys,
+    }, None
 
-        print(f"Video URL constructed: {video_url}")  # Debug logging
+def cached_analysis_answer(params):
+    """Return the cached answer for an analysis request (saved to chat history), or None"""
+    if params['bypass_cache']:
+        count_cache_event('bypassed')
+        return None
+    cached = get_cached_answer(params['cache_key'])
+    if not cached:
+        return None
+    chat = save_chat_answer(params['video'].id, current_user.id, params['question'], cached.answer, cached.model_used)
+    db.session.commit()
+    schedule_embedding_sync(current_user.id)
+    return {'answer': cached.answer, 'model_used': cached.model_used, 'chat_id': chat.id, 'cached': True,
+            'answered_from_index': cached.answered_from_index, 'status': 'completed'}
+
+@app.route('/api/analyze_video', methods=['POST'])
+@login_required
+def analyze_video():
+    params, error = parse_analysis_request(request.json)
+    if error:
+        return error
+    video = params['video']
+
+    # Answer straight from the cache when the same question was asked about the same footage
+    cached = cached_analysis_answer(params)
+    if cached:
+        return jsonify(cached), 200
+
+    if not os.environ.get('DASHSCOPE_API_KEY'):
+        print("DASHSCOPE_API_KEY not found in environment variables")
+        return jsonify({'error': 'DASHSCOPE_API_KEY not configured on backend'}), 500
+
+    # Use APP_BASE_URL if available, otherwise construct from request
+    video_url = build_video_url(video, os.environ.get('APP_BASE_URL', request.host_url.rstrip('/')))
+    job = AnalysisJob(
+        id=uuid.uuid4().hex,
+        user_id=current_user.id,
+        video_id=video.id,
+        question=params['question'],
+        video_url=video_url,
+        sampling=params['sampling'],
+        max_frames=params['max_frames'],
+        cache_key=params['cache_key'],
+        use_index=params['use_index'],
+        model_tier=params['tier'],
+        status='queued'
+    )
+    db.session.add(job)
+    db.session.commit()
+    submit_analysis_job(job.id)
+    return jsonify({'message': 'Analysis queued', 'job_id': job.id, 'status': job.status}), 202
 
-        # Initialize DashScope OpenAI-compatible client
-        dashscope_key = os.environ.get('DASHSCOPE_API_KEY')
-        if not dashscope_key:
+# Analyze video: several questions answered with one model call
+@app.route('/api/analyze_video/batch', methods=['POST'])
+@login_required
+def analyze_video_batch():
+    """Body as /api/analyze_video with `questions` (a list) instead of `question`. Answers cached questions
+    from the cache, the rest with one model request, and saves every answer to chat history at once."""
+    params, error = parse_analysis_request(request.json, batch=True)
+    if error:
+        return error
+    video = params['video']
+    questions = params['questions']
+
+    cached = [None] * len(questions)
+    if params['bypass_cache']:
+        count_cache_event('bypassed', len(questions))
+    else:
+        cached = [get_cached_answer(key) for key in params['cache_keys']]
+    pending = [i for i, entry in enumerate(cached) if entry is None]
+
+    answers = [entry.answer if entry else None for entry in cached]
+    models = [entry.model_used if entry else None for entry in cached]
+    from_index = False
+    if pending:
+        if not os.environ.get('DASHSCOPE_API_KEY'):
             print("DASHSCOPE_API_KEY not found in environment variables")
             return jsonify({'error': 'DASHSCOPE_API_KEY not configured on backend'}), 500
+        video_url = build_video_url(video, os.environ.get('APP_BASE_URL', request.host_url.rstrip('/')))
+        try:
+            with scheduled(INTERACTIVE, current_user.id):
+                fresh, fresh_models, from_index = answer_questions(
+                    video, [questions[i] for i in pending], video_url, params['tier'],
+                    params['sampling'], params['max_frames'], use_index=params['use_index']
+                )
+        except ModelUnavailableError as e:
+            print(f"Batch analysis failed for video {video.id}: {str(e)}")  # Debug logging
+            db.session.rollback()
+            return jsonify({'error': f'AI models unavailable: {str(e)}'}), 503
+        except Exception as e:
+            print(f"Batch analysis failed for video {video.id}: {str(e)}")  # Debug logging
+            db.session.rollback()
+            return jsonify({'error': f'AI analysis failed: {str(e)}'}), 500
+        for i, answer, model in zip(pending, fresh, fresh_models):
+            answers[i] = answer
+            models[i] = model
+            store_cached_answer(params['cache_keys'][i], answer, model, from_index)
 
-        print(f"Using DashScope API key: {dashscope_key[:10]}...")  # Debug logging
+    # One transaction for every chat row
+    chats = [ChatHistory(video_id=video.id, user_id=current_user.id, question=question, answer=answer, model_used=model)
+             for question, answer, model in zip(questions, answers, models)]
+    db.session.add_all(chats)
+    db.session.commit()
+    schedule_embedding_sync(current_user.id)
+    return jsonify({
+        'answers': [{'question': chat.question, 'answer': chat.answer, 'chat_id': chat.id, 'model_used': chat.model_used,
+                     'cached': cached[i] is not None} for i, chat in enumerate(chats)],
+        'answered_from_index': from_index,
+        'status': 'completed'
+    }), 200
 
-        client = OpenAI(
-            api_key=dashscope_key,
-            base_url="https://dashscope-intl.aliyuncs.com/compatible-mode/v1",
-        )
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-        # Compose request to Qwen-VL (OpenAI-compatible schema)
-        messages = [
-            {
-                "role": "system",
-                "content": [
-                    {"type": "text", "text": "You are Qwen-VL, an expert video analysis assistant. Answer concisely and factually based on the provided video."}
-                ],
-            },
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": question},
-                    {"type": "video_url", "video_url": {"url": video_url}},
-                ],
-            },
-        ]
+# Analyze video with the answer streamed as Server-Sent Events
+@app.route('/api/analyze_video/stream', methods=['POST'])
+@login_required
+def analyze_video_stream():
+    """Same request body as /api/analyze_video. Sends `token` events ({"text": ...}) while the model
+    answers, then one `done` event ({"chat_id", "model_used", "cached", ...}) once the answer is saved
+    to chat history, or an `error` event ({"error": ...})."""
+    params, error = parse_analysis_request(request.json)
+    if error:
+        return error
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
 
-        print(f"Sending request to Qwen-VL with video URL: {video_url}")  # Debug logging
+    cached = cached_analysis_answer(params)
+    if cached:
+        body = sse_event('token', {'text': cached['answer']}) + sse_event('done', cached)
+        return Response(body, mimetype='text/event-stream', headers=headers)
 
-        completion = client.chat.completions.create(
-            model="qwen-vl-max",
-            messages=messages,
-            temperature=0.2,
-        )
+    if not os.environ.get('DASHSCOPE_API_KEY'):
+        print("DASHSCOPE_API_KEY not found in environment variables")
+        return jsonify({'error': 'DASHSCOPE_API_KEY not configured on backend'}), 500
 
-        answer = completion.choices[0].message.content if completion and completion.choices else "No answer generated."
-        print(f"Received answer from Qwen-VL: {answer[:100]}...")  # Debug logging
-        return jsonify({'answer': answer}), 200
+    video = params['video']
+    user_id = current_user.id
+    video_url = build_video_url(video, os.environ.get('APP_BASE_URL', request.host_url.rstrip('/')))
 
-    except Exception as e:
-        print(f"Error in analyze_video: {str(e)}")  # Debug logging
-        import traceback
-        traceback.print_exc()  # Print full stack trace
-        return jsonify({'error': f'AI analysis failed: {str(e)}'}), 500
+    def events():
+        key, tier = params['cache_key'], params['tier']
+        owner = analysis_lock_owner()
+        since = datetime.utcnow()
+        try:
+            if acquire_analysis_lock(key, owner):
+                try:
+                    # Another process may have just finished the same question
+                    cached = answer_cached_since(key, since)
+                    coalesced = cached is not None
+                    if coalesced:
+                        count_coalesced('process')
+                        answer, model_used, from_index = cached
+                        yield sse_event('token', {'text': answer})
+                    else:
+                        route = {}
+                        answer_stream, from_index = answer_question(
+                            video, params['question'], video_url, tier, params['sampling'], params['max_frames'],
+                            use_index=params['use_index'], stream=True, route=route
+                        )
+                        pieces = []
+                        for text in answer_stream:
+                            pieces.append(text)
+                            yield sse_event('token', {'text': text})
+                        answer = ''.join(pieces) or "No answer generated."
+                        model_used = route['model']
+                        store_cached_answer(key, answer, model_used, from_index)
+                        db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    raise
+                finally:
+                    release_analysis_lock(key, owner)
+            else:
+                # The same question is being answered already (streamed or not); send that answer once it is ready
+                def compute():
+                    route = {}
+                    answer, from_index = answer_question(
+                        video, params['question'], video_url, tier, params['sampling'], params['max_frames'],
+                        use_index=params['use_index'], route=route
+                    )
+                    return answer, route['model'], from_index
+                answer, model_used, from_index, coalesced = coalesced_answer(key, compute)
+                yield sse_event('token', {'text': answer})
+            chat = save_chat_answer(video.id, user_id, params['question'], answer, model_used)
+            db.session.commit()
+            schedule_embedding_sync(user_id)
+            yield sse_event('done', {'chat_id': chat.id, 'model_used': model_used, 'tier': tier, 'cached': False, 'coalesced': coalesced,
+                                     'answered_from_index': from_index, 'status': 'completed'})
+        except Exception as e:
+            print(f"Streaming analysis failed for video {video.id}: {str(e)}")  # Debug logging
+            db.session.rollback()
+            yield sse_event('error', {'error': f'AI analysis failed: {str(e)}'})
+
+    def generate():
+        # Model calls made while streaming wait for a slot as this user's interactive work
+        with scheduled(INTERACTIVE, user_id):
+            yield from events()
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
+
+# Get analysis job status
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@login_required
+def get_job(job_id):
+    job = AnalysisJob.query.filter_by(id=job_id, user_id=current_user.id).first()
+    if not job:
+        return jsonify({'error': 'Job not found or not owned by user'}), 404
+    return jsonify(job.to_dict()), 200
+
+# Get analysis job result (202 while still pending)
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+@login_required
+def get_job_result(job_id):
+    job = AnalysisJob.query.filter_by(id=job_id, user_id=current_user.id).first()
+    if not job:
+        return jsonify({'error': 'Job not found or not owned by user'}), 404
+    if job.status == 'completed':
+        return jsonify({'answer': job.answer, 'model_used': job.model_used, 'chat_id': job.chat_id}), 200
+    if job.status == 'failed':
+        return jsonify({'error': job.error}), 500
+    return jsonify({'job_id': job.id, 'status': job.status}), 202
+
+# Answer cache statistics
+@app.route('/api/cache/stats', methods=['GET'])
+@login_required
+def get_answer_cache_stats():
+    with answer_cache_lock:
+        stats = dict(answer_cache_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+    stats['entries'] = AnswerCache.query.count()
+    stats['ttl_seconds'] = ANSWER_CACHE_TTL
+    stats['max_entries'] = ANSWER_CACHE_MAX_ENTRIES
+    return jsonify(stats), 200
+
+# Model call scheduler statistics: queue depth, running calls and waits per work class (per process)
+@app.route('/api/scheduler/stats', methods=['GET'])
+@login_required
+def get_scheduler_stats():
+    if not os.environ.get('DASHSCOPE_API_KEY'):
+        return jsonify({'error': 'DASHSCOPE_API_KEY not configured on backend'}), 500
+    return jsonify(get_model_client().scheduler.stats()), 200
+
+# Motion gate statistics: frames and model calls kept away from the model
+@app.route('/api/motion_gate/stats', methods=['GET'])
+@login_required
+def get_motion_gate_stats():
+    cameras = Camera.query.filter_by(user_id=current_user.id).order_by(Camera.name.asc()).all()
+    camera_stats = [{
+        'name': c.name,
+        'motion_sensitivity': c.motion_sensitivity,
+        'frames_sampled': c.frames_sampled or 0,
+        'frames_skipped': c.frames_gated or 0,
+        'batches_submitted': c.batches_submitted or 0,
+        'model_calls_avoided': c.batches_skipped or 0
+    } for c in cameras]
+    with motion_gate_lock:
+        uploads = dict(motion_gate_stats)
+    uploads['motion_sensitivity'] = MOTION_SENSITIVITY
+    return jsonify({
+        'cameras': camera_stats,
+        'frames_skipped': sum(c['frames_skipped'] for c in camera_stats) + uploads['frames_skipped'],
+        'model_calls_avoided': sum(c['model_calls_avoided'] for c in camera_stats),
+        'uploads': uploads
+    }), 200
 
 # Add chat endpoint
 @app.route('/api/add_chat', methods=['POST'])
@@ -509,6 +2517,7 @@ def add_chat():
     )
     db.session.add(chat)
     db.session.commit()
+    schedule_embedding_sync(current_user.id)
     
     return jsonify({'message': 'Chat saved successfully', 'chat_id': chat.id}), 200
 
@@ -627,155 +2636,295 @@ def twilio_webhook():
         # Normalize phone number
         normalized_number = from_number if from_number.startswith('whatsapp:') else f'whatsapp:{from_number}'
         
-        # Check if this is a linking token
-        if message_body.isdigit() and len(message_body) == 6:
-            # Try to link with token
-            token = message_body
-            
-            # Atomic token consumption
-            from datetime import datetime
-            link_token = WhatsAppLinkToken.query.filter_by(
-                token=token, 
-                used=False
-            ).filter(WhatsAppLinkToken.expires_at > datetime.utcnow()).first()
-            
-            if link_token:
-                # Mark token as used and link user
-                link_token.used = True
-                user = db.session.get(User, link_token.user_id)
-                if user:
-                    user.whatsapp_number = normalized_number
-                    user.whatsapp_linked_at = datetime.utcnow()
-                    db.session.commit()
-                    
-                    reply = f"✅ Linked successfully! You can now ask questions about your videos. Try: 'list my videos' or 'what happened yesterday on camera 1'"
-                else:
-                    reply = "❌ User not found. Please try again."
-            else:
-                reply = "❌ Token invalid or expired. Generate a new token from your dashboard."
-        else:
-            # Look up user by WhatsApp number
-            user = User.query.filter_by(whatsapp_number=normalized_number).first()
-            
-            if not user:
-                reply = "❌ No linked account found. Please generate a token from your dashboard and send it here."
-            else:
-                # Process natural language query
-                reply = process_whatsapp_query(user, message_body)
+        if not os.environ.get('TWILIO_ACCOUNT_SID'):
+            # Without REST API credentials the reply can only go back in the webhook response
+            with scheduled(WHATSAPP, normalized_number, WHATSAPP_WEBHOOK_DEADLINE_SECONDS):
+                return twiml_response(answer_whatsapp_message(normalized_number, message_body))
         
-        # Send reply via TwiML
-        from flask import Response
-        twiml = f'<Response><Message>{reply}</Message></Response>'
-        return Response(twiml, mimetype='text/xml')
+        # Acknowledge at once and answer in the background, well inside Twilio's webhook timeout.
+        # Twilio retries deliveries it considers failed, so a MessageSid seen before is not processed again.
+        message = WhatsAppMessage(message_sid=message_sid or uuid.uuid4().hex, from_number=normalized_number, body=message_body)
+        db.session.add(message)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            print(f"Ignoring repeated Twilio delivery of {message_sid}")  # Debug logging
+            return twiml_response()
+        submit_whatsapp_message(message.message_sid)
+        return twiml_response()
         
     except Exception as e:
         # Log error and send friendly message
         print(f"Twilio webhook error: {e}")
         import traceback
         traceback.print_exc()  # Print full stack trace
-        twiml = '<Response><Message>Sorry, something went wrong. Please try again later.</Message></Response>'
-        return Response(twiml, mimetype='text/xml')
+        return twiml_response("Sorry, something went wrong. Please try again later.")
+
+def twiml_response(reply=None):
+    """TwiML reply for the webhook; without a message Twilio just records the delivery"""
+    from xml.sax.saxutils import escape
+    twiml = f'<Response><Message>{escape(reply)}</Message></Response>' if reply else '<Response></Response>'
+    return Response(twiml, mimetype='text/xml')
+
+def answer_whatsapp_message(normalized_number, message_body):
+    """Link an account from a token message, or answer the linked user's query"""
+    # Check if this is a linking token
+    if message_body.isdigit() and len(message_body) == 6:
+        # Try to link with token
+        token = message_body
+        
+        # Atomic token consumption
+        link_token = WhatsAppLinkToken.query.filter_by(
+            token=token, 
+            used=False
+        ).filter(WhatsAppLinkToken.expires_at > datetime.utcnow()).first()
+        
+        if link_token:
+            # Mark token as used and link user
+            link_token.used = True
+            user = db.session.get(User, link_token.user_id)
+            if user:
+                user.whatsapp_number = normalized_number
+                user.whatsapp_linked_at = datetime.utcnow()
+                db.session.commit()
+                
+                return "✅ Linked successfully! You can now ask questions about your videos. Try: 'list my videos' or 'what happened yesterday on camera 1'"
+            return "❌ User not found. Please try again."
+        return "❌ Token invalid or expired. Generate a new token from your dashboard."
+    
+    # Look up user by WhatsApp number
+    user = User.query.filter_by(whatsapp_number=normalized_number).first()
+    if not user:
+        return "❌ No linked account found. Please generate a token from your dashboard and send it here."
+    # Process natural language query
+    return process_whatsapp_query(user, message_body)
+
+# Background worker pool answering WhatsApp messages
+whatsapp_executor = ThreadPoolExecutor(max_workers=WHATSAPP_WORKERS, thread_name_prefix='whatsapp')
+
+@traced_job('whatsapp', SLOW_JOB_SECONDS)
+def run_whatsapp_message(message_sid):
+    """Answer a received WhatsApp message and send the reply through the Twilio REST API"""
+    with app.app_context():
+        claimed = WhatsAppMessage.query.filter(WhatsAppMessage.message_sid == message_sid, db.or_(
+            WhatsAppMessage.status == 'received',
+            db.and_(WhatsAppMessage.status == 'processing', WhatsAppMessage.started_at < stale_work_cutoff())
+        )).update({'status': 'processing', 'started_at': datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
+        if not claimed:
+            return
+        message = db.session.get(WhatsAppMessage, message_sid)
+        try:
+            if message.reply is None:
+                age = (datetime.utcnow() - message.created_at).total_seconds() if message.created_at else 0
+                with scheduled(WHATSAPP, message.from_number, WHATSAPP_DEADLINE_SECONDS - age):
+                    message.reply = answer_whatsapp_message(message.from_number, message.body or '')
+                # Keep the answer so a retried send doesn't repeat the model call
+                db.session.commit()
+            message.reply_sid = get_twilio_client().send_message(message.from_number, message.reply)
+            message.status = 'replied'
+            message.replied_at = datetime.utcnow()
+            message.error = None
+        except Exception as e:
+            print(f"WhatsApp reply to {message_sid} failed: {str(e)}")  # Debug logging
+            db.session.rollback()
+            message = db.session.get(WhatsAppMessage, message_sid)
+            message.status = 'failed'
+            message.error = str(e)[:256]
+        db.session.commit()
+
+def submit_whatsapp_message(message_sid):
+    return whatsapp_executor.submit(run_whatsapp_message, message_sid)
+
+def resume_pending_whatsapp_messages():
+    """Submit messages not yet answered, e.g. after a restart; safe to call from every server process"""
+    messages = WhatsAppMessage.query.filter(db.or_(
+        WhatsAppMessage.status == 'received',
+        db.and_(WhatsAppMessage.status == 'processing', WhatsAppMessage.started_at < stale_work_cutoff())
+    )).order_by(WhatsAppMessage.created_at.asc()).all()
+    for message in messages:
+        submit_whatsapp_message(message.message_sid)
+    if messages:
+        print(f"Resumed {len(messages)} pending WhatsApp message(s)")
+
+# Per-user video name indexes for the WhatsApp router (per process): user id -> (signature, built_at, NameIndex)
+name_index_cache = {}
+name_index_lock = threading.Lock()
+
+def video_name_index(user_id):
+    """Return the user's video name index, rebuilding it when videos were added or deleted"""
+    # Count and newest id come from the (user_id, ...) index, so checking stays cheap for large libraries
+    signature = tuple(db.session.query(db.func.count(Video.id), db.func.max(Video.id)).filter(Video.user_id == user_id).one())
+    cached = name_index_cache.get(user_id)
+    if cached and cached[0] == signature and time.monotonic() - cached[1] < NAME_INDEX_TTL:
+        return cached[2]
+    index = NameIndex(db.session.query(Video.id, Video.video_name).filter(Video.user_id == user_id).all())
+    with name_index_lock:
+        name_index_cache[user_id] = (signature, time.monotonic(), index)
+    return index
+
+def invalidate_name_index(user_id):
+    with name_index_lock:
+        name_index_cache.pop(user_id, None)
+
+def to_utc_window(date):
+    """Local (start, end) from the router as naive UTC datetimes, the way timestamps are stored"""
+    start, end, _ = date
+    return tuple(moment.replace(tzinfo=WHATSAPP_TIMEZONE).astimezone(ZoneInfo('UTC')).replace(tzinfo=None) for moment in (start, end))
+
+def local_time(moment):
+    return moment.replace(tzinfo=ZoneInfo('UTC')).astimezone(WHATSAPP_TIMEZONE)
+
+def whatsapp_video_list(videos, heading):
+    video_list = "\n".join([f"• {v.video_name} ({v.video_type}, {local_time(v.upload_date).strftime('%d %b %H:%M')})" for v in videos])
+    return f"{heading}\n{video_list}\n\nAsk about any video by name!"
+
+def whatsapp_camera_events(user, camera_name, window, label):
+    """Describe a camera's stored stream events over a time window"""
+    events = StreamEvent.query.filter(
+        StreamEvent.user_id == user.id, StreamEvent.camera_name == camera_name,
+        StreamEvent.started_at >= window[0], StreamEvent.started_at < window[1]
+    ).order_by(StreamEvent.started_at.asc()).limit(10).all()
+    if not events:
+        return f"📷 No events recorded on {camera_name} {label}."
+    lines = "\n".join([f"• {local_time(e.started_at).strftime('%d %b %H:%M')} {(e.description or '').strip()[:150]}" for e in events])
+    return f"📷 {camera_name} {label}:\n{lines}"
+
+def whatsapp_video_analysis(user, video, query):
+    """Answer a question about one video (cached when possible) and save it to the chat history"""
+    try:
+        tier, _ = choose_tier(query, 'whatsapp')
+        sampling = parse_sampling(None)
+        # Same prompt and key as the dashboard, so both share cached and in-flight answers
+        cache_key = answer_cache_key(video, query, tier, ANALYSIS_SYSTEM_PROMPT, answer_variant(video, sampling, MAX_FRAMES_PER_REQUEST))
+        cached = get_cached_answer(cache_key)
+        if cached:
+            answer, model_used = cached.answer, cached.model_used
+        elif os.environ.get('DASHSCOPE_API_KEY'):
+            # Call Qwen
+            video_url = build_video_url(video)
+
+            def compute():
+                route = {}
+                answer, from_index = answer_question(video, query, video_url, tier, sampling, MAX_FRAMES_PER_REQUEST, route=route)
+                return answer, route['model'], from_index
+            answer, model_used, _, _ = coalesced_answer(cache_key, compute)
+        else:
+            return "❌ Analysis service not configured."
+        
+        # Save to chat history
+        save_chat_answer(video.id, user.id, query, answer, model_used)
+        db.session.commit()
+        schedule_embedding_sync(user.id)
+        
+        return f"🎥 Analysis of '{video.video_name}':\n\n{answer}"
+    except DeadlineExceeded:
+        db.session.rollback()
+        return "⏳ The analysis is taking too long right now. Please ask again in a minute."
+    except Exception as e:
+        return f"❌ Analysis failed: {str(e)}"
 
 def process_whatsapp_query(user, query):
-    """Process natural language query and return summary"""
+    """Route a WhatsApp message: list videos or cameras, report camera events, or analyze a video.
+
+    Videos and cameras are resolved with fuzzy name indexes, and date phrases ("yesterday",
+    "last night", "on monday") against upload and event times.
+    """
     try:
-        query_lower = query.lower()
+        route = route_message(query, datetime.now(WHATSAPP_TIMEZONE).replace(tzinfo=None))
+        window = to_utc_window(route['date']) if route['date'] else None
+        label = route['date'][2] if route['date'] else 'in the last 24 hours'
         
-        # Simple command parsing
-        if 'list' in query_lower and ('video' in query_lower or 'camera' in query_lower):
-            # List user's videos
-            videos = Video.query.filter_by(user_id=user.id).limit(5).all()
+        if route['intent'] == 'list':
+            if route['target'] == 'cameras':
+                cameras = Camera.query.filter_by(user_id=user.id).order_by(Camera.name.asc()).limit(20).all()
+                if not cameras:
+                    return "📷 No cameras configured. Add one from your dashboard!"
+                camera_list = "\n".join([f"• {c.name} ({c.status or 'stopped'})" for c in cameras])
+                return f"📷 Your cameras:\n{camera_list}\n\nAsk e.g. 'what happened yesterday on {cameras[0].name}'"
+            videos = Video.query.filter_by(user_id=user.id)
+            if window:
+                videos = videos.filter(Video.upload_date >= window[0], Video.upload_date < window[1])
+            videos = videos.order_by(Video.upload_date.desc(), Video.id.desc()).limit(5).all()
             if videos:
-                video_list = "\n".join([f"• {v.video_name} ({v.video_type})" for v in videos])
-                return f"📹 Your recent videos:\n{video_list}\n\nAsk about any video by name!"
-            else:
-                return "📹 No videos found. Upload some videos first!"
+                return whatsapp_video_list(videos, f"📹 Your videos {route['date'][2]}:" if window else "📹 Your recent videos:")
+            return f"📹 No videos from {route['date'][2]}." if window else "📹 No videos found. Upload some videos first!"
         
-        elif 'what happened' in query_lower or 'analyze' in query_lower:
-            # Try to find video by name in query
-            videos = Video.query.filter_by(user_id=user.id).all()
-            matching_video = None
-            
-            for video in videos:
-                if video.video_name.lower() in query_lower:
-                    matching_video = video
-                    break
-            
-            if matching_video:
-                # Use existing Qwen analysis
-                try:
-                    # Build video URL for analysis
-                    if matching_video.video_type == 'upload' and matching_video.file_path_or_url:
-                        filename = os.path.basename(matching_video.file_path_or_url)
-                        video_url = f"{os.environ.get('APP_BASE_URL', 'http://localhost:5000')}/api/video_file/{filename}"
-                    else:
-                        video_url = matching_video.file_path_or_url
-                    
-                    # Call Qwen
-                    dashscope_key = os.environ.get('DASHSCOPE_API_KEY')
-                    if dashscope_key:
-                        client = OpenAI(
-                            api_key=dashscope_key,
-                            base_url="https://dashscope-intl.aliyuncs.com/compatible-mode/v1",
-                        )
-                        
-                        messages = [
-                            {
-                                "role": "system",
-                                "content": [{"type": "text", "text": "You are Qwen-VL. Provide a concise summary of what happens in this video, focusing on key events, people, and activities. Keep response under 200 words."}]
-                            },
-                            {
-                                "role": "user", 
-                                "content": [
-                                    {"type": "text", "text": query},
-                                    {"type": "video_url", "video_url": {"url": video_url}}
-                                ]
-                            }
-                        ]
-                        
-                        completion = client.chat.completions.create(
-                            model="qwen-vl-max",
-                            messages=messages,
-                            temperature=0.2,
-                        )
-                        
-                        answer = completion.choices[0].message.content if completion and completion.choices else "No analysis available."
-                        
-                        # Save to chat history
-                        chat = ChatHistory(
-                            video_id=matching_video.id,
-                            user_id=user.id,
-                            question=query,
-                            answer=answer,
-                            model_used="qwen-vl-max"
-                        )
-                        db.session.add(chat)
-                        db.session.commit()
-                        
-                        return f"🎥 Analysis of '{matching_video.video_name}':\n\n{answer}"
-                    else:
-                        return "❌ Analysis service not configured."
-                        
-                except Exception as e:
-                    return f"❌ Analysis failed: {str(e)}"
-            else:
-                return "❌ Video not found. Try 'list my videos' to see available videos."
+        if route['intent'] == 'help' and not route['date']:
+            return WHATSAPP_HELP
         
-        else:
-            return """🤖 Hi! I can help you with your CCTV videos. Try these commands:
+        # Entities: the best camera and video name mentioned in the message
+        camera_names = NameIndex((c.name, c.name) for c in Camera.query.with_entities(Camera.name).filter_by(user_id=user.id))
+        camera_match = camera_names.match(route['text'], limit=1)
+        video_match = video_name_index(user.id).match(route['text'], limit=1)
+        
+        if camera_match and (not video_match or camera_match[0][1] >= video_match[0][1]):
+            window = window or (datetime.utcnow() - timedelta(days=1), datetime.utcnow())
+            return whatsapp_camera_events(user, camera_match[0][0], window, label)
+        if video_match:
+            video = db.session.get(Video, video_match[0][0])
+            if video is not None:
+                return whatsapp_video_analysis(user, video, query)
+        if window:
+            # No name given: use what was uploaded or recorded in that window
+            videos = Video.query.filter(Video.user_id == user.id, Video.upload_date >= window[0], Video.upload_date < window[1]
+                                        ).order_by(Video.upload_date.desc(), Video.id.desc()).limit(5).all()
+            if len(videos) == 1:
+                return whatsapp_video_analysis(user, videos[0], query)
+            if videos:
+                return whatsapp_video_list(videos, f"📹 Videos from {label} — which one do you mean?")
+            events = StreamEvent.query.filter(StreamEvent.user_id == user.id, StreamEvent.started_at >= window[0],
+                                              StreamEvent.started_at < window[1]).order_by(StreamEvent.started_at.asc()).limit(10).all()
+            if events:
+                lines = "\n".join([f"• {local_time(e.started_at).strftime('%d %b %H:%M')} {e.camera_name}: {(e.description or '').strip()[:120]}" for e in events])
+                return f"📷 Camera events {label}:\n{lines}"
+            return f"❌ Nothing found from {label}. Try 'list my videos' to see available videos."
+        if route['intent'] == 'analyze':
+            return "❌ Video not found. Try 'list my videos' to see available videos."
+        return WHATSAPP_HELP
+            
+    except Exception as e:
+        return f"❌ Error processing query: {str(e)}"
+
+WHATSAPP_HELP = """🤖 Hi! I can help you with your CCTV videos. Try these commands:
             
 📹 "list my videos" - Show your recent videos
+📷 "list my cameras" - Show your cameras
 🎥 "what happened in [video name]" - Analyze a specific video
-🔍 "analyze [video name]" - Get detailed analysis
+🕒 "what happened yesterday on [camera name]" - Camera events for a day
 
 Example: "what happened in my security footage" """
-            
-    except Exception as e:
-        return f"❌ Error processing query: {str(e)}"
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+BASELINE_REVISION = 'fb208f3f454e'  # the schema db.create_all() built before migrations existed
+
+def init_database():
+    """Bring the schema up to date with the migrations, then set up the full-text index.
+
+    A database created by db.create_all() before migrations existed is stamped at the
+    baseline revision first, so the migrations add the tables and columns it lacks.
+    """
+    tables = set(db.inspect(db.engine).get_table_names())
+    if 'user' in tables and 'alembic_version' not in tables:
+        stamp(directory=MIGRATIONS_DIR, revision=BASELINE_REVISION)
+    upgrade(directory=MIGRATIONS_DIR)
+    fulltext_available()
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create or upgrade the schema; run once before starting the server processes"""
+    init_database()
+    print("Database is up to date")
 
 if __name__ == '__main__':
+    # Development server; production runs gunicorn (see gunicorn.conf.py)
     with app.app_context():
-        db.create_all()
+        init_database()
+        resume_pending_jobs()
+        resume_pending_ingestion()
+        resume_pending_whatsapp_messages()
+    schedule_embedding_sync()
     
     # Get port from environment variable (for Railway) or use default
     port = int(os.environ.get('PORT', 5000))
@@ -0,0 +1,428 @@
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+# Benchmark and load test for the backend API.
+#
+# Starts the Flask app on a temporary database with a stand-in for the model endpoint,
+# seeds it with users, videos and chat history, then drives each scenario from several
+# client threads and records throughput and latency percentiles:
+#
+#   python benchmark.py --output before.json
+#   python benchmark.py --compare before.json
+#
+# --compare exits with status 1 when a scenario's p99 latency or throughput is worse
+# than the baseline by more than --tolerance.
+
+SCENARIOS = ['register', 'login', 'list_videos', 'list_videos_cursor', 'chat_history', 'chat_history_full',
+             'upload', 'analyze_video', 'analyze_video_cached']
+
+PASSWORD = 'benchmark-password'
+
+
+class StubModelHandler(BaseHTTPRequestHandler):
+    """OpenAI-compatible chat completions endpoint that answers after a fixed delay.
+
+    Models listed in `failing_models` answer 503, as an unavailable provider model would.
+    """
+    protocol_version = 'HTTP/1.1'
+    delay = 0.2
+    failing_models = set()
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        time.sleep(self.delay)
+        if body.get('model') in self.failing_models:
+            payload = json.dumps({'error': {'message': f"{body.get('model')} is unavailable", 'type': 'service_unavailable'}}).encode()
+            self.send_response(503)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+        text = 'Two people walk past the gate; a delivery van stops briefly at the entrance.'
+        if body.get('stream'):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.end_headers()
+            for word in text.split(' '):
+                chunk = {'id': 'bench', 'object': 'chat.completion.chunk', 'created': 0, 'model': body.get('model'),
+                         'choices': [{'index': 0, 'delta': {'content': word + ' '}, 'finish_reason': None}]}
+                self.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode())
+            self.wfile.write(b'data: [DONE]\n\n')
+            self.close_connection = True
+            return
+        payload = json.dumps({
+            'id': 'bench', 'object': 'chat.completion', 'created': 0, 'model': body.get('model'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': 1, 'completion_tokens': 1, 'total_tokens': 2},
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def start_server(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_sample_video(path, seconds=2, fps=10):
+    """Write a small synthetic MP4 for the upload scenario"""
+    import cv2
+    import numpy as np
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (160, 120))
+    for i in range(seconds * fps):
+        frame = np.zeros((120, 160, 3), dtype=np.uint8)
+        frame[:, (i * 8) % 160:(i * 8) % 160 + 20] = 255
+        writer.write(frame)
+    writer.release()
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def seed_database(backend, args):
+    """Insert users, videos and chat history directly; returns the seeded ids"""
+    db = backend.db
+    rng = random.Random(args.seed)
+    password_hash = backend.bcrypt.generate_password_hash(PASSWORD).decode('utf-8')
+    words = ['front', 'door', 'gate', 'parking', 'lot', 'garage', 'backyard', 'lobby', 'office', 'street',
+             'entrance', 'hallway', 'warehouse', 'loading', 'dock', 'camera', 'night', 'morning']
+    now = datetime.utcnow()
+    start = time.perf_counter()
+    db.session.execute(db.insert(backend.User), [
+        {'email': f'bench{i}@example.com', 'username': f'bench{i}', 'password_hash': password_hash}
+        for i in range(args.users)
+    ])
+    user_ids = [user.id for user in backend.User.query.order_by(backend.User.id).all()]
+
+    videos = []
+    for user_id in user_ids:
+        for i in range(args.videos_per_user):
+            videos.append({
+                'user_id': user_id,
+                'video_name': f"{' '.join(rng.sample(words, 3))} {i}.mp4",
+                'video_type': 'url',
+                'file_path_or_url': f'https://example.com/footage/{user_id}/{i}.mp4',
+                'upload_date': now - timedelta(minutes=rng.randint(0, 60 * 24 * 365)),
+                'is_processed': True,
+                'is_favorite': rng.random() < 0.05,
+            })
+    db.session.execute(db.insert(backend.Video), videos)
+    db.session.commit()
+
+    hot_videos = {}
+    chats = []
+    for user_id in user_ids:
+        video_ids = [row.id for row in backend.Video.query.with_entities(backend.Video.id)
+                     .filter_by(user_id=user_id).order_by(backend.Video.id).limit(args.chat_videos_per_user)]
+        hot_videos[user_id] = video_ids
+        for video_id in video_ids:
+            asked = now - timedelta(days=30)
+            for i in range(args.chats_per_video):
+                asked += timedelta(seconds=rng.randint(5, 600))
+                chats.append({
+                    'video_id': video_id,
+                    'user_id': user_id,
+                    'question': f'What happened near the {rng.choice(words)} around {i % 24:02d}:00?',
+                    'answer': ' '.join(rng.choice(words) for _ in range(60)),
+                    'timestamp': asked,
+                    'model_used': 'qwen-vl-max',
+                })
+                if len(chats) >= 10000:
+                    db.session.execute(db.insert(backend.ChatHistory), chats)
+                    chats = []
+    if chats:
+        db.session.execute(db.insert(backend.ChatHistory), chats)
+    db.session.commit()
+    return {
+        'user_ids': user_ids,
+        'hot_videos': hot_videos,
+        'counts': {
+            'users': len(user_ids),
+            'videos': len(videos),
+            'chats': len(user_ids) * args.chat_videos_per_user * args.chats_per_video,
+        },
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values), math.ceil(fraction * len(sorted_values))) - 1)
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed):
+    values = sorted(latencies)
+    ms = lambda value: round(value * 1000, 2) if value is not None else None
+    return {
+        'requests': len(values) + errors,
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'throughput_rps': round(len(values) / elapsed, 2) if elapsed else None,
+        'mean_ms': ms(sum(values) / len(values)) if values else None,
+        'p50_ms': ms(percentile(values, 0.50)),
+        'p90_ms': ms(percentile(values, 0.90)),
+        'p99_ms': ms(percentile(values, 0.99)),
+        'max_ms': ms(values[-1]) if values else None,
+    }
+
+
+class Client:
+    """One simulated user: a logged-in HTTP session and per-client scenario state"""
+
+    def __init__(self, base_url, user_index, user_id, hot_videos):
+        self.base_url = base_url
+        self.user_index = user_index
+        self.user_id = user_id
+        self.hot_videos = hot_videos
+        self.session = requests.Session()
+        self.cursor = None
+        self.login()
+
+    def login(self):
+        response = self.session.post(f'{self.base_url}/api/login',
+                                     json={'email': f'bench{self.user_index}@example.com', 'password': PASSWORD})
+        response.raise_for_status()
+        return response
+
+
+class Benchmark:
+    def __init__(self, base_url, seeded, args):
+        self.base_url = base_url
+        self.seeded = seeded
+        self.args = args
+        self.sample_video = None
+        self.counter = 0
+        self.counter_lock = threading.Lock()
+
+    def next_number(self):
+        with self.counter_lock:
+            self.counter += 1
+            return self.counter
+
+    def make_clients(self):
+        user_ids = self.seeded['user_ids']
+        return [Client(self.base_url, i % len(user_ids), user_ids[i % len(user_ids)],
+                       self.seeded['hot_videos'][user_ids[i % len(user_ids)]])
+                for i in range(self.args.concurrency)]
+
+    def request(self, client, scenario):
+        """Run one operation of `scenario`; returns True on the expected response"""
+        url = self.base_url
+        if scenario == 'register':
+            n = self.next_number()
+            response = requests.post(f'{url}/api/register', json={
+                'email': f'new{n}@example.com', 'username': f'new{n}', 'password': PASSWORD})
+            return response.status_code == 201
+        if scenario == 'login':
+            return client.login().status_code == 200
+        if scenario == 'list_videos':
+            response = client.session.get(f'{url}/api/videos', params={'per_page': 20})
+            return response.status_code == 200
+        if scenario == 'list_videos_cursor':
+            # Walk the whole library page by page, starting over at the end
+            params = {'per_page': 20, 'cursor': client.cursor} if client.cursor else {'per_page': 20, 'include_total': 'false'}
+            response = client.session.get(f'{url}/api/videos', params=params)
+            if response.status_code != 200:
+                return False
+            client.cursor = response.json()['pagination'].get('next_cursor')
+            return True
+        if scenario == 'chat_history':
+            video_id = random.choice(client.hot_videos)
+            response = client.session.get(f'{url}/api/chat_history/{video_id}', params={'limit': 50})
+            return response.status_code == 200
+        if scenario == 'chat_history_full':
+            video_id = random.choice(client.hot_videos)
+            return client.session.get(f'{url}/api/chat_history/{video_id}').status_code == 200
+        if scenario == 'upload':
+            files = {'file': (f'bench_{self.next_number()}.mp4', self.sample_video, 'video/mp4')}
+            return client.session.post(f'{url}/api/upload_video', files=files).status_code == 201
+        if scenario in ('analyze_video', 'analyze_video_cached'):
+            cached = scenario == 'analyze_video_cached'
+            question = 'What happened at the gate?' if cached else f'What happened at the gate? #{self.next_number()}'
+            response = client.session.post(f'{url}/api/analyze_video', json={
+                'video_id': client.hot_videos[0], 'question': question, 'bypass_cache': not cached})
+            if response.status_code == 200:
+                return True
+            if response.status_code != 202:
+                return False
+            # Time the whole round trip: queueing, the model call and storing the answer
+            job_id = response.json()['job_id']
+            deadline = time.monotonic() + 120
+            while time.monotonic() < deadline:
+                result = client.session.get(f'{url}/api/jobs/{job_id}/result')
+                if result.status_code != 202:
+                    return result.status_code == 200
+                time.sleep(self.args.poll_interval)
+            return False
+        raise ValueError(f'Unknown scenario: {scenario}')
+
+    def run(self, scenario):
+        clients = self.make_clients()
+        if scenario == 'upload' and self.sample_video is None:
+            self.sample_video = make_sample_video(os.path.join(tempfile.gettempdir(), 'cctv_bench_sample.mp4'))
+        if scenario == 'analyze_video_cached':
+            # Prime the answer cache so every measured request is a hit
+            for client in clients:
+                self.request(client, scenario)
+        requests_per_client = max(1, self.args.requests // len(clients))
+        latencies = []
+        errors = [0]
+        lock = threading.Lock()
+
+        def worker(client):
+            for _ in range(requests_per_client):
+                start = time.perf_counter()
+                try:
+                    ok = self.request(client, scenario)
+                except requests.RequestException:
+                    ok = False
+                elapsed = time.perf_counter() - start
+                with lock:
+                    if ok:
+                        latencies.append(elapsed)
+                    else:
+                        errors[0] += 1
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(clients)) as pool:
+            list(pool.map(worker, clients))
+        return summarize(latencies, errors[0], time.perf_counter() - start)
+
+
+def compare_results(baseline, current, tolerance):
+    """Print per-scenario changes against a baseline run; returns the scenarios that regressed"""
+    regressions = []
+    print(f"\n{'scenario':<22}{'p50 ms':>26}{'p99 ms':>26}{'req/s':>26}")
+    for name, result in current['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            continue
+        cells = []
+        for key in ('p50_ms', 'p99_ms', 'throughput_rps'):
+            old, new = before.get(key), result.get(key)
+            change = (new - old) / old if old and new is not None else 0.0
+            cells.append(f'{old}->{new} ({change:+.0%})')
+            worse = change > tolerance if key != 'throughput_rps' else change < -tolerance
+            if key != 'p50_ms' and worse:
+                regressions.append(f'{name} {key}')
+        print(f'{name:<22}' + ''.join(f'{cell:>26}' for cell in cells))
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the backend API against a seeded temporary database')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Comma-separated scenarios to run')
+    parser.add_argument('--concurrency', type=int, default=8, help='Simultaneous clients')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per scenario (split across clients)')
+    parser.add_argument('--users', type=int, default=10, help='Seeded users')
+    parser.add_argument('--videos-per-user', type=int, default=2000, help='Seeded videos per user')
+    parser.add_argument('--chat-videos-per-user', type=int, default=5, help='Videos per user given a chat history')
+    parser.add_argument('--chats-per-video', type=int, default=1000, help='Chat messages per such video')
+    parser.add_argument('--model-delay', type=float, default=0.2, help='Seconds the stand-in model takes to answer')
+    parser.add_argument('--failing-models', default='', help='Comma-separated models the stand-in answers with 503, to measure fallback')
+    parser.add_argument('--poll-interval', type=float, default=0.05, help='Seconds between analysis result polls')
+    parser.add_argument('--database-url', default=None, help='Benchmark against this database instead of a temporary SQLite file')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for the generated data')
+    parser.add_argument('--output', default=None, help='Result file (default: benchmark-<time>.json)')
+    parser.add_argument('--compare', default=None, help='Baseline result file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative p99/throughput regression')
+    args = parser.parse_args()
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    workdir = tempfile.mkdtemp(prefix='cctv-bench-')
+    StubModelHandler.delay = args.model_delay
+    StubModelHandler.failing_models = {model.strip() for model in args.failing_models.split(',') if model.strip()}
+    model_server = start_server(ThreadingHTTPServer(('127.0.0.1', 0), StubModelHandler))
+    # The app reads its configuration at import time
+    os.environ['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ['UPLOAD_FOLDER'] = os.path.join(workdir, 'upload')
+    os.environ['DASHSCOPE_API_KEY'] = 'benchmark'
+    os.environ['DASHSCOPE_BASE_URL'] = f'http://127.0.0.1:{model_server.server_port}/v1'
+    os.environ.setdefault('AUTO_INDEX_VIDEOS', 'false')
+    os.environ.setdefault('SLOW_REQUEST_SECONDS', '3600')
+    os.environ.setdefault('SLOW_JOB_SECONDS', '3600')
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import backend
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    with backend.app.app_context():
+        backend.init_database()
+        seeded = seed_database(backend, args)
+    print(f"Seeded {seeded['counts']} in {seeded['seconds']}s")
+    app_server = start_server(make_server('127.0.0.1', 0, backend.app, threaded=True))
+    base_url = f'http://127.0.0.1:{app_server.server_port}'
+
+    results = {
+        'started_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'database': os.environ['DATABASE_URL'].split(':', 1)[0],
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'database_url')},
+        'seed': seeded['counts'],
+        'seed_seconds': seeded['seconds'],
+        'scenarios': {},
+    }
+    bench = Benchmark(base_url, seeded, args)
+    try:
+        for scenario in scenarios:
+            result = bench.run(scenario)
+            results['scenarios'][scenario] = result
+            print(f"{scenario:<22} {result['throughput_rps']} req/s  p50 {result['p50_ms']}ms  "
+                  f"p90 {result['p90_ms']}ms  p99 {result['p99_ms']}ms  errors {result['errors']}")
+    finally:
+        app_server.shutdown()
+        model_server.shutdown()
+
+    output = args.output or f"benchmark-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.json"
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results written to {output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_results(json.load(f), results, args.tolerance)
+        if regressions:
+            print(f"Regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
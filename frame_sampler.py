@@ -0,0 +1,213 @@
+import json
+import os
+
+import cv2
+import numpy as np
+
+from motion_gate import MotionGate
+
+SAMPLING_STRATEGIES = ('uniform', 'scene', 'motion')
+
+# Frames per second examined when scoring scene changes and motion
+ANALYSIS_FPS = 2.0
+# Grayscale size used for frame differencing
+DIFF_SIZE = (64, 36)
+# Mean absolute pixel difference (0-255) that counts as a scene change
+SCENE_THRESHOLD = 12.0
+
+
+def small_gray(frame):
+    """Downscaled, blurred grayscale copy used for cheap frame differencing"""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    gray = cv2.resize(gray, DIFF_SIZE, interpolation=cv2.INTER_AREA)
+    return cv2.GaussianBlur(gray, (3, 3), 0).astype(np.int16)
+
+
+def score_frames(video_path, analysis_fps=ANALYSIS_FPS, gate=None):
+    """First pass: return (frame_indices, diff_scores, active_flags) for frames sampled at analysis_fps.
+
+    Frames between samples are only grabbed, not converted, so the pass stays cheap.
+    Without a motion gate every frame is flagged active.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError(f'Could not open video: {video_path}')
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    step = max(1, int(round(fps / analysis_fps)))
+    indices, scores, active = [], [], []
+    previous = None
+    index = 0
+    try:
+        while True:
+            if index % step:
+                if not cap.grab():
+                    break
+            else:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                current = small_gray(frame)
+                score = float(np.mean(np.abs(current - previous))) if previous is not None else 0.0
+                indices.append(index)
+                scores.append(score)
+                active.append(gate.check(frame) if gate is not None else True)
+                previous = current
+            index += 1
+    finally:
+        cap.release()
+    return indices, np.array(scores, dtype=np.float32), active
+
+
+def select_uniform(indices, max_frames):
+    if len(indices) <= max_frames:
+        return list(indices)
+    positions = np.linspace(0, len(indices) - 1, max_frames).round().astype(int)
+    return [indices[p] for p in sorted(set(positions.tolist()))]
+
+
+def select_scene(indices, scores, max_frames, min_frames=4, threshold=SCENE_THRESHOLD):
+    """Keep the first frame and the strongest scene cuts, padded with uniform frames for static footage"""
+    if not indices:
+        return []
+    min_frames = min(min_frames, max_frames)
+    cuts = [i for i in range(1, len(indices)) if scores[i] >= threshold]
+    cuts = sorted(cuts, key=lambda i: scores[i], reverse=True)[:max_frames - 1]
+    selected = {indices[0]} | {indices[i] for i in cuts}
+    if len(selected) < min(min_frames, len(indices)):
+        for index in select_uniform(indices, min_frames):
+            if len(selected) >= min_frames:
+                break
+            selected.add(index)
+    return sorted(selected)
+
+
+def select_motion(indices, scores, max_frames):
+    """Place frames at equal steps of cumulative motion so busy stretches get more frames"""
+    if len(indices) <= max_frames:
+        return list(indices)
+    weights = scores + max(float(scores.mean()), 1.0) * 0.1  # keep some coverage of idle stretches
+    cdf = np.cumsum(weights)
+    targets = (np.arange(max_frames) + 0.5) / max_frames * cdf[-1]
+    positions = np.searchsorted(cdf, targets)
+    return sorted({indices[min(p, len(indices) - 1)] for p in positions.tolist()})
+
+
+def write_frames(video_path, frame_indices, output_dir, jpeg_quality=80, max_width=768):
+    """Second pass: decode only the selected frames and store them as compressed JPEGs"""
+    wanted = set(frame_indices)
+    last = max(wanted) if wanted else -1
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    frames = []
+    index = 0
+    try:
+        while index <= last:
+            if index not in wanted:
+                if not cap.grab():
+                    break
+                index += 1
+                continue
+            ret, frame = cap.read()
+            if not ret:
+                break
+            height, width = frame.shape[:2]
+            if width > max_width:
+                frame = cv2.resize(frame, (max_width, int(height * max_width / width)), interpolation=cv2.INTER_AREA)
+            path = os.path.join(output_dir, f'frame_{index:07d}.jpg')
+            cv2.imwrite(path, frame, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+            frames.append({'path': path, 'frame_index': index, 'timestamp': round(index / fps, 2)})
+            index += 1
+    finally:
+        cap.release()
+    return frames
+
+
+def extract_keyframes(video_path, output_dir, strategy='scene', max_frames=16, jpeg_quality=80, max_width=768,
+                      motion_sensitivity=None, stats=None):
+    """Extract a bounded keyframe list once per (video, strategy, max_frames) and reuse it afterwards.
+
+    With `motion_sensitivity`, idle stretches found by a MotionGate are excluded before
+    selection (the first frame is always kept for context). When `stats` is a dict it
+    receives 'frames_considered' and 'frames_idle' for a fresh extraction.
+
+    Returns a list of {'path', 'frame_index', 'timestamp'} dicts in playback order.
+    """
+    if strategy not in SAMPLING_STRATEGIES:
+        raise ValueError(f'Unknown sampling strategy: {strategy}')
+    manifest_path = os.path.join(output_dir, 'manifest.json')
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if all(os.path.exists(frame['path']) for frame in manifest['frames']):
+            return manifest['frames']
+
+    os.makedirs(output_dir, exist_ok=True)
+    gate = MotionGate(motion_sensitivity) if motion_sensitivity is not None else None
+    indices, scores, active = score_frames(video_path, gate=gate)
+    if stats is not None:
+        stats['frames_considered'] = len(indices)
+        stats['frames_idle'] = active.count(False)
+    if gate is not None and indices:
+        keep = [0] + [i for i in range(1, len(indices)) if active[i]]
+        indices = [indices[i] for i in keep]
+        scores = scores[keep]
+    if strategy == 'uniform':
+        selected = select_uniform(indices, max_frames)
+    elif strategy == 'scene':
+        selected = select_scene(indices, scores, max_frames)
+    else:
+        selected = select_motion(indices, scores, max_frames)
+
+    frames = write_frames(video_path, selected, output_dir, jpeg_quality, max_width)
+    # Write the manifest last so a crashed extraction is redone next time
+    with open(manifest_path, 'w') as f:
+        json.dump({'strategy': strategy, 'max_frames': max_frames, 'frames': frames}, f)
+    return frames
+
+
+def extract_segments(video_path, output_dir, segment_seconds=10.0, frames_per_segment=4, jpeg_quality=80,
+                     max_width=768, motion_sensitivity=None):
+    """Split a video into fixed-length segments with a few keyframes each, for captioning.
+
+    Segments where the motion gate saw no activity get no frames. Cached via a manifest
+    like extract_keyframes. Returns a list of
+    {'index', 'start', 'end', 'active', 'frames'} dicts in playback order.
+    """
+    manifest_path = os.path.join(output_dir, 'segments.json')
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if all(os.path.exists(frame['path']) for segment in manifest['segments'] for frame in segment['frames']):
+            return manifest['segments']
+
+    os.makedirs(output_dir, exist_ok=True)
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    duration = (cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0) / fps
+    cap.release()
+    gate = MotionGate(motion_sensitivity) if motion_sensitivity is not None else None
+    indices, scores, active = score_frames(video_path, gate=gate)
+
+    groups = {}
+    for position, index in enumerate(indices):
+        groups.setdefault(int(index / fps // segment_seconds), []).append(position)
+    segments, selected = [], []
+    for number in sorted(groups):
+        positions = groups[number]
+        is_active = any(active[p] for p in positions)
+        chosen = select_scene([indices[p] for p in positions], scores[positions], frames_per_segment) if is_active else []
+        selected.extend(chosen)
+        segments.append({
+            'index': number,
+            'start': round(number * segment_seconds, 2),
+            'end': round(min((number + 1) * segment_seconds, max(duration, (indices[positions[-1]] + 1) / fps)), 2),
+            'active': is_active,
+            'frame_indices': chosen,
+        })
+
+    frames = {frame['frame_index']: frame for frame in write_frames(video_path, selected, output_dir, jpeg_quality, max_width)}
+    for segment in segments:
+        segment['frames'] = [frames[i] for i in segment.pop('frame_indices') if i in frames]
+    with open(manifest_path, 'w') as f:
+        json.dump({'segment_seconds': segment_seconds, 'segments': segments}, f)
+    return segments
@@ -0,0 +1,66 @@
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+# Production server settings, all overridable from the environment:
+#   gunicorn -c gunicorn.conf.py backend:app
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# Model calls spend most of their time waiting on the network, so each worker process runs
+# several request threads; processes add CPU parallelism for frame extraction and search
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 4)))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# Seconds a request may take before its worker is restarted, and seconds workers get to finish
+# in-flight requests on shutdown or reload (SIGHUP)
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# Recycle workers after this many requests (0 = never); background jobs interrupted by a
+# recycle are picked up again once STALE_WORK_SECONDS have passed
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 50))
+
+# Restart workers when source files change (development only)
+reload = os.environ.get('GUNICORN_RELOAD', 'false').lower() == 'true'
+
+# Access log path ('-' for stdout); set it empty to turn the access log off
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-') or None
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+# Workers write their Prometheus samples here so /metrics on any worker reports all of them
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'cctv-metrics'))
+
+
+def on_starting(server):
+    # Samples left by a previous server would otherwise be counted again
+    metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+    # Migrate once, before any worker exists; a separate process keeps the app (and its
+    # database connections and thread pools) out of the master that workers fork from
+    env = {key: value for key, value in os.environ.items() if key != 'PROMETHEUS_MULTIPROC_DIR'}
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'backend', 'init-db'], check=True, env=env)
+
+
+def post_worker_init(worker):
+    # Every worker offers to resume pending work; claims in the database decide which one runs each item
+    from backend import app, resume_pending_jobs, resume_pending_ingestion, resume_pending_whatsapp_messages, schedule_embedding_sync
+    with app.app_context():
+        resume_pending_jobs()
+        resume_pending_ingestion()
+        resume_pending_whatsapp_messages()
+    # Embed anything saved while no server was running and load this worker's search index
+    schedule_embedding_sync()
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -67,8 +67,10 @@ def get_cached_videos(params):
         resp = requests.get(f"{API_URL}/videos", params=params, cookies={"session": st.session_state.get('auth_token')})
         if resp.status_code == 200:
             data = resp.json()
-            # Cache the result
-            cache[cache_key] = (data, current_time)
+            # Cache the result, unless uploads are still processing or indexing so their state refreshes
+            uploads = [v for v in data.get('videos', []) if v.get('video_type') == 'upload']
+            if all(v.get('is_processed', True) and v.get('index_status') not in ('queued', 'indexing') for v in uploads):
+                cache[cache_key] = (data, current_time)
             return data
         else:
             return None
@@ -114,6 +116,83 @@ def invalidate_cache(cache_type=None):
         if 'chat_cache' in st.session_state:
             st.session_state['chat_cache'] = {}
 
+def stream_analysis(request_data, placeholder):
+    """Stream an answer from /analyze_video/stream into the placeholder as it is generated.
+
+    Returns the final `done` event, or {'status': 'failed', 'error': ...}.
+    """
+    resp = requests.post(f"{API_URL}/analyze_video/stream", json=request_data, stream=True, timeout=(10, 300),
+                         cookies={"session": st.session_state.get('auth_token')})
+    if resp.status_code != 200:
+        return {'status': 'failed', 'error': resp.text}
+    answer = ""
+    event = None
+    result = {'status': 'failed', 'error': 'The answer stream ended unexpectedly'}
+    with resp:
+        for line in resp.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data = json.loads(line[len("data:"):])
+                if event == 'token':
+                    answer += data.get('text', '')
+                    placeholder.markdown(answer + "▌")
+                elif event == 'done':
+                    result = data
+                elif event == 'error':
+                    result = {'status': 'failed', 'error': data.get('error')}
+    placeholder.markdown(answer)
+    return result
+
+def upload_video_in_chunks(uploaded_file, progress_bar, status_text, max_retries=3):
+    """Upload a file through the resumable chunk API, resuming a previous attempt when possible"""
+    cookies = {"session": st.session_state.get('auth_token')}
+    uploads = st.session_state.setdefault('pending_uploads', {})
+    upload_key = f"{uploaded_file.name}:{uploaded_file.size}"
+    
+    # Resume an interrupted upload of the same file, otherwise start a new one
+    upload = None
+    if upload_key in uploads:
+        resp = requests.get(f"{API_URL}/uploads/{uploads[upload_key]}", cookies=cookies)
+        if resp.status_code == 200 and resp.json().get('status') == 'active':
+            upload = resp.json()
+    if upload is None:
+        resp = requests.post(f"{API_URL}/uploads", json={"filename": uploaded_file.name, "total_size": uploaded_file.size}, cookies=cookies)
+        if resp.status_code != 201:
+            return resp
+        upload = resp.json()
+        uploads[upload_key] = upload['upload_id']
+    
+    upload_id = upload['upload_id']
+    offset = upload['received_bytes']
+    chunk_size = upload['chunk_size']
+    failures = 0
+    while offset < uploaded_file.size:
+        uploaded_file.seek(offset)
+        chunk = uploaded_file.read(chunk_size)
+        try:
+            resp = requests.put(f"{API_URL}/uploads/{upload_id}", params={"offset": offset}, data=chunk, cookies=cookies, timeout=120)
+        except requests.exceptions.RequestException:
+            resp = None
+        if resp is not None and resp.status_code in (200, 409) and 'received_bytes' in resp.json():
+            # 409 means the server has a different offset; continue from there
+            offset = resp.json()['received_bytes']
+            failures = 0 if resp.status_code == 200 else failures + 1
+        else:
+            failures += 1
+        if failures > max_retries:
+            raise RuntimeError(f"upload interrupted at {offset} of {uploaded_file.size} bytes")
+        progress_bar.progress(min(int(offset * 100 / uploaded_file.size), 99))
+        status_text.text(f"Uploading... {offset // (1024 * 1024)} / {uploaded_file.size // (1024 * 1024)} MB")
+    
+    status_text.text("Finalizing...")
+    resp = requests.post(f"{API_URL}/uploads/{upload_id}/finalize", json={}, cookies=cookies)
+    if resp.status_code == 201:
+        uploads.pop(upload_key, None)
+        progress_bar.progress(100)
+        status_text.text("Upload complete!")
+    return resp
+
 # Notification system
 def add_notification(message, notification_type="info"):
     """Add a notification to the session state"""
@@ -314,18 +393,21 @@ with logo_container:
 st.text("""Chat with your Security Camera using our AI Agent. The quickest way to review your security.""")
 st.caption("""Even at x32 speed, reviewing 24 hours of surveillance footage will take about 45 minutes. Now you can simply ask!""")
 
-# Model selection dropdown with current model as default
+# Model tier dropdown; "auto" lets the backend pick per question
 model_options = {
-    "qwen-vl-max": "Qwen-VL Max (Current - Best for detailed analysis)",
-    "qwen-vl-plus": "Qwen-VL Plus (Balanced performance)"
+    "auto": "Automatic (fast model for summaries, Qwen-VL Max for detail)",
+    "max": "Qwen-VL Max (Best for detailed analysis)",
+    "fast": "Qwen-VL Plus (Faster and cheaper)"
 }
 
 selected_model = st.selectbox(
     "Choose AI Model:",
     options=list(model_options.keys()),
     format_func=lambda x: model_options[x],
-    index=0  # Default to qwen-vl-max (your current model)
+    index=0
 )
+# Sent with analysis requests; omitted for automatic routing
+model_tier = {} if selected_model == "auto" else {"tier": selected_model}
 
 # Fixed FPS setting (hidden from user, optimized for surveillance)
 FIXED_FPS = 1  # Best balance for surveillance footage
@@ -405,7 +487,6 @@ if input_method == "Upload Video File":
             st.error("You cannot upload files larger than 100MB.")
         else:
             if st.button("Upload Video", key="upload_btn"):
-                files = {"file": (uploaded_file.name, uploaded_file, uploaded_file.type)}
                 try:
                     # Progress bar for upload
                     progress_bar = st.progress(0)
@@ -413,24 +494,7 @@ if input_method == "Upload Video File":
                     
                     with st.spinner("Uploading video..."):
                         status_text.text("Preparing upload...")
-                        progress_bar.progress(10)
-                        
-                        # Simulate progress for large files
-                        if uploaded_file.size > 10 * 1024 * 1024:  # Files larger than 10MB
-                            progress_bar.progress(25)
-                            status_text.text("Uploading file...")
-                            time.sleep(0.5)  # Simulate upload time
-                            progress_bar.progress(50)
-                            status_text.text("Processing video...")
-                            time.sleep(0.5)
-                            progress_bar.progress(75)
-                            status_text.text("Finalizing...")
-                        
-                        resp = requests.post(f"{API_URL}/upload_video", files=files, cookies={"session": st.session_state.get('auth_token')})
-                        
-                        progress_bar.progress(100)
-                        status_text.text("Upload complete!")
-                        time.sleep(0.5)
+                        resp = upload_video_in_chunks(uploaded_file, progress_bar, status_text)
                         
                     if resp.status_code == 201:
                         invalidate_cache('videos')  # Invalidate video cache
@@ -442,7 +506,7 @@ if input_method == "Upload Video File":
                         st.toast(resp.json().get('error', 'Upload failed.'), icon="❌")
                 except Exception as e:
                     add_notification(f"Error uploading video: {e}", "error")
-                    st.toast(f"Error: {e}", icon="❌")
+                    st.toast(f"Error: {e}. Click Upload Video again to resume.", icon="❌")
                 finally:
                     # Clear progress indicators
                     progress_bar.empty()
@@ -479,6 +543,26 @@ else:
 # List user's videos
 st.header("Your Videos")
 
+# Search across what was seen and asked in all videos
+st.subheader("🔎 Search Your Footage")
+footage_query = st.text_input("Describe what you're looking for", placeholder="e.g. delivery driver at the front door", key="footage_search")
+if footage_query:
+    try:
+        resp = requests.get(f"{API_URL}/search", params={"q": footage_query, "limit": 10}, cookies={"session": st.session_state.get('auth_token')})
+        if resp.status_code == 200:
+            results = resp.json().get('results', [])
+            if not results:
+                st.info("No matching moments found.")
+            for hit in results:
+                where = f" @ {hit['timestamp']}" if hit['kind'] == 'segment' else ""
+                st.markdown(f"**{hit['video_name']}**{where} — {hit['text']}")
+                if hit['kind'] == 'chat':
+                    st.caption(f"From your question: {hit['question']}")
+        else:
+            st.error(resp.json().get('error', 'Search failed.'))
+    except Exception as e:
+        st.error(f"Error searching footage: {e}")
+
 # Video History Section
 st.subheader("📹 Your Video History")
 
@@ -492,19 +576,28 @@ with col3:
     favorite_filter = st.selectbox("⭐ Filter by favorite", ["All", "Favorites", "Not Favorites"])
 
 # Pagination controls
-col1, col2 = st.columns([1, 1])
-with col1:
-    per_page = st.selectbox("Items per page", [5, 10, 20, 50], index=1)
-with col2:
-    current_page = st.number_input("Page", min_value=1, value=1, step=1)
+per_page = st.selectbox("Items per page", [5, 10, 20, 50], index=1)
+
+# Pages are walked with the API's keyset cursors; the stack holds the cursor for each page after
+# the first (ranked name search has none, so it pages by number instead)
+video_filters = (search_query, type_filter, favorite_filter, per_page)
+if st.session_state.get('video_filters') != video_filters:
+    st.session_state['video_filters'] = video_filters
+    st.session_state['video_cursors'] = []
+video_cursors = st.session_state['video_cursors']
+page_number = len(video_cursors) + 1
 
 # Build API parameters
 params = {
-    'page': current_page,
-    'per_page': per_page
+    'per_page': per_page,
+    # Only the first page pays for the total count
+    'include_total': 'true' if page_number == 1 else 'false'
 }
 if search_query:
     params['search'] = search_query
+    params['page'] = page_number
+elif video_cursors:
+    params['cursor'] = video_cursors[-1]
 if type_filter != "All":
     params['type'] = type_filter
 if favorite_filter == "Favorites":
@@ -518,37 +611,66 @@ try:
     if data:
         videos = data.get('videos', [])
         pagination = data.get('pagination', {})
+        if page_number == 1:
+            st.session_state['video_total'] = pagination.get('total')
         
         if not videos:
             st.info("No videos found matching your criteria.")
         else:
-            st.write(f"Showing {len(videos)} of {pagination.get('total', 0)} video(s) (Page {pagination.get('page', 1)} of {pagination.get('pages', 1)})")
+            total = st.session_state.get('video_total')
+            of_total = f" of {total}" if total is not None else ""
+            st.write(f"Showing {len(videos)}{of_total} video(s) (Page {page_number})")
             
             # Pagination navigation
-            if pagination.get('pages', 1) > 1:
+            if page_number > 1 or pagination.get('has_next', False):
                 col1, col2, col3, col4 = st.columns([1, 1, 1, 1])
                 with col1:
-                    if pagination.get('has_prev', False):
+                    if page_number > 1:
                         if st.button("← Previous", key="prev_page"):
-                            st.session_state['current_page'] = current_page - 1
+                            video_cursors.pop()
                             st.rerun()
                 with col2:
-                    st.write(f"Page {pagination.get('page', 1)}")
+                    st.write(f"Page {page_number}")
                 with col3:
                     if pagination.get('has_next', False):
                         if st.button("Next →", key="next_page"):
-                            st.session_state['current_page'] = current_page + 1
+                            video_cursors.append(pagination.get('next_cursor'))
                             st.rerun()
                 with col4:
                     if st.button("First", key="first_page"):
-                        st.session_state['current_page'] = 1
+                        video_cursors.clear()
                         st.rerun()
             
             for v in videos:
                 # Sort videos: favorites first, then by upload date
                 star_icon = "⭐" if v.get('is_favorite', False) else "☆"
-                with st.expander(f"{star_icon} {v['video_name']} ({v['video_type']})"):
+                processing = v['video_type'] == 'upload' and not v.get('is_processed', False)
+                status_label = " ⏳ Processing..." if processing and not v.get('processing_error') else ""
+                with st.expander(f"{star_icon} {v['video_name']} ({v['video_type']}){status_label}"):
                     st.write(f"Uploaded: {v['upload_date']}")
+                    if v.get('processing_error'):
+                        st.warning(f"Processing failed: {v['processing_error']}")
+                    elif processing:
+                        st.info("Processing video (duration, thumbnail and keyframes)...")
+                    if v['video_type'] == 'upload' and v.get('is_processed'):
+                        index_status = v.get('index_status') or 'none'
+                        if index_status == 'indexed':
+                            st.caption("🗂️ Timeline indexed: questions are answered from stored segment captions.")
+                        elif index_status in ('queued', 'indexing'):
+                            st.caption("🗂️ Building timeline index...")
+                        elif st.button("Build timeline index" if index_status == 'none' else "Retry timeline index", key=f"index_{v['id']}"):
+                            try:
+                                resp = requests.post(f"{API_URL}/video/{v['id']}/index", cookies={"session": st.session_state.get('auth_token')})
+                                if resp.status_code == 202:
+                                    invalidate_cache('videos')
+                                    st.toast("Indexing started", icon="🗂️")
+                                    st.rerun()
+                                else:
+                                    st.error(resp.json().get('error', 'Failed to start indexing.'))
+                            except Exception as e:
+                                st.error(f"Error starting indexing: {e}")
+                    if v.get('duration') is not None:
+                        st.write(f"Duration: {v['duration']} seconds")
                     st.write(f"Size: {v['file_size']} bytes")
                     st.write(f"Type: {v['video_type']}")
                     st.write(f"Source: {v['file_path_or_url']}")
@@ -615,11 +737,20 @@ try:
                     
                     # Chat history for this video
                     st.subheader("💬 Chat History")
-                    chat_history = get_cached_chat_history(v['id'])
+                    chat_search = st.text_input("Search this video's Q&A", key=f"chat_search_{v['id']}")
+                    if chat_search:
+                        # Ranked full-text matches; not cached since they change with every keystroke
+                        resp = requests.get(f"{API_URL}/chat_history/{v['id']}", params={"search": chat_search},
+                                            cookies={"session": st.session_state.get('auth_token')})
+                        chat_history = resp.json() if resp.status_code == 200 else None
+                    else:
+                        chat_history = get_cached_chat_history(v['id'])
                     chats = chat_history.get('chats', []) if isinstance(chat_history, dict) else (chat_history or [])
                     if chats:
                         for chat in chats:
                             with st.expander(f"Q: {chat['question']} - {chat['timestamp']}"):
+                                if chat.get('snippet'):
+                                    st.caption(chat['snippet'])
                                 st.write(f"**Question:** {chat['question']}")
                                 st.write(f"**Answer:** {chat['answer']}")
                                 st.write(f"**Timestamp:** {chat['timestamp']}")
@@ -672,48 +803,76 @@ try:
                     if selected_prompt != "Select a prompt...":
                         user_question = selected_prompt
                     
+                    sampling_options = {
+                        "scene": "Scene changes (default)",
+                        "motion": "Motion-weighted",
+                        "uniform": "Evenly spaced",
+                        "none": "Full video"
+                    }
+                    sampling = st.selectbox(
+                        "Frames sent to the AI:",
+                        options=list(sampling_options.keys()),
+                        format_func=lambda x: sampling_options[x],
+                        key=f"sampling_{v['id']}"
+                    )
+                    bypass_cache = st.checkbox("Ignore cached answers", key=f"bypass_cache_{v['id']}")
+                    
                     if st.button("Ask AI", key=f"ask_{v['id']}"):
                         if user_question:
-                            with st.spinner("Analyzing video..."):
-                                try:
-                                    # Prepare the request
-                                    request_data = {
-                                        "video_id": v['id'],
-                                        "question": user_question
-                                    }
-                                    
-                                    resp = requests.post(f"{API_URL}/analyze_video", 
-                                                       json=request_data,
-                                                       cookies={"session": st.session_state.get('auth_token')})
-                                    
-                                    if resp.status_code == 200:
-                                        result = resp.json()
-                                        answer = result.get('answer', 'No answer received.')
-                                        
-                                        # Add to chat history
-                                        chat_data = {
-                                            "video_id": v['id'],
-                                            "question": user_question,
-                                            "answer": answer
-                                        }
-                                        
-                                        chat_resp = requests.post(f"{API_URL}/add_chat", 
-                                                                 json=chat_data,
-                                                                 cookies={"session": st.session_state.get('auth_token')})
-                                        
-                                        if chat_resp.status_code == 200:
-                                            invalidate_cache('chat')
-                                            add_notification("Analysis completed!", "success")
-                                            st.toast("Analysis completed!", icon="✅")
-                                            st.rerun()
-                                        else:
-                                            st.error("Failed to save chat history.")
-                                    else:
-                                        st.error(f"Analysis failed: {resp.text}")
-                                except Exception as e:
-                                    st.error(f"Error analyzing video: {e}")
+                            try:
+                                # Prepare the request
+                                request_data = {
+                                    "video_id": v['id'],
+                                    "question": user_question,
+                                    "sampling": sampling,
+                                    "bypass_cache": bypass_cache,
+                                    **model_tier
+                                }
+                                
+                                # Show the answer as the model writes it; the backend saves it to chat history
+                                with st.chat_message("assistant"):
+                                    answer_placeholder = st.empty()
+                                    answer_placeholder.markdown("_Analyzing video..._")
+                                    job = stream_analysis(request_data, answer_placeholder)
+                                
+                                if job.get('status') == 'completed':
+                                    invalidate_cache('chat')
+                                    add_notification("Analysis completed!", "success")
+                                    st.toast("Analysis completed!", icon="✅")
+                                else:
+                                    st.error(f"Analysis failed: {job.get('error')}")
+                            except Exception as e:
+                                st.error(f"Error analyzing video: {e}")
                         else:
                             st.warning("Please enter a question.")
+                    
+                    # Several predefined prompts answered together in one model call
+                    batch_prompts = st.multiselect(
+                        "Or ask several prompts at once:",
+                        predefined_prompts,
+                        key=f"batch_prompts_{v['id']}"
+                    )
+                    if st.button("Ask selected prompts", key=f"ask_batch_{v['id']}", disabled=not batch_prompts):
+                        with st.spinner(f"Analyzing video for {len(batch_prompts)} prompts..."):
+                            try:
+                                resp = requests.post(f"{API_URL}/analyze_video/batch",
+                                                   json={
+                                                       "video_id": v['id'],
+                                                       "questions": batch_prompts,
+                                                       "sampling": sampling,
+                                                       "bypass_cache": bypass_cache,
+                                                       **model_tier
+                                                   },
+                                                   cookies={"session": st.session_state.get('auth_token')})
+                                if resp.status_code == 200:
+                                    invalidate_cache('chat')
+                                    add_notification(f"Answered {len(batch_prompts)} prompts!", "success")
+                                    st.toast(f"Answered {len(batch_prompts)} prompts!", icon="✅")
+                                    st.rerun()
+                                else:
+                                    st.error(f"Analysis failed: {resp.text}")
+                            except Exception as e:
+                                st.error(f"Error analyzing video: {e}")
     else:
         st.error("Failed to fetch videos.")
 except Exception as e:
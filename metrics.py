@@ -0,0 +1,96 @@
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+# Model calls and video processing take far longer than typical web requests
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+REQUEST_LATENCY = Histogram('cctv_http_request_duration_seconds', 'HTTP request latency',
+                            ['method', 'endpoint', 'status'], buckets=BUCKETS)
+JOB_LATENCY = Histogram('cctv_job_duration_seconds', 'Background work latency (analysis jobs, ingestion, indexing, WhatsApp replies)',
+                        ['kind'], buckets=BUCKETS)
+STAGE_LATENCY = Histogram('cctv_stage_duration_seconds', 'Time spent in one stage of a request or job (db, file_io, frames, model, twilio)',
+                          ['stage'], buckets=BUCKETS)
+COALESCED_REQUESTS = Counter('cctv_coalesced_requests_total', 'Analysis requests that shared an identical in-flight model call',
+                             ['scope'])
+MODEL_REQUESTS = Counter('cctv_model_requests_total', 'Model calls by model and outcome (ok, error)', ['model', 'outcome'])
+MODEL_LATENCY = Histogram('cctv_model_duration_seconds', 'Model call latency by model', ['model'], buckets=BUCKETS)
+ROUTING_DECISIONS = Counter('cctv_model_routing_total', 'Model tier chosen for requests, with the rule that chose it', ['tier', 'reason'])
+SCHEDULER_QUEUE_DEPTH = Gauge('cctv_scheduler_queue_depth', 'Model calls waiting for a slot, by work class', ['work_class'],
+                              multiprocess_mode='livesum')
+SCHEDULER_WAIT = Histogram('cctv_scheduler_wait_seconds', 'Time model calls waited for a slot, by work class', ['work_class'],
+                           buckets=BUCKETS)
+SCHEDULER_EXPIRED = Counter('cctv_scheduler_expired_total', 'Model calls dropped because their deadline passed while queued',
+                            ['work_class'])
+SLOW_OPERATIONS = Counter('cctv_slow_operations_total', 'Requests and jobs slower than their slow-log threshold', ['kind'])
+
+# Stage totals of the request or job running on this thread
+_trace = threading.local()
+
+
+def start_trace():
+    _trace.stages = {}
+
+
+def finish_trace():
+    """Stop collecting and return {stage: (seconds, calls)} for the current thread"""
+    stages = getattr(_trace, 'stages', None) or {}
+    _trace.stages = None
+    return stages
+
+
+def record(stage, seconds):
+    """Add one timed call of `stage` to the histogram and to the current trace, if any"""
+    STAGE_LATENCY.labels(stage).observe(seconds)
+    stages = getattr(_trace, 'stages', None)
+    if stages is not None:
+        total, calls = stages.get(stage, (0.0, 0))
+        stages[stage] = (total + seconds, calls + 1)
+
+
+@contextmanager
+def span(stage):
+    """Time a block as one call of `stage`"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+def traced_job(kind, slow_seconds):
+    """Decorate a background job so its latency is observed and slow runs are logged with a stage breakdown"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start_trace()
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                stages = finish_trace()
+                JOB_LATENCY.labels(kind).observe(elapsed)
+                if elapsed >= slow_seconds:
+                    SLOW_OPERATIONS.labels(kind).inc()
+                    label = ' '.join(str(arg) for arg in args)
+                    print(f"Slow {kind} job {label}: {elapsed:.3f}s {format_stages(stages)}")
+        return wrapper
+    return decorator
+
+
+def format_stages(stages):
+    return ' '.join(f'{stage}={seconds:.3f}s/{calls}' for stage, (seconds, calls) in sorted(stages.items(), key=lambda item: -item[1][0]))
+
+
+def render_metrics():
+    """Prometheus text exposition; merges every worker's samples when PROMETHEUS_MULTIPROC_DIR is set"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,205 @@
+"""Initial schema
+
+Adds the tables, columns and indexes introduced since the baseline schema.
+Databases created with db.create_all() before migrations existed may already
+have some of them, so tables are completed rather than assumed to be missing.
+
+Revision ID: f43704a5ffb2
+Revises: fb208f3f454e
+Create Date: 2026-10-17 02:55:48.282369
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f43704a5ffb2'
+down_revision = 'fb208f3f454e'
+branch_labels = None
+depends_on = None
+
+
+def create_or_complete_table(name, *elements, indexes=()):
+    """Create the table, or add the columns and indexes (name, columns) an existing one lacks"""
+    inspector = sa.inspect(op.get_bind())
+    if name not in inspector.get_table_names():
+        op.create_table(name, *elements)
+        missing, existing_indexes = [], set()
+    else:
+        columns = {column['name'] for column in inspector.get_columns(name)}
+        missing = [element for element in elements if isinstance(element, sa.Column) and element.name not in columns]
+        existing_indexes = {index['name'] for index in inspector.get_indexes(name)}
+    new_indexes = [(index_name, columns) for index_name, columns in indexes if index_name not in existing_indexes]
+    if missing or new_indexes:
+        with op.batch_alter_table(name, schema=None) as batch_op:
+            for column in missing:
+                batch_op.add_column(column)
+            for index_name, columns in new_indexes:
+                batch_op.create_index(index_name, columns, unique=False)
+
+
+def upgrade():
+    create_or_complete_table('answer_cache',
+    sa.Column('key', sa.String(length=64), nullable=False),
+    sa.Column('answer', sa.Text(), nullable=False),
+    sa.Column('model_used', sa.String(length=64), nullable=True),
+    sa.Column('hit_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('last_accessed_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('key'),
+    indexes=[(op.f('ix_answer_cache_last_accessed_at'), ['last_accessed_at'])]
+    )
+    create_or_complete_table('camera',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=128), nullable=False),
+    sa.Column('rtsp_url', sa.String(length=512), nullable=False),
+    sa.Column('sampling_rate', sa.Float(), nullable=False),
+    sa.Column('batch_interval', sa.Float(), nullable=False),
+    sa.Column('is_enabled', sa.Boolean(), nullable=False),
+    sa.Column('motion_sensitivity', sa.Float(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.func.now(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('status', sa.String(length=16), nullable=True),
+    sa.Column('fps', sa.Float(), nullable=True),
+    sa.Column('lag_seconds', sa.Float(), nullable=True),
+    sa.Column('frames_read', sa.BigInteger(), nullable=True),
+    sa.Column('frames_sampled', sa.BigInteger(), nullable=True),
+    sa.Column('batches_submitted', sa.Integer(), nullable=True),
+    sa.Column('reconnects', sa.Integer(), nullable=True),
+    sa.Column('frames_gated', sa.BigInteger(), nullable=True),
+    sa.Column('batches_skipped', sa.Integer(), nullable=True),
+    sa.Column('last_frame_at', sa.DateTime(), nullable=True),
+    sa.Column('last_error', sa.String(length=256), nullable=True),
+    sa.Column('status_updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'name')
+    )
+    create_or_complete_table('stream_event',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('camera_name', sa.String(length=128), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=False),
+    sa.Column('ended_at', sa.DateTime(), nullable=False),
+    sa.Column('stream_offset_start', sa.Float(), nullable=True),
+    sa.Column('stream_offset_end', sa.Float(), nullable=True),
+    sa.Column('frame_count', sa.Integer(), nullable=True),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('model_used', sa.String(length=64), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.func.now(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    create_or_complete_table('video',
+    sa.Column('content_hash', sa.String(length=64), nullable=True),
+    sa.Column('processing_error', sa.String(length=256), nullable=True),
+    sa.Column('index_status', sa.String(length=16), nullable=True),
+    sa.Column('indexed_at', sa.DateTime(), nullable=True),
+    indexes=[('ix_video_user_favorite_upload', ['user_id', 'is_favorite', 'upload_date', 'id'])]
+    )
+    create_or_complete_table('chat_history',
+    indexes=[('ix_chat_history_video_user_time', ['video_id', 'user_id', 'timestamp', 'id'])]
+    )
+    create_or_complete_table('embedding',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('video_id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=16), nullable=False),
+    sa.Column('ref_id', sa.Integer(), nullable=False),
+    sa.Column('model', sa.String(length=64), nullable=False),
+    sa.Column('start_time', sa.Float(), nullable=True),
+    sa.Column('end_time', sa.Float(), nullable=True),
+    sa.Column('vector', sa.LargeBinary(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['video_id'], ['video.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('kind', 'ref_id', 'model'),
+    indexes=[('ix_embedding_model_id', ['model', 'id']), (op.f('ix_embedding_video_id'), ['video_id'])]
+    )
+    create_or_complete_table('upload_session',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('filename', sa.String(length=256), nullable=False),
+    sa.Column('total_size', sa.BigInteger(), nullable=False),
+    sa.Column('received_bytes', sa.BigInteger(), nullable=False),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('video_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.func.now(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['video_id'], ['video.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    create_or_complete_table('video_segment',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('video_id', sa.Integer(), nullable=False),
+    sa.Column('segment_index', sa.Integer(), nullable=False),
+    sa.Column('start_time', sa.Float(), nullable=False),
+    sa.Column('end_time', sa.Float(), nullable=False),
+    sa.Column('caption', sa.Text(), nullable=True),
+    sa.Column('has_activity', sa.Boolean(), nullable=False),
+    sa.Column('frames', sa.Text(), nullable=True),
+    sa.Column('model_used', sa.String(length=64), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.func.now(), nullable=True),
+    sa.ForeignKeyConstraint(['video_id'], ['video.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('video_id', 'segment_index'),
+    indexes=[(op.f('ix_video_segment_video_id'), ['video_id'])]
+    )
+    # Flags added after the table first shipped get server defaults so existing rows can be filled
+    create_or_complete_table('analysis_job',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('video_id', sa.Integer(), nullable=False),
+    sa.Column('question', sa.Text(), nullable=False),
+    sa.Column('video_url', sa.String(length=1024), nullable=True),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('answer', sa.Text(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('model_used', sa.String(length=64), nullable=True),
+    sa.Column('sampling', sa.String(length=16), nullable=True),
+    sa.Column('max_frames', sa.Integer(), nullable=True),
+    sa.Column('cache_key', sa.String(length=64), nullable=True),
+    sa.Column('use_index', sa.Boolean(), server_default=sa.true(), nullable=False),
+    sa.Column('answered_from_index', sa.Boolean(), server_default=sa.false(), nullable=False),
+    sa.Column('chat_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.func.now(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('completed_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['chat_id'], ['chat_history.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['video_id'], ['video.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('analysis_job')
+    with op.batch_alter_table('video_segment', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_video_segment_video_id'))
+
+    op.drop_table('video_segment')
+    op.drop_table('upload_session')
+    with op.batch_alter_table('embedding', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_embedding_video_id'))
+        batch_op.drop_index('ix_embedding_model_id')
+
+    op.drop_table('embedding')
+    with op.batch_alter_table('chat_history', schema=None) as batch_op:
+        batch_op.drop_index('ix_chat_history_video_user_time')
+
+    with op.batch_alter_table('video', schema=None) as batch_op:
+        batch_op.drop_index('ix_video_user_favorite_upload')
+        batch_op.drop_column('indexed_at')
+        batch_op.drop_column('index_status')
+        batch_op.drop_column('processing_error')
+        batch_op.drop_column('content_hash')
+
+    op.drop_table('stream_event')
+    op.drop_table('camera')
+    with op.batch_alter_table('answer_cache', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_answer_cache_last_accessed_at'))
+
+    op.drop_table('answer_cache')
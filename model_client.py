@@ -0,0 +1,196 @@
+import os
+import queue
+import random
+import threading
+import time
+
+import httpx
+from openai import OpenAI, APIConnectionError, APIStatusError
+
+from metrics import record, span
+from scheduler import WORK_CLASSES, PriorityScheduler, current_work, run_as
+
+DEFAULT_BASE_URL = 'https://dashscope-intl.aliyuncs.com/compatible-mode/v1'
+
+# Status codes worth retrying (rate limiting and provider-side failures)
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+def is_retryable(error):
+    """Return True for errors a later attempt may succeed on"""
+    if isinstance(error, APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    # Connection resets and timeouts
+    return isinstance(error, APIConnectionError)
+
+
+class ModelClient:
+    """Process-wide Qwen-VL client with pooled keep-alive connections, retries and a concurrency cap
+    shared between work classes by priority (see scheduler.PriorityScheduler)"""
+
+    def __init__(self, api_key, base_url=DEFAULT_BASE_URL, timeout=120.0, connect_timeout=10.0,
+                 max_connections=20, max_keepalive_connections=10, keepalive_expiry=60.0,
+                 max_retries=3, backoff_base=0.5, backoff_max=10.0, max_concurrency=8,
+                 class_limits=None, starvation_seconds=30.0):
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_concurrency = max_concurrency
+        self.scheduler = PriorityScheduler(max_concurrency, class_limits, starvation_seconds)
+        self.http_client = httpx.Client(
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+        )
+        # Retries are handled here so they can share the scheduler and jitter
+        self.client = OpenAI(api_key=api_key, base_url=base_url, http_client=self.http_client, max_retries=0)
+
+    def backoff_delay(self, attempt, error=None):
+        """Full-jitter exponential backoff, honouring Retry-After when the provider sends one"""
+        if isinstance(error, APIStatusError):
+            retry_after = error.response.headers.get('retry-after')
+            if retry_after:
+                try:
+                    return min(float(retry_after), self.backoff_max)
+                except ValueError:
+                    pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def chat_completion(self, retries=None, **kwargs):
+        """Call chat.completions.create, retrying 429/5xx and connection errors (`retries` overrides max_retries)"""
+        return self.call_with_retries(self.client.chat.completions.create, retries, **kwargs)
+
+    def stream_chat_completion(self, retries=None, **kwargs):
+        """Call chat.completions.create with stream=True and yield the answer text as it arrives.
+
+        The upstream response is read on its own thread, which holds the model slot only until the
+        model has finished, however slowly the caller consumes the pieces. Failures before the
+        first token are retried like chat_completion; after that the error is raised, since the
+        caller has already passed part of the answer on.
+        """
+        retries = self.max_retries if retries is None else retries
+        attempt = 0
+        while True:
+            started = False
+            # Unbounded, but an answer is at most a few thousand tokens
+            pieces = queue.SimpleQueue()
+            cancelled = threading.Event()
+            threading.Thread(target=run_as, args=(current_work(), self.read_stream, pieces, cancelled, kwargs),
+                             name='model-stream', daemon=True).start()
+            try:
+                while True:
+                    kind, value, elapsed = pieces.get()
+                    if kind == 'text':
+                        if not started:
+                            record('model_first_token', elapsed)
+                            started = True
+                        yield value
+                        continue
+                    if elapsed is not None:
+                        record('model', elapsed)
+                    if kind == 'error':
+                        raise value
+                    return
+            except Exception as e:
+                if started or attempt >= retries or not is_retryable(e):
+                    raise
+                delay = self.backoff_delay(attempt, e)
+                print(f"Model stream failed ({e.__class__.__name__}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+                attempt += 1
+            finally:
+                # Stop reading when the caller goes away
+                cancelled.set()
+
+    def read_stream(self, pieces, cancelled, kwargs):
+        """Put (kind, value, seconds since the request) tuples on `pieces`: 'text' pieces, then 'done' or 'error'"""
+        start = None
+        try:
+            with self.scheduler.slot():
+                start = time.perf_counter()
+                stream = self.client.chat.completions.create(stream=True, **kwargs)
+                try:
+                    for chunk in stream:
+                        if cancelled.is_set():
+                            break
+                        text = chunk.choices[0].delta.content if chunk.choices else None
+                        if text:
+                            pieces.put(('text', text, time.perf_counter() - start))
+                finally:
+                    stream.close()
+            pieces.put(('done', None, time.perf_counter() - start))
+        except Exception as e:
+            pieces.put(('error', e, None if start is None else time.perf_counter() - start))
+
+    def embeddings(self, **kwargs):
+        """Call embeddings.create with the same retries and concurrency cap"""
+        return self.call_with_retries(self.client.embeddings.create, **kwargs)
+
+    def call_with_retries(self, method, retries=None, **kwargs):
+        retries = self.max_retries if retries is None else retries
+        attempt = 0
+        while True:
+            try:
+                with self.scheduler.slot(), span('model'):
+                    return method(**kwargs)
+            except Exception as e:
+                if attempt >= retries or not is_retryable(e):
+                    raise
+                delay = self.backoff_delay(attempt, e)
+                print(f"Model request failed ({e.__class__.__name__}), retrying in {delay:.2f}s")
+                # Sleep outside the slot so waiting retries don't hold one
+                time.sleep(delay)
+                attempt += 1
+
+    def close(self):
+        self.http_client.close()
+
+
+_model_client = None
+_model_client_lock = threading.Lock()
+
+
+def client_settings_from_env():
+    return {
+        'api_key': os.environ.get('DASHSCOPE_API_KEY'),
+        'base_url': os.environ.get('DASHSCOPE_BASE_URL', DEFAULT_BASE_URL),
+        'timeout': float(os.environ.get('MODEL_TIMEOUT', 120)),
+        'connect_timeout': float(os.environ.get('MODEL_CONNECT_TIMEOUT', 10)),
+        'max_connections': int(os.environ.get('MODEL_MAX_CONNECTIONS', 20)),
+        'max_keepalive_connections': int(os.environ.get('MODEL_MAX_KEEPALIVE', 10)),
+        'max_retries': int(os.environ.get('MODEL_MAX_RETRIES', 3)),
+        'max_concurrency': int(os.environ.get('MODEL_MAX_CONCURRENCY', 8)),
+        # e.g. MODEL_BACKGROUND_LIMIT=2; unset classes keep the scheduler's defaults
+        'class_limits': {work_class: int(os.environ[f'MODEL_{work_class.upper()}_LIMIT'])
+                         for work_class in WORK_CLASSES if os.environ.get(f'MODEL_{work_class.upper()}_LIMIT')},
+        'starvation_seconds': float(os.environ.get('MODEL_STARVATION_SECONDS', 30)),
+    }
+
+
+def get_model_client():
+    """Return the shared model client, creating it from the environment on first use"""
+    global _model_client
+    if _model_client is None:
+        with _model_client_lock:
+            if _model_client is None:
+                settings = client_settings_from_env()
+                if not settings['api_key']:
+                    raise RuntimeError('DASHSCOPE_API_KEY not configured on backend')
+                _model_client = ModelClient(**settings)
+    return _model_client
+
+
+def configure_model_client(**overrides):
+    """Replace the shared client, e.g. to point it at a local fake endpoint"""
+    global _model_client
+    settings = client_settings_from_env()
+    settings.update(overrides)
+    with _model_client_lock:
+        if _model_client is not None:
+            _model_client.close()
+        _model_client = ModelClient(**settings)
+    return _model_client
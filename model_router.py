@@ -0,0 +1,217 @@
+import os
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from openai import APIStatusError
+
+from metrics import MODEL_LATENCY, MODEL_REQUESTS, ROUTING_DECISIONS
+from scheduler import DeadlineExceeded, current_work, run_as
+
+TIER_FAST = 'fast'
+TIER_MAX = 'max'
+TIERS = (TIER_FAST, TIER_MAX)
+
+# Models tried in order for each tier; later ones are fallbacks
+DEFAULT_TIER_MODELS = {
+    TIER_FAST: 'qwen-vl-plus,qwen-vl-max',
+    TIER_MAX: 'qwen-vl-max,qwen-vl-plus',
+}
+
+# Questions that need the strongest model: identification, counting and fine detail
+FORENSIC_PATTERN = re.compile(
+    r'\b(identif\w*|licen[cs]e|plates?|faces?|weapons?|guns?|knife|knives|suspect\w*|suspicious|forensic|exact\w*|'
+    r'precise\w*|detail\w*|colou?rs?|cloth\w*|wearing|tattoo\w*|count|how many|timestamps?|theft|stole\w*|steal\w*|'
+    r'break[- ]?in|intruders?|step by step)\b')
+# Overview questions a faster model answers well
+SUMMARY_PATTERN = re.compile(r'\b(summar\w*|overview|what happen\w*|describe|brief\w*|gist|anything|activit\w*|going on)\b')
+SHORT_QUESTION_WORDS = 15
+
+# Provider errors no other model will get past
+NO_FALLBACK_STATUS_CODES = {400, 401, 403}
+
+
+def choose_tier(question, purpose='analysis'):
+    """Pick the model tier for a request; returns (tier, reason).
+
+    Forensic questions always get the max tier. WhatsApp replies and captions use the fast
+    tier, as do short overview questions from the dashboard.
+    """
+    text = (question or '').lower()
+    if FORENSIC_PATTERN.search(text):
+        decision = (TIER_MAX, 'forensic')
+    elif purpose in ('whatsapp', 'caption'):
+        decision = (TIER_FAST, purpose)
+    elif SUMMARY_PATTERN.search(text) and len(text.split()) <= SHORT_QUESTION_WORDS:
+        decision = (TIER_FAST, 'summary')
+    else:
+        decision = (TIER_MAX, 'default')
+    ROUTING_DECISIONS.labels(*decision).inc()
+    return decision
+
+
+def should_fall_back(error):
+    """True when another model may succeed where this one failed (outages, timeouts, unknown model)"""
+    if isinstance(error, DeadlineExceeded):
+        # Every model waits for the same slots
+        return False
+    if isinstance(error, APIStatusError):
+        return error.status_code not in NO_FALLBACK_STATUS_CODES
+    return True
+
+
+class ModelUnavailableError(Exception):
+    """Every model of a tier failed"""
+
+
+class ModelRouter:
+    """Send each request to its tier's models in order, falling back on failures and slow answers.
+
+    Non-final models get `attempt_timeout` seconds, so a hung model costs a bounded wait before the
+    fallback is tried. With `hedge_after` > 0, a request still unanswered after that many seconds is
+    also sent to the next model and the first answer wins. Callers pass a `route` dict, which is
+    filled with the tier, the model that answered and the number of fallbacks.
+    """
+
+    def __init__(self, tiers, attempt_timeout=45.0, hedge_after=0.0, hedge_workers=8):
+        self.tiers = tiers
+        self.attempt_timeout = attempt_timeout
+        self.hedge_after = hedge_after
+        self.hedge_pool = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix='hedge') if hedge_after > 0 else None
+
+    def candidates(self, tier):
+        models = self.tiers.get(tier) or self.tiers.get(TIER_MAX)
+        if not models:
+            # e.g. MODEL_TIER_FAST="," with MODEL_TIER_MAX empty too
+            raise ModelUnavailableError(f'No models configured for the {tier} tier')
+        return models
+
+    def observe(self, model, outcome, start):
+        MODEL_REQUESTS.labels(model, outcome).inc()
+        MODEL_LATENCY.labels(model).observe(time.perf_counter() - start)
+
+    def attempt(self, call, model, timeout):
+        start = time.perf_counter()
+        try:
+            result = call(model, timeout)
+        except Exception:
+            self.observe(model, 'error', start)
+            raise
+        self.observe(model, 'ok', start)
+        return result
+
+    def complete(self, tier, call, route=None):
+        """Return call(model, timeout) from the first model of the tier that answers"""
+        route = {} if route is None else route
+        route.update(tier=tier, model=None, fallbacks=0)
+        models = self.candidates(tier)
+        if self.hedge_pool and len(models) > 1:
+            return self.hedged(models, call, route)
+        for position, model in enumerate(models):
+            final = position == len(models) - 1
+            try:
+                result = self.attempt(call, model, None if final else self.attempt_timeout)
+            except Exception as e:
+                if not should_fall_back(e):
+                    raise
+                if final:
+                    raise ModelUnavailableError(f'All {tier} models failed, last error: {e}') from e
+                print(f"Model {model} failed ({e.__class__.__name__}), falling back to {models[position + 1]}")
+                route['fallbacks'] += 1
+                continue
+            route['model'] = model
+            return result
+
+    def hedged(self, models, call, route):
+        """Start the first model, add the next one whenever `hedge_after` passes without an answer"""
+        pending = {}
+        queue = list(models)
+        # Hedge threads queue for model slots as the caller's work
+        work = current_work()
+        last_error = None
+        while queue or pending:
+            if queue:
+                model = queue.pop(0)
+                pending[self.hedge_pool.submit(run_as, work, self.attempt, call, model, None)] = model
+                if len(pending) > 1:
+                    route['fallbacks'] += 1
+            done, _ = wait(pending, timeout=self.hedge_after if queue else None, return_when=FIRST_COMPLETED)
+            for future in done:
+                model = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    if not should_fall_back(e):
+                        raise
+                    last_error = e
+                    continue
+                # Slower requests still running are left to finish; their answers are discarded
+                route['model'] = model
+                return result
+        raise ModelUnavailableError(f'All models failed, last error: {last_error}') from last_error
+
+    def stream(self, tier, call, route=None):
+        """Yield the pieces of call(model, timeout) from the first model that starts answering.
+
+        Failures before the first piece fall back to the next model; later ones are raised.
+        """
+        route = {} if route is None else route
+        route.update(tier=tier, model=None, fallbacks=0)
+        models = self.candidates(tier)
+        for position, model in enumerate(models):
+            final = position == len(models) - 1
+            start = time.perf_counter()
+            started = False
+            try:
+                for piece in call(model, None if final else self.attempt_timeout):
+                    if not started:
+                        route['model'] = model
+                        started = True
+                    yield piece
+            except Exception as e:
+                self.observe(model, 'error', start)
+                if started or not should_fall_back(e):
+                    raise
+                if final:
+                    raise ModelUnavailableError(f'All {tier} models failed, last error: {e}') from e
+                print(f"Model {model} failed ({e.__class__.__name__}), falling back to {models[position + 1]}")
+                route['fallbacks'] += 1
+                continue
+            self.observe(model, 'ok', start)
+            return
+
+
+_model_router = None
+_model_router_lock = threading.Lock()
+
+
+def router_settings_from_env():
+    return {
+        'tiers': {
+            tier: [model.strip() for model in os.environ.get(f'MODEL_TIER_{tier.upper()}', models).split(',') if model.strip()]
+            for tier, models in DEFAULT_TIER_MODELS.items()
+        },
+        'attempt_timeout': float(os.environ.get('MODEL_ATTEMPT_TIMEOUT', 45)),
+        'hedge_after': float(os.environ.get('MODEL_HEDGE_SECONDS', 0)),
+    }
+
+
+def get_model_router():
+    """Return the shared router, creating it from the environment on first use"""
+    global _model_router
+    if _model_router is None:
+        with _model_router_lock:
+            if _model_router is None:
+                _model_router = ModelRouter(**router_settings_from_env())
+    return _model_router
+
+
+def configure_model_router(**overrides):
+    """Replace the shared router, e.g. with different tier models"""
+    global _model_router
+    settings = router_settings_from_env()
+    settings.update(overrides)
+    with _model_router_lock:
+        _model_router = ModelRouter(**settings)
+    return _model_router
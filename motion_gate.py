@@ -0,0 +1,69 @@
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """Cheap activity detector used to keep idle CCTV footage away from the model.
+
+    Each frame is downscaled to grayscale and compared both with the previous frame
+    (frame differencing) and with a running MOG2 background model (background
+    subtraction). A frame is active when the changed area exceeds a threshold derived
+    from `sensitivity` (0 = only large changes count, 1 = almost any change counts).
+    """
+
+    def __init__(self, sensitivity=0.5, size=(160, 90), history=120):
+        sensitivity = min(max(float(sensitivity), 0.0), 1.0)
+        self.sensitivity = sensitivity
+        self.size = size
+        # Per-pixel intensity change that counts as "changed"
+        self.pixel_threshold = 8 + 32 * (1 - sensitivity)
+        # Fraction of changed pixels that makes a frame active
+        self.area_threshold = 0.0005 + 0.03 * (1 - sensitivity) ** 2
+        self.subtractor = cv2.createBackgroundSubtractorMOG2(history=history, varThreshold=self.pixel_threshold ** 2 / 4, detectShadows=False)
+        self.kernel = np.ones((3, 3), np.uint8)
+        self.previous = None
+        self.stats = {'frames_seen': 0, 'frames_active': 0, 'windows_seen': 0, 'windows_forwarded': 0}
+
+    def activity(self, frame):
+        """Return the fraction of the (downscaled) frame that changed"""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        gray = cv2.GaussianBlur(cv2.resize(gray, self.size, interpolation=cv2.INTER_AREA), (5, 5), 0)
+        foreground = self.subtractor.apply(gray)
+        if self.previous is None:
+            changed = foreground
+        else:
+            _, difference = cv2.threshold(cv2.absdiff(gray, self.previous), self.pixel_threshold, 255, cv2.THRESH_BINARY)
+            changed = cv2.bitwise_or(difference, foreground)
+        self.previous = gray
+        # Drop isolated speckles (sensor noise, compression artefacts)
+        changed = cv2.morphologyEx(changed, cv2.MORPH_OPEN, self.kernel)
+        return cv2.countNonZero(changed) / changed.size
+
+    def check(self, frame):
+        """Feed the next frame; returns True when it shows activity"""
+        active = self.activity(frame) >= self.area_threshold
+        self.stats['frames_seen'] += 1
+        if active:
+            self.stats['frames_active'] += 1
+        return active
+
+    def select_window(self, flags):
+        """Given per-frame activity flags for a window, return the indices worth forwarding.
+
+        Active frames are kept together with the idle frame just before each burst of
+        activity (for before/after context). An empty list means the whole window is idle
+        and no model call is needed.
+        """
+        self.stats['windows_seen'] += 1
+        keep = [i for i, active in enumerate(flags) if active or (i + 1 < len(flags) and flags[i + 1])]
+        if keep:
+            self.stats['windows_forwarded'] += 1
+        return keep
+
+    def report(self):
+        """Frames and model calls avoided so far"""
+        return {
+            **self.stats,
+            'frames_skipped': self.stats['frames_seen'] - self.stats['frames_active'],
+            'model_calls_avoided': self.stats['windows_seen'] - self.stats['windows_forwarded'],
+        }
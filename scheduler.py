@@ -0,0 +1,187 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import SCHEDULER_EXPIRED, SCHEDULER_QUEUE_DEPTH, SCHEDULER_WAIT
+
+INTERACTIVE = 'interactive'
+WHATSAPP = 'whatsapp'
+BACKGROUND = 'background'
+# Highest priority first: WhatsApp replies have a deadline, dashboard users are waiting, background work can wait
+WORK_CLASSES = (WHATSAPP, INTERACTIVE, BACKGROUND)
+
+
+class DeadlineExceeded(Exception):
+    """The work's deadline passed before a model call could get a slot or answer"""
+
+
+# Work class, owner and deadline of the work running on this thread
+_work = threading.local()
+
+
+@contextmanager
+def scheduled(work_class, owner=None, deadline=None):
+    """Run model calls made in this block as `work_class` work for `owner` (the fair sharing key,
+    e.g. a user id). With `deadline` (seconds from now), calls still queued after that are dropped,
+    and calls that do start are limited to the time left (see deadline_remaining)."""
+    previous = getattr(_work, 'current', None)
+    _work.current = (work_class, owner, None if deadline is None else time.monotonic() + deadline)
+    try:
+        yield
+    finally:
+        _work.current = previous
+
+
+def current_work():
+    """(work_class, owner, deadline) of this thread; request threads default to interactive work"""
+    return getattr(_work, 'current', None) or (INTERACTIVE, None, None)
+
+
+def deadline_remaining():
+    """Seconds left before this thread's work deadline, or None without one"""
+    deadline = current_work()[2]
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def run_as(work, func, *args):
+    """Call func(*args) as `work`, a current_work() value taken from another thread"""
+    previous = getattr(_work, 'current', None)
+    _work.current = work
+    try:
+        return func(*args)
+    finally:
+        _work.current = previous
+
+
+class _Waiter:
+    def __init__(self, work_class, owner, deadline):
+        self.work_class = work_class
+        self.owner = owner
+        self.deadline = deadline
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.event = threading.Event()
+
+
+class PriorityScheduler:
+    """Share a fixed number of model call slots between work classes.
+
+    A free slot goes to the highest priority class that has waiting calls and is below its own
+    limit. Within a class, owners take turns: the one with the fewest calls running, then the one
+    served least recently, goes first, so one user's bulk requests don't hold up everyone else's.
+    A class whose oldest call has waited `starvation_seconds` is served ahead of higher priority
+    classes. Calls whose deadline passes while queued raise DeadlineExceeded instead of running late.
+    """
+
+    def __init__(self, max_concurrency, class_limits=None, starvation_seconds=30.0):
+        self.max_concurrency = max_concurrency
+        # By default background and WhatsApp work each get at most half the slots
+        self.class_limits = {
+            INTERACTIVE: max_concurrency,
+            WHATSAPP: max(1, max_concurrency // 2),
+            BACKGROUND: max(1, max_concurrency // 2),
+        }
+        self.class_limits.update(class_limits or {})
+        self.starvation_seconds = starvation_seconds
+        self.lock = threading.Lock()
+        self.waiting = {work_class: [] for work_class in WORK_CLASSES}
+        self.running = {work_class: {} for work_class in WORK_CLASSES}  # owner -> calls running
+        self.served = {work_class: {} for work_class in WORK_CLASSES}  # owner -> time of the last slot granted
+        self.totals = {work_class: {'granted': 0, 'expired': 0, 'wait_seconds': 0.0} for work_class in WORK_CLASSES}
+
+    @contextmanager
+    def slot(self):
+        """Hold a slot for the duration of the block, as this thread's current work"""
+        work_class, owner, deadline = current_work()
+        self.acquire(work_class, owner, deadline)
+        try:
+            yield
+        finally:
+            self.release(work_class, owner)
+
+    def acquire(self, work_class, owner=None, deadline=None):
+        """Wait for a slot; `deadline` is a time.monotonic() value"""
+        waiter = _Waiter(work_class, owner, deadline)
+        with self.lock:
+            self.waiting[work_class].append(waiter)
+            SCHEDULER_QUEUE_DEPTH.labels(work_class).inc()
+            self.dispatch()
+        while not waiter.event.wait(None if deadline is None else max(0.0, deadline - time.monotonic())):
+            with self.lock:
+                if waiter.granted:
+                    break
+                self.waiting[work_class].remove(waiter)
+                self.totals[work_class]['expired'] += 1
+            SCHEDULER_QUEUE_DEPTH.labels(work_class).dec()
+            SCHEDULER_EXPIRED.labels(work_class).inc()
+            raise DeadlineExceeded(f'No model capacity for {work_class} work before its deadline')
+        waited = time.monotonic() - waiter.enqueued
+        SCHEDULER_WAIT.labels(work_class).observe(waited)
+        with self.lock:
+            self.totals[work_class]['wait_seconds'] += waited
+
+    def release(self, work_class, owner=None):
+        with self.lock:
+            running = self.running[work_class]
+            running[owner] -= 1
+            if not running[owner]:
+                del running[owner]
+                if not any(waiter.owner == owner for waiter in self.waiting[work_class]):
+                    self.served[work_class].pop(owner, None)
+            self.dispatch()
+
+    def active(self, work_class):
+        return sum(self.running[work_class].values())
+
+    def dispatch(self):
+        """Hand free slots to waiting calls; the lock must be held"""
+        while sum(self.active(work_class) for work_class in WORK_CLASSES) < self.max_concurrency:
+            waiter = self.next_waiter()
+            if waiter is None:
+                return
+            self.waiting[waiter.work_class].remove(waiter)
+            running = self.running[waiter.work_class]
+            running[waiter.owner] = running.get(waiter.owner, 0) + 1
+            self.served[waiter.work_class][waiter.owner] = time.monotonic()
+            self.totals[waiter.work_class]['granted'] += 1
+            waiter.granted = True
+            SCHEDULER_QUEUE_DEPTH.labels(waiter.work_class).dec()
+            waiter.event.set()
+
+    def next_waiter(self):
+        now = time.monotonic()
+        best, best_key = None, None
+        for rank, work_class in enumerate(WORK_CLASSES):
+            if self.active(work_class) >= self.class_limits[work_class]:
+                continue
+            # Expired calls are left for their own threads to remove
+            eligible = [waiter for waiter in self.waiting[work_class] if waiter.deadline is None or waiter.deadline > now]
+            if not eligible:
+                continue
+            oldest = eligible[0].enqueued
+            key = (0, oldest) if now - oldest >= self.starvation_seconds else (1, rank)
+            if best_key is None or key < best_key:
+                running, served = self.running[work_class], self.served[work_class]
+                best = min(eligible, key=lambda waiter: (running.get(waiter.owner, 0), served.get(waiter.owner, 0.0), waiter.enqueued))
+                best_key = key
+        return best
+
+    def stats(self):
+        """Per work class: limit, calls running and queued, the longest current wait and totals"""
+        now = time.monotonic()
+        with self.lock:
+            stats = {}
+            for work_class in WORK_CLASSES:
+                waiting = self.waiting[work_class]
+                totals = self.totals[work_class]
+                stats[work_class] = {
+                    'limit': self.class_limits[work_class],
+                    'running': self.active(work_class),
+                    'queued': len(waiting),
+                    'oldest_wait_seconds': round(now - waiting[0].enqueued, 3) if waiting else 0.0,
+                    'granted': totals['granted'],
+                    'expired': totals['expired'],
+                    'avg_wait_seconds': round(totals['wait_seconds'] / totals['granted'], 3) if totals['granted'] else 0.0,
+                }
+            stats['max_concurrency'] = self.max_concurrency
+            return stats
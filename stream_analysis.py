@@ -1,12 +1,12 @@
 import streamlit as st
 import cv2
 import time
-import tempfile
-import os
-import threading
-import numpy as np
+import requests
+from config import Config
 
 st.set_page_config(page_title="Video Stream Analysis", page_icon="📹")
+
+API_URL = Config.get_api_url()
 st.title("Video Stream Analysis")
 
 st.markdown("""
@@ -14,8 +14,18 @@ Easily connect to your IP cameras, preview live streams, and perform efficient f
 """)
 
 # --- Camera Configuration (Simple Form with Optional Fields) ---
-if "camera_configs" not in st.session_state:
-    st.session_state["camera_configs"] = []
+# Cameras are stored in the backend so the stream supervisor can run them without this tab open
+def load_cameras():
+    try:
+        resp = requests.get(f"{API_URL}/cameras", cookies={"session": st.session_state.get("auth_token")}, timeout=10)
+        if resp.status_code == 200:
+            return resp.json().get("cameras", [])
+    except requests.exceptions.RequestException:
+        pass
+    st.error("Could not load cameras from the backend.")
+    return []
+
+camera_configs = load_cameras()
 
 with st.expander("Add Camera"):
     cam_name = st.text_input("Camera Name", key="cam_name_input")
@@ -38,44 +48,47 @@ with st.expander("Add Camera"):
             auth = f"{username}:{password}@" if username and password else (f"{username}@" if username else "")
             url = f"rtsp://{auth}{{CAMERA_IP}}:{port}"
         if cam_name and url:
-            st.session_state["camera_configs"].append({
-                "name": cam_name,
-                "rtsp_url": url,
-                "username": username,
-                "password": password,
-                "port": port
-            })
-            st.success(f"Added camera: {cam_name}")
-            st.rerun()
+            try:
+                resp = requests.post(f"{API_URL}/cameras", json={"name": cam_name, "rtsp_url": url},
+                                     cookies={"session": st.session_state.get("auth_token")}, timeout=10)
+                if resp.status_code == 201:
+                    st.success(f"Added camera: {cam_name}")
+                    st.rerun()
+                else:
+                    st.error(resp.json().get("error", "Failed to add camera."))
+            except requests.exceptions.RequestException as e:
+                st.error(f"Error adding camera: {e}")
         else:
             st.error("Please enter at least a name and RTSP URL or enough info to build one.")
 
-# Show current cameras
-if st.session_state["camera_configs"]:
+# Show current cameras with the health reported by the stream supervisor
+if camera_configs:
     st.markdown("**Configured Cameras:**")
-    for idx, cam in enumerate(st.session_state["camera_configs"]):
+    for idx, cam in enumerate(camera_configs):
+        health = cam.get("health", {})
+        status = health.get("status") or "stopped"
         st.write(f"{idx+1}. {cam['name']} - {cam['rtsp_url']}")
-        if st.button(f"Remove", key=f"remove_cam_{idx}"):
-            st.session_state["camera_configs"].pop(idx)
+        st.caption(f"Status: {status} • {health.get('fps') or 0} fps • lag {health.get('lag_seconds') or 0}s • reconnects {health.get('reconnects') or 0}"
+                   + f" • idle batches skipped {health.get('batches_skipped') or 0}"
+                   + (f" • last error: {health['last_error']}" if health.get("last_error") else ""))
+        if st.button(f"Remove", key=f"remove_cam_{cam['id']}"):
+            requests.delete(f"{API_URL}/cameras/{cam['id']}", cookies={"session": st.session_state.get("auth_token")}, timeout=10)
             st.rerun()
 else:
     st.info("No cameras configured yet.")
 
 # --- Camera Selection ---
-camera_names = [c["name"] for c in st.session_state["camera_configs"]]
+camera_names = [c["name"] for c in camera_configs]
 selected_camera = st.selectbox("Select Camera", camera_names) if camera_names else None
-rtsp_url = None
-if selected_camera:
-    for c in st.session_state["camera_configs"]:
-        if c["name"] == selected_camera:
-            rtsp_url = c["rtsp_url"]
-            break
-
-# --- Hardcoded Sampling Parameters ---
-sampling_rate = 1  # frames per second
-batch_interval = 60  # seconds
-st.markdown(f"**Sampling Rate:** {sampling_rate} fps (fixed)")
-st.markdown(f"**Batch Interval:** {batch_interval} seconds (fixed)")
+camera = next((c for c in camera_configs if c["name"] == selected_camera), None)
+rtsp_url = camera["rtsp_url"] if camera else None
+
+# --- Sampling Parameters (per camera, applied by the stream supervisor) ---
+if camera:
+    sensitivity = camera.get("motion_sensitivity")
+    st.markdown(f"**Sampling Rate:** {camera['sampling_rate']:g} fps")
+    st.markdown(f"**Batch Interval:** {camera['batch_interval']:g} seconds")
+    st.markdown(f"**Motion Gate:** {'off' if sensitivity is None else f'sensitivity {sensitivity:g}'}")
 
 # --- Stream Preview Logic ---
 def preview_stream(rtsp_url, seconds=5):
@@ -101,56 +114,43 @@ if rtsp_url:
         preview_stream(rtsp_url)
 
 # --- Stream Sampling Logic ---
+# The stream supervisor samples every enabled camera, so starting and stopping only switches the camera on or off;
+# sampling here as well would analyze the same footage twice
 run_stream = st.button("Start Sampling Stream", key="start_stream")
 stop_stream = st.button("Stop Sampling", key="stop_stream")
 
-if "stream_thread" not in st.session_state:
-    st.session_state["stream_thread"] = None
-# Ensure session state keys are initialized
-if "stream_running" not in st.session_state:
-    st.session_state["stream_running"] = False
-if "sampled_frames" not in st.session_state:
-    st.session_state["sampled_frames"] = []
-
-# Helper function to sample frames in a thread
-def stream_worker(rtsp_url, sampling_rate, batch_interval):
-    cap = cv2.VideoCapture(rtsp_url)
-    buffer = []
-    start_time = time.time()
-    while st.session_state["stream_running"]:
-        ret, frame = cap.read()
-        if not ret:
-            time.sleep(1)
-            continue
-        now = time.time()
-        if int(now * sampling_rate) % sampling_rate == 0:
-            buffer.append(frame)
-            # Show the latest frame in Streamlit
-            st.session_state["sampled_frames"] = [frame]
-        # Every batch_interval seconds, clear buffer (simulate batch analysis)
-        if now - start_time >= batch_interval:
-            # Here you would call your AI analysis function with the buffer
-            # For now, just clear the buffer
-            buffer.clear()
-            start_time = now
-        time.sleep(1.0 / sampling_rate)
-    cap.release()
-
-# Start/Stop logic
-if run_stream and rtsp_url:
-    if st.session_state["stream_thread"] is None or not st.session_state["stream_thread"].is_alive():
-        st.session_state["stream_running"] = True
-        st.session_state["stream_thread"] = threading.Thread(
-            target=stream_worker,
-            args=(rtsp_url, sampling_rate, batch_interval),
-            daemon=True
-        )
-        st.session_state["stream_thread"].start()
-        st.success("Started stream sampling!")
-if stop_stream:
-    st.session_state["stream_running"] = False
-    st.success("Stopped stream sampling.")
-
-# Display sampled frame
-if st.session_state["sampled_frames"]:
-    st.image(st.session_state["sampled_frames"][0], channels="BGR", caption="Latest Sampled Frame") 
\ No newline at end of file
+def set_camera_enabled(camera, enabled):
+    if camera["is_enabled"] == enabled:
+        return True
+    try:
+        resp = requests.post(f"{API_URL}/cameras/{camera['id']}/toggle", cookies={"session": st.session_state.get("auth_token")}, timeout=10)
+        return resp.status_code == 200
+    except requests.exceptions.RequestException:
+        return False
+
+if camera and (run_stream or stop_stream):
+    if set_camera_enabled(camera, run_stream):
+        camera["is_enabled"] = run_stream
+        st.success("Started stream sampling!" if run_stream else "Stopped stream sampling.")
+    else:
+        st.error("Could not update the camera.")
+
+if camera:
+    health = camera.get("health", {})
+    st.caption(f"Sampling {'on' if camera['is_enabled'] else 'off'} • Frames read: {health.get('frames_read') or 0} • Sampled: {health.get('frames_sampled') or 0}"
+               f" • Batches sent: {health.get('batches_submitted') or 0} • Idle batches skipped: {health.get('batches_skipped') or 0}")
+
+# --- Detected Events ---
+if selected_camera and API_URL:
+    st.subheader("Detected Events")
+    try:
+        resp = requests.get(f"{API_URL}/stream_events", params={"camera": selected_camera, "limit": 20},
+                            cookies={"session": st.session_state.get("auth_token")}, timeout=10)
+        events = resp.json().get("events", []) if resp.status_code == 200 else []
+        if events:
+            for event in events:
+                st.write(f"**{event['started_at']} – {event['ended_at']}**: {event['description']}")
+        else:
+            st.info("No events recorded for this camera yet.")
+    except requests.exceptions.RequestException:
+        st.info("Could not load events from the backend.")
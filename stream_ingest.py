@@ -0,0 +1,235 @@
+import argparse
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import cv2
+
+
+def encode_jpeg(frame, max_width=768, jpeg_quality=80):
+    """Resize (if wider than max_width) and JPEG-encode a BGR frame"""
+    height, width = frame.shape[:2]
+    if width > max_width:
+        frame = cv2.resize(frame, (max_width, int(height * max_width / width)), interpolation=cv2.INTER_AREA)
+    ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+    return buffer.tobytes() if ok else None
+
+
+def is_network_source(source):
+    return str(source).lower().startswith(('rtsp://', 'rtsps://', 'rtmp://', 'http://', 'https://'))
+
+
+class StreamIngestor:
+    """Drain a video stream at its native rate and hand sampled frames to an analysis callback in batches.
+
+    Every frame is grabbed so the decoder never falls behind, but only frames due at
+    `sampling_rate` are decoded and JPEG-encoded into a bounded ring buffer. Every
+    `batch_interval` seconds of stream time the buffer is handed to `on_batch` on a
+    worker pool, so slow analysis never blocks reading.
+
+    `source` may be an RTSP URL or a local video file (read as fast as it decodes;
+    `loop=True` with `realtime=True` replays it at its native frame rate like a live
+    camera). Dropped connections are retried with
+    exponential backoff between `reconnect_delay` and `max_reconnect_delay`.
+
+    With a `gate` (motion_gate.MotionGate), idle frames are dropped from each batch
+    and batches without any activity are not submitted at all.
+    """
+
+    def __init__(self, source, on_batch, name=None, sampling_rate=1.0, batch_interval=60.0,
+                 buffer_size=None, max_width=768, jpeg_quality=80, executor=None,
+                 reconnect_delay=1.0, max_reconnect_delay=60.0, loop=False, realtime=False, gate=None):
+        self.source = source
+        self.on_batch = on_batch
+        self.name = name or source
+        self.sampling_rate = sampling_rate
+        self.batch_interval = batch_interval
+        # Room for one batch plus slack; older frames drop off if analysis falls behind
+        self.buffer = deque(maxlen=buffer_size or int(sampling_rate * batch_interval * 2) or 1)
+        self.max_width = max_width
+        self.jpeg_quality = jpeg_quality
+        self.executor = executor or ThreadPoolExecutor(max_workers=2, thread_name_prefix=f'batch-{self.name}')
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.loop = loop
+        self.realtime = realtime
+        self.gate = gate
+        self.latest_frame = None
+        self.stats = {'frames_read': 0, 'frames_sampled': 0, 'frames_dropped': 0,
+                      'batches_submitted': 0, 'reconnects': 0, 'frames_gated': 0, 'batches_skipped': 0}
+        self.state = 'stopped'
+        self.last_error = None
+        self.last_frame_at = None
+        self.lag_seconds = 0.0
+        self.metrics_mark = (time.monotonic(), 0)
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name=f'ingest-{self.name}', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self, wait=True):
+        self.stop_event.set()
+        if wait and self.thread is not None:
+            self.thread.join()
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def is_network_source(self):
+        return is_network_source(self.source)
+
+    def metrics(self):
+        """Health snapshot: state, read fps since the previous call, and how far reading trails the stream clock"""
+        now = time.monotonic()
+        mark_time, mark_frames = self.metrics_mark
+        frames_read = self.stats['frames_read']
+        self.metrics_mark = (now, frames_read)
+        elapsed = now - mark_time
+        return {
+            'state': self.state,
+            'fps': round((frames_read - mark_frames) / elapsed, 2) if elapsed > 0 else 0.0,
+            'lag_seconds': round(self.lag_seconds, 2),
+            'last_frame_at': self.last_frame_at,
+            'last_error': self.last_error,
+            **self.stats,
+        }
+
+    def submit_batch(self, started_at):
+        with self.lock:
+            frames = list(self.buffer)
+            self.buffer.clear()
+        if not frames:
+            return None
+        if self.gate is not None:
+            keep = self.gate.select_window([frame['active'] for frame in frames])
+            self.stats['frames_gated'] += len(frames) - len(keep)
+            if not keep:
+                # Nothing moved in this window, so skip the model call
+                self.stats['batches_skipped'] += 1
+                return None
+            frames = [frames[i] for i in keep]
+        batch = {
+            'source': self.source,
+            'name': self.name,
+            'started_at': started_at,
+            'ended_at': frames[-1]['captured_at'],
+            'frames': frames,
+        }
+        self.stats['batches_submitted'] += 1
+        return self.executor.submit(self.on_batch, batch)
+
+    def read_stream(self, cap):
+        """Read one connection until it ends or stop() is called"""
+        wall_start = time.monotonic()
+        next_sample = 0.0
+        batch_start = None
+        batch_started_at = None
+        while not self.stop_event.is_set():
+            if not cap.grab():
+                break
+            self.stats['frames_read'] += 1
+            self.last_frame_at = datetime.utcnow()
+            # Prefer the stream's own clock; fall back to wall time when the source has none
+            wall_elapsed = time.monotonic() - wall_start
+            position = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+            if position <= 0:
+                position = wall_elapsed
+            elif self.is_network_source():
+                # Reading slower than real time shows up as wall time running ahead of the stream
+                self.lag_seconds = max(0.0, wall_elapsed - position)
+            elif self.realtime and position > wall_elapsed:
+                # Pace a local file like a live feed
+                self.stop_event.wait(position - wall_elapsed)
+            if batch_start is None:
+                batch_start = position
+                batch_started_at = datetime.utcnow()
+            if position >= next_sample:
+                ret, frame = cap.retrieve()
+                if ret:
+                    jpeg = encode_jpeg(frame, self.max_width, self.jpeg_quality)
+                    active = self.gate.check(frame) if self.gate is not None else True
+                    with self.lock:
+                        if len(self.buffer) == self.buffer.maxlen:
+                            self.stats['frames_dropped'] += 1
+                        self.buffer.append({'timestamp': round(position, 2), 'captured_at': datetime.utcnow(), 'jpeg': jpeg, 'active': active})
+                    self.latest_frame = frame
+                    self.stats['frames_sampled'] += 1
+                # Skip missed ticks rather than bursting to catch up
+                next_sample += 1.0 / self.sampling_rate
+                if next_sample <= position:
+                    next_sample = position + 1.0 / self.sampling_rate
+            if position - batch_start >= self.batch_interval:
+                self.submit_batch(batch_started_at)
+                batch_start = position
+                batch_started_at = datetime.utcnow()
+        # Flush the partial batch at the end of a file or on stop
+        if batch_started_at is not None:
+            self.submit_batch(batch_started_at)
+
+    def run(self):
+        delay = self.reconnect_delay
+        while not self.stop_event.is_set():
+            self.state = 'connecting'
+            frames_before = self.stats['frames_read']
+            cap = cv2.VideoCapture(self.source)
+            try:
+                if cap.isOpened():
+                    self.state = 'running'
+                    self.read_stream(cap)
+                else:
+                    self.last_error = f'Could not open {self.name}'
+            except Exception as e:
+                self.last_error = str(e)
+            finally:
+                cap.release()
+            if self.stop_event.is_set():
+                break
+            if not self.loop and not self.is_network_source():
+                # A local file has simply ended
+                self.state = 'finished'
+                return
+            if self.stats['frames_read'] > frames_before:
+                # The connection worked for a while, so start backing off from scratch
+                delay = self.reconnect_delay
+            self.state = 'reconnecting'
+            self.stats['reconnects'] += 1
+            self.stop_event.wait(delay * random.uniform(0.8, 1.2))
+            delay = min(delay * 2, self.max_reconnect_delay)
+        self.state = 'stopped'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sample a camera stream and store AI event descriptions')
+    parser.add_argument('source', help='RTSP URL or local video file')
+    parser.add_argument('--user-id', type=int, required=True, help='Owner of the camera')
+    parser.add_argument('--camera', required=True, help='Camera name stored with each event')
+    parser.add_argument('--sampling-rate', type=float, default=1.0, help='Frames per second to keep')
+    parser.add_argument('--batch-interval', type=float, default=60.0, help='Seconds of footage per analysis batch')
+    args = parser.parse_args()
+
+    # Imported here so the ingestor itself has no Flask dependency
+    from backend import run_stream_batch
+
+    ingestor = StreamIngestor(
+        args.source,
+        lambda batch: run_stream_batch(args.user_id, args.camera, batch),
+        name=args.camera,
+        sampling_rate=args.sampling_rate,
+        batch_interval=args.batch_interval,
+    )
+    ingestor.start()
+    try:
+        while ingestor.is_running():
+            time.sleep(1)
+    except KeyboardInterrupt:
+        ingestor.stop()
+    ingestor.executor.shutdown(wait=True)
+    print(f"Stream ingest finished: {ingestor.stats}")
@@ -0,0 +1,211 @@
+import argparse
+import multiprocessing
+import os
+import queue
+import time
+from datetime import datetime
+
+from motion_gate import MotionGate
+from stream_ingest import StreamIngestor, is_network_source
+
+# Seconds between health reports from each worker process
+STATUS_INTERVAL = 5.0
+
+
+def handle_camera_batch(camera, batch):
+    """Default batch handler: describe the batch with Qwen-VL and store a StreamEvent"""
+    from backend import run_stream_batch
+    return run_stream_batch(camera['user_id'], camera['name'], batch)
+
+
+def camera_worker(command_queue, status_queue, batch_handler):
+    """Worker process: run one StreamIngestor per assigned camera and report their health.
+
+    Decoding happens in native code that releases the GIL, so a process can carry
+    several cameras; the supervisor spreads cameras across one process per core.
+    """
+    ingestors = {}
+    while True:
+        try:
+            command, payload = command_queue.get(timeout=STATUS_INTERVAL)
+        except queue.Empty:
+            command, payload = None, None
+
+        if command == 'start':
+            camera = payload
+            if camera['id'] in ingestors:
+                ingestors.pop(camera['id']).stop(wait=False)
+            file_source = not is_network_source(camera['rtsp_url'])
+            sensitivity = camera.get('motion_sensitivity')
+            ingestors[camera['id']] = StreamIngestor(
+                camera['rtsp_url'],
+                lambda batch, camera=camera: batch_handler(camera, batch),
+                name=camera['name'],
+                sampling_rate=camera['sampling_rate'],
+                batch_interval=camera['batch_interval'],
+                gate=MotionGate(sensitivity) if sensitivity is not None else None,
+                # Local files stand in for cameras: replay them in a loop at their native rate
+                loop=file_source,
+                realtime=file_source,
+            ).start()
+        elif command == 'stop':
+            ingestor = ingestors.pop(payload, None)
+            if ingestor is not None:
+                ingestor.stop(wait=False)
+                status_queue.put((payload, {'state': 'stopped'}))
+        elif command == 'shutdown':
+            for camera_id, ingestor in ingestors.items():
+                ingestor.stop(wait=True)
+                status_queue.put((camera_id, {'state': 'stopped'}))
+            return
+
+        for camera_id, ingestor in ingestors.items():
+            status_queue.put((camera_id, ingestor.metrics()))
+
+
+class StreamSupervisor:
+    """Keep one decoder running per enabled camera in the database, spread over a process pool.
+
+    Camera configs are re-read every `refresh_interval` seconds, so cameras added,
+    changed, disabled or deleted through the API are picked up without a restart.
+    Health reports from the workers are written back to the Camera rows.
+    """
+
+    def __init__(self, processes=None, refresh_interval=30.0, batch_handler=handle_camera_batch):
+        self.process_count = processes or os.cpu_count() or 1
+        self.refresh_interval = refresh_interval
+        self.batch_handler = batch_handler
+        # spawn avoids forking a parent that already holds threads and DB connections
+        self.context = multiprocessing.get_context('spawn')
+        self.status_queue = self.context.Queue()
+        self.workers = []
+        self.assignments = {}  # camera id -> (worker index, config signature)
+
+    def start(self):
+        for _ in range(self.process_count):
+            command_queue = self.context.Queue()
+            process = self.context.Process(
+                target=camera_worker,
+                args=(command_queue, self.status_queue, self.batch_handler),
+                daemon=True,
+            )
+            process.start()
+            self.workers.append((process, command_queue))
+        return self
+
+    def least_loaded_worker(self):
+        load = [0] * len(self.workers)
+        for worker_index, _ in self.assignments.values():
+            load[worker_index] += 1
+        return load.index(min(load))
+
+    def sync(self, cameras):
+        """Start, restart or stop decoders so they match the given camera configs"""
+        wanted = {}
+        for camera in cameras:
+            wanted[camera['id']] = camera
+        for camera_id in list(self.assignments):
+            if camera_id not in wanted:
+                worker_index, _ = self.assignments.pop(camera_id)
+                self.workers[worker_index][1].put(('stop', camera_id))
+        for camera_id, camera in wanted.items():
+            signature = (camera['name'], camera['rtsp_url'], camera['sampling_rate'], camera['batch_interval'],
+                         camera.get('motion_sensitivity'))
+            current = self.assignments.get(camera_id)
+            if current and current[1] == signature:
+                continue
+            worker_index = current[0] if current else self.least_loaded_worker()
+            self.assignments[camera_id] = (worker_index, signature)
+            self.workers[worker_index][1].put(('start', camera))
+
+    def collect_status(self):
+        """Drain pending health reports, keeping the latest per camera"""
+        latest = {}
+        while True:
+            try:
+                camera_id, metrics = self.status_queue.get_nowait()
+            except queue.Empty:
+                return latest
+            latest[camera_id] = metrics
+
+    def restart_dead_workers(self):
+        """Replace crashed worker processes; returns True if any cameras need reassigning"""
+        restarted = False
+        for index, (process, command_queue) in enumerate(self.workers):
+            if process.is_alive():
+                continue
+            print(f"Stream worker {index} exited with code {process.exitcode}, restarting")
+            command_queue = self.context.Queue()
+            process = self.context.Process(
+                target=camera_worker,
+                args=(command_queue, self.status_queue, self.batch_handler),
+                daemon=True,
+            )
+            process.start()
+            self.workers[index] = (process, command_queue)
+            # Re-send every camera that lived on the dead worker
+            for camera_id, (worker_index, _) in list(self.assignments.items()):
+                if worker_index == index:
+                    del self.assignments[camera_id]
+            restarted = True
+        return restarted
+
+    def shutdown(self):
+        for _, command_queue in self.workers:
+            command_queue.put(('shutdown', None))
+        for process, _ in self.workers:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+
+    def run_forever(self):
+        """Sync cameras from the database and persist their health until interrupted"""
+        from backend import app, db, Camera
+
+        next_refresh = 0.0
+        try:
+            while True:
+                with app.app_context():
+                    if self.restart_dead_workers() or time.monotonic() >= next_refresh:
+                        cameras = Camera.query.filter_by(is_enabled=True).all()
+                        self.sync([{
+                            'id': c.id,
+                            'user_id': c.user_id,
+                            'name': c.name,
+                            'rtsp_url': c.rtsp_url,
+                            'sampling_rate': c.sampling_rate,
+                            'batch_interval': c.batch_interval,
+                            'motion_sensitivity': c.motion_sensitivity,
+                        } for c in cameras])
+                        next_refresh = time.monotonic() + self.refresh_interval
+                    statuses = self.collect_status()
+                    for camera_id, metrics in statuses.items():
+                        camera = db.session.get(Camera, camera_id)
+                        if camera is None:
+                            continue
+                        camera.status = metrics.get('state')
+                        camera.fps = metrics.get('fps')
+                        camera.lag_seconds = metrics.get('lag_seconds')
+                        camera.frames_read = metrics.get('frames_read', camera.frames_read)
+                        camera.frames_sampled = metrics.get('frames_sampled', camera.frames_sampled)
+                        camera.batches_submitted = metrics.get('batches_submitted', camera.batches_submitted)
+                        camera.reconnects = metrics.get('reconnects', camera.reconnects)
+                        camera.frames_gated = metrics.get('frames_gated', camera.frames_gated)
+                        camera.batches_skipped = metrics.get('batches_skipped', camera.batches_skipped)
+                        camera.last_frame_at = metrics.get('last_frame_at', camera.last_frame_at)
+                        camera.last_error = (metrics.get('last_error') or '')[:256] or None
+                        camera.status_updated_at = datetime.utcnow()
+                    db.session.commit()
+                time.sleep(STATUS_INTERVAL)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run stream ingest for every enabled camera in the database')
+    parser.add_argument('--processes', type=int, default=None, help='Worker processes (default: CPU count)')
+    parser.add_argument('--refresh-interval', type=float, default=30.0, help='Seconds between camera config reloads')
+    args = parser.parse_args()
+    StreamSupervisor(processes=args.processes, refresh_interval=args.refresh_interval).start().run_forever()
@@ -1,5 +1,53 @@
 import requests
+import hashlib
+import io
+import json
 import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+import pytest
+from alembic.script import ScriptDirectory
+
+# backend reads these at import time; tests use a throwaway SQLite database and upload folder
+TEST_DIR = tempfile.mkdtemp(prefix='cctvchat-test-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(TEST_DIR, 'test.db')}"
+os.environ['UPLOAD_FOLDER'] = os.path.join(TEST_DIR, 'upload')
+os.environ['EMBEDDING_MODEL'] = 'local'
+
+_backend = None
+
+def load_backend():
+    """Import the backend once, with its schema migrated"""
+    global _backend
+    if _backend is None:
+        import backend
+        with backend.app.app_context():
+            backend.init_database()
+        _backend = backend
+    return _backend
+
+def make_user(backend):
+    name = uuid.uuid4().hex[:12]
+    user = backend.User(username=name, email=f'{name}@example.com', password_hash='unused')
+    backend.db.session.add(user)
+    backend.db.session.commit()
+    return user
+
+def make_video(backend, user, name='gate.mp4'):
+    video = backend.Video(user_id=user.id, video_name=name, video_type='url',
+                          file_path_or_url=f'https://example.com/{uuid.uuid4().hex}.mp4', is_processed=True)
+    backend.db.session.add(video)
+    backend.db.session.commit()
+    return video
 
 def test_backend_connection():
     """Test if backend is accessible"""
@@ -27,5 +75,1622 @@ def test_backend_connection():
     except Exception as e:
         print(f"❌ Error: {e}")
 
+def test_vector_index_ranks_closest_texts_first():
+    """Cosine ranking is per owner, best match first, and skips removed keys"""
+    from vector_index import HashingEmbedder, VectorIndex
+    embedder = HashingEmbedder(384)
+    texts = ['a red car parked by the gate', 'a dog runs across the garden', 'delivery van stops at the entrance']
+    index = VectorIndex(embedder.dim)
+    index.add(1, ['car', 'dog', 'van'], embedder.embed(texts))
+    index.add(2, ['other'], embedder.embed(['a red car parked by the gate']))
+
+    hits = index.search(1, embedder.embed(['red car at the gate'])[0], k=3)
+    assert hits[0][0] == 'car'
+    assert [score for _, score in hits] == sorted((score for _, score in hits), reverse=True)
+    assert 'other' not in [key for key, _ in hits]
+
+    index.remove(1, ['car'])
+    assert 'car' not in [key for key, _ in index.search(1, embedder.embed(['red car at the gate'])[0], k=3)]
+    assert len(index) == 3
+
+def test_search_footage_uses_background_embeddings():
+    """search_footage ranks embedded chats and leaves embedding new ones to the background sync"""
+    backend = load_backend()
+    with backend.app.app_context():
+        user = make_user(backend)
+        video = make_video(backend, user)
+        for question, answer in [('Any cars?', 'A red car parks by the gate at noon.'),
+                                 ('Any animals?', 'A dog runs across the garden.')]:
+            backend.save_chat_answer(video.id, user.id, question, answer, 'stub')
+        backend.db.session.commit()
+        backend.sync_embeddings(user.id)
+
+        results = backend.search_footage(user.id, 'red car near the gate')
+        assert results[0]['kind'] == 'chat'
+        assert 'red car' in results[0]['text']
+        assert results[0]['video_name'] == 'gate.mp4'
+
+        # Not embedded yet: the search itself must not embed it
+        backend.save_chat_answer(video.id, user.id, 'Any bikes?', 'A bicycle leans on the fence.', 'stub')
+        backend.db.session.commit()
+        assert 'bicycle' not in ' '.join(r['text'] for r in backend.search_footage(user.id, 'bicycle fence'))
+        backend.sync_embeddings(user.id)
+        assert 'bicycle' in backend.search_footage(user.id, 'bicycle fence')[0]['text']
+
+def make_job(backend, status='queued', started_at=None):
+    with backend.app.app_context():
+        user = make_user(backend)
+        video = make_video(backend, user)
+        job = backend.AnalysisJob(id=uuid.uuid4().hex, user_id=user.id, video_id=video.id, question='What happened?',
+                                  video_url=video.file_path_or_url, sampling='none', status=status, started_at=started_at)
+        backend.db.session.add(job)
+        backend.db.session.commit()
+        return job.id
+
+def get_job(backend, job_id):
+    with backend.app.app_context():
+        return backend.db.session.get(backend.AnalysisJob, job_id).to_dict()
+
+def stub_model(backend, monkeypatch, answer=None, error=None):
+    """Replace run_qwen_analysis; returns the list of job states seen during each call"""
+    seen = []
+
+    def run_qwen_analysis(video_url, question, route=None, **kwargs):
+        with backend.app.app_context():
+            seen.append(backend.AnalysisJob.query.filter_by(video_url=video_url).one().status)
+        if error:
+            raise error
+        if route is not None:
+            route['model'] = 'stub-model'
+        return answer
+    monkeypatch.setattr(backend, 'run_qwen_analysis', run_qwen_analysis)
+    return seen
+
+def test_analysis_job_runs_to_completed(monkeypatch):
+    """A queued job is claimed (running), answered and saved to chat history"""
+    backend = load_backend()
+    seen = stub_model(backend, monkeypatch, answer='Two people walk past.')
+    job_id = make_job(backend)
+    assert get_job(backend, job_id)['status'] == 'queued'
+
+    backend.run_analysis_job(job_id)
+    job = get_job(backend, job_id)
+    assert seen == ['running']
+    assert job['status'] == 'completed'
+    assert job['answer'] == 'Two people walk past.'
+    assert job['model_used'] == 'stub-model'
+    assert job['chat_id'] is not None and job['completed_at'] is not None
+
+    # A finished job is not claimed again
+    backend.run_analysis_job(job_id)
+    assert seen == ['running']
+
+def test_analysis_job_failure_is_recorded(monkeypatch):
+    backend = load_backend()
+    stub_model(backend, monkeypatch, error=RuntimeError('model down'))
+    job_id = make_job(backend)
+    backend.run_analysis_job(job_id)
+    job = get_job(backend, job_id)
+    assert job['status'] == 'failed'
+    assert 'model down' in job['error']
+    assert job['chat_id'] is None
+
+def test_stale_running_jobs_are_resumed(monkeypatch):
+    """Jobs left running by a dead process longer than STALE_WORK_SECONDS are picked up again"""
+    backend = load_backend()
+    seen = stub_model(backend, monkeypatch, answer='Resumed answer.')
+    now = backend.datetime.utcnow()
+    stale_id = make_job(backend, 'running', now - backend.timedelta(seconds=backend.STALE_WORK_SECONDS + 60))
+    live_id = make_job(backend, 'running', now)
+    queued_id = make_job(backend)
+    submitted = []
+    monkeypatch.setattr(backend, 'submit_analysis_job', submitted.append)
+    with backend.app.app_context():
+        backend.resume_pending_jobs()
+    assert stale_id in submitted and queued_id in submitted
+    assert live_id not in submitted
+
+    # Another process still owns the live job, so running it here does nothing
+    backend.run_analysis_job(live_id)
+    assert get_job(backend, live_id)['status'] == 'running'
+    backend.run_analysis_job(stale_id)
+    assert get_job(backend, stale_id)['status'] == 'completed'
+    assert seen == ['running']
+
+def test_coalesced_jobs_keep_the_leaders_answered_from_index(monkeypatch):
+    """A job sharing another job's in-flight answer records that it came from the timeline index"""
+    backend = load_backend()
+    key = uuid.uuid4().hex
+    calls, started = [], threading.Event()
+
+    def answer_question(video, question, video_url, tier, sampling, max_frames, use_index=True, route=None, **kwargs):
+        calls.append(1)
+        started.set()
+        threading.Event().wait(0.3)
+        route['model'] = 'stub-model'
+        return 'A van stops at the gate.', True
+    monkeypatch.setattr(backend, 'answer_question', answer_question)
+    job_ids = [make_job(backend), make_job(backend)]
+    with backend.app.app_context():
+        for job_id in job_ids:
+            backend.db.session.get(backend.AnalysisJob, job_id).cache_key = key
+        backend.db.session.commit()
+
+    leader = threading.Thread(target=backend.run_analysis_job, args=(job_ids[0],))
+    leader.start()
+    assert started.wait(5)
+    follower = threading.Thread(target=backend.run_analysis_job, args=(job_ids[1],))
+    follower.start()
+    leader.join(10)
+    follower.join(10)
+    assert len(calls) == 1
+    for job_id in job_ids:
+        job = get_job(backend, job_id)
+        assert job['status'] == 'completed' and job['answer'] == 'A van stops at the gate.'
+        assert job['answered_from_index'] is True
+
+    # Other processes read the flag from the answer cache
+    with backend.app.app_context():
+        assert backend.answer_cached_since(key, backend.datetime.min) == ('A van stops at the gate.', 'stub-model', True)
+
+class FakeCompletions:
+    """Stands in for client.chat.completions: streams `words` one chunk each, or returns one message"""
+
+    def __init__(self, words):
+        self.words = words
+
+    def create(self, stream=False, **kwargs):
+        from types import SimpleNamespace
+        if not stream:
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=' '.join(self.words)))])
+        return FakeStream([SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word))]) for word in self.words])
+
+class FakeStream:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def close(self):
+        pass
+
+def test_slow_stream_consumer_does_not_hold_model_slot():
+    """The only model slot is free again once the model has finished, even if the stream is not read"""
+    import threading
+    from types import SimpleNamespace
+    from model_client import ModelClient
+    client = ModelClient(api_key='test', base_url='http://127.0.0.1:9/v1', max_concurrency=1)
+    client.client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions(['two', 'people', 'walk'])))
+    try:
+        stream = client.stream_chat_completion(model='stub', messages=[])
+        assert next(stream) == 'two'
+
+        # A second caller gets the slot while the first stream is still unread
+        answers = []
+        second = threading.Thread(target=lambda: answers.append(client.chat_completion(model='stub', messages=[])), daemon=True)
+        second.start()
+        second.join(timeout=5)
+        assert not second.is_alive()
+        assert answers[0].choices[0].message.content == 'two people walk'
+
+        assert list(stream) == ['people', 'walk']
+    finally:
+        client.close()
+
+def test_concurrent_identical_analyses_call_model_once():
+    """Two threads asking the same question share one compute() call"""
+    import threading
+    backend = load_backend()
+    key = uuid.uuid4().hex
+    calls, started, results = [], threading.Event(), []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        threading.Event().wait(0.3)
+        return 'One car parks.', 'stub-model', False
+
+    def ask():
+        with backend.app.app_context():
+            results.append(backend.coalesced_answer(key, compute))
+    first = threading.Thread(target=ask)
+    first.start()
+    assert started.wait(5)
+    second = threading.Thread(target=ask)
+    second.start()
+    first.join(10)
+    second.join(10)
+    assert len(calls) == 1
+    assert sorted(shared for _, _, _, shared in results) == [False, True]
+    assert {(answer, model) for answer, model, _, _ in results} == {('One car parks.', 'stub-model')}
+
+def test_answer_finished_by_another_process_before_locking_is_reused(monkeypatch):
+    """Another process caches the answer and releases the lock just before this one takes it"""
+    backend = load_backend()
+    key = uuid.uuid4().hex
+    calls, raced = [], []
+
+    def compute():
+        calls.append(1)
+        return 'One car parks.', 'stub-model', True
+
+    acquire = backend.acquire_analysis_lock
+    def acquire_after_other_process(lock_key, owner):
+        if not raced:
+            raced.append(owner)
+            # The other process (a different lock owner) answers in full first
+            monkeypatch.setattr(backend, 'analysis_lock_owner', lambda: 'other-process')
+            backend.answer_once_across_processes(lock_key, compute)
+        return acquire(lock_key, owner)
+    with backend.app.app_context():
+        monkeypatch.setattr(backend, 'acquire_analysis_lock', acquire_after_other_process)
+        assert backend.answer_once_across_processes(key, compute) == ('One car parks.', 'stub-model', True, True)
+    assert len(calls) == 1
+
+def test_whatsapp_model_call_is_limited_to_its_deadline(monkeypatch):
+    """Inside a WhatsApp deadline the model call gets only the time left, without retries"""
+    from types import SimpleNamespace
+    backend = load_backend()
+    requests_made = []
+
+    def chat_completion(**kwargs):
+        requests_made.append(kwargs)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content='Nobody came.'))])
+    monkeypatch.setattr(backend, 'get_model_client', lambda: SimpleNamespace(chat_completion=chat_completion))
+
+    with backend.scheduled(backend.WHATSAPP, 'whatsapp:+15550001', 5):
+        assert backend.run_qwen_analysis(None, 'Anyone at the door?', tier='max') == 'Nobody came.'
+    assert 0 < requests_made[0]['timeout'] <= 5
+    assert requests_made[0]['retries'] == 0
+
+    with backend.scheduled(backend.WHATSAPP, 'whatsapp:+15550001', -1):
+        try:
+            backend.run_qwen_analysis(None, 'Anyone at the door?', tier='max')
+            assert False, 'expected DeadlineExceeded'
+        except backend.DeadlineExceeded:
+            pass
+    assert len(requests_made) == 1
+
+def test_model_router_falls_back_with_bounded_attempts():
+    """Failed models fall back to the next one; only the last model runs without a time limit"""
+    from model_router import ModelRouter
+    router = ModelRouter({'fast': ['plus', 'max'], 'max': ['max']}, attempt_timeout=5.0)
+    attempts = []
+
+    def call(model, timeout):
+        attempts.append((model, timeout))
+        if model == 'plus':
+            raise TimeoutError('plus timed out')
+        return f'answer from {model}'
+    route = {}
+    assert router.complete('fast', call, route) == 'answer from max'
+    assert attempts == [('plus', 5.0), ('max', None)]
+    assert route == {'tier': 'fast', 'model': 'max', 'fallbacks': 1}
+
+def test_model_router_does_not_fall_back_on_bad_requests():
+    import httpx
+    from openai import BadRequestError
+    from model_router import ModelRouter, ModelUnavailableError
+    router = ModelRouter({'fast': ['plus', 'max']})
+    attempts = []
+
+    def call(model, timeout):
+        attempts.append(model)
+        raise BadRequestError('bad image', response=httpx.Response(400, request=httpx.Request('POST', 'http://model')), body=None)
+    try:
+        router.complete('fast', call)
+        assert False, 'expected BadRequestError'
+    except BadRequestError:
+        pass
+    assert attempts == ['plus']
+
+    # Every model failing, or none configured, is reported rather than answered with None
+    try:
+        router.complete('fast', lambda model, timeout: 1 / 0)
+        assert False, 'expected ModelUnavailableError'
+    except ModelUnavailableError:
+        pass
+    for tiers in ({'fast': [], 'max': []}, {}):
+        try:
+            ModelRouter(tiers).complete('fast', lambda model, timeout: 'never')
+            assert False, 'expected ModelUnavailableError'
+        except ModelUnavailableError:
+            pass
+
+def test_model_router_hedges_slow_models():
+    """With hedging, a slow model is raced by the next one and the first answer wins"""
+    import threading
+    import time
+    from model_router import ModelRouter
+    router = ModelRouter({'max': ['slow', 'quick']}, hedge_after=0.05, hedge_workers=2)
+    release = threading.Event()
+
+    def call(model, timeout):
+        if model == 'slow':
+            release.wait(5)
+        return f'answer from {model}'
+    route = {}
+    start = time.perf_counter()
+    try:
+        assert router.complete('max', call, route) == 'answer from quick'
+    finally:
+        release.set()
+    assert time.perf_counter() - start < 2
+    assert route['model'] == 'quick' and route['fallbacks'] == 1
+
+def test_model_router_stream_falls_back_before_first_piece():
+    from model_router import ModelRouter
+    router = ModelRouter({'fast': ['plus', 'max']})
+
+    def call(model, timeout):
+        if model == 'plus':
+            raise ConnectionError('plus is down')
+        yield from ['two ', 'people']
+    route = {}
+    assert ''.join(router.stream('fast', call, route)) == 'two people'
+    assert route['model'] == 'max'
+
+def test_delete_video_removes_dependent_rows(monkeypatch):
+    """Deleting a video also deletes its jobs, chats, segments, embeddings, upload sessions and frame files"""
+    backend = load_backend()
+    stub_model(backend, monkeypatch, answer='A van parks.')
+    job_id = make_job(backend)
+    backend.run_analysis_job(job_id)
+    # The job queued an embedding sync for its chat; let it finish so it can't run after the delete
+    backend.embedding_executor.submit(lambda: None).result()
+    with backend.app.app_context():
+        job = backend.db.session.get(backend.AnalysisJob, job_id)
+        user, video_id = backend.db.session.get(backend.User, job.user_id), job.video_id
+        video = backend.db.session.get(backend.Video, video_id)
+        video.content_hash = uuid.uuid4().hex
+        frames_dir = os.path.join(backend.FRAMES_FOLDER, video.content_hash, 'segments_10_3')
+        os.makedirs(frames_dir)
+        frame_path = os.path.join(frames_dir, 'frame_0.jpg')
+        open(frame_path, 'wb').close()
+        segment = backend.VideoSegment(video_id=video_id, segment_index=0, start_time=0.0, end_time=10.0, caption='A van parks.',
+                                       frames=json.dumps([{'path': frame_path, 'frame_index': 0, 'timestamp': 0.0}]))
+        backend.db.session.add(segment)
+        backend.db.session.add(backend.UploadSession(id=uuid.uuid4().hex, user_id=user.id, filename='gate.mp4',
+                                                     total_size=1, received_bytes=1, status='completed', video_id=video_id))
+        backend.db.session.commit()
+        backend.sync_embeddings(user.id)
+        assert backend.Embedding.query.filter_by(video_id=video_id).count() == 2
+
+        with backend.app.test_request_context():
+            backend.login_user(user)
+            response, status = backend.delete_video(video_id)
+        assert status == 200
+        assert backend.db.session.get(backend.Video, video_id) is None
+        for model in (backend.AnalysisJob, backend.ChatHistory, backend.VideoSegment, backend.Embedding, backend.UploadSession):
+            assert model.query.filter_by(video_id=video_id).count() == 0
+        assert not os.path.exists(frame_path)
+
+def test_embedding_sync_drops_rows_deleted_while_embedding(monkeypatch):
+    """A chat deleted while its embedding is computed does not leave an orphan embedding behind"""
+    backend = load_backend()
+    with backend.app.app_context():
+        user = make_user(backend)
+        video = make_video(backend, user)
+        chat = backend.ChatHistory(video_id=video.id, user_id=user.id, question='Who came in?', answer='A courier.')
+        backend.db.session.add(chat)
+        backend.db.session.commit()
+        chat_id = chat.id
+        embedder = backend.get_embedder()
+
+        def delete_chat():
+            with backend.app.app_context():
+                backend.ChatHistory.query.filter_by(id=chat_id).delete()
+                backend.db.session.commit()
+
+        def embed(texts):
+            # Another request deletes the chat while the model is embedding it
+            deleter = threading.Thread(target=delete_chat)
+            deleter.start()
+            deleter.join()
+            return backend.HashingEmbedder(embedder.dim).embed(texts)
+
+        monkeypatch.setattr(embedder, 'embed', embed)
+        assert backend.sync_embeddings(user.id) == 0
+        assert backend.Embedding.query.filter_by(kind='chat', ref_id=chat_id).count() == 0
+
+# Schema db.create_all() built before migrations existed (the baseline release)
+BASELINE_SCHEMA = """
+CREATE TABLE user (id INTEGER NOT NULL, email VARCHAR(120) NOT NULL, password_hash VARCHAR(128) NOT NULL,
+    username VARCHAR(64) NOT NULL, created_at DATETIME DEFAULT CURRENT_TIMESTAMP, last_login DATETIME, is_active BOOLEAN,
+    whatsapp_number VARCHAR(64), whatsapp_linked_at DATETIME, PRIMARY KEY (id), UNIQUE (email), UNIQUE (username),
+    UNIQUE (whatsapp_number));
+CREATE TABLE video (id INTEGER NOT NULL, user_id INTEGER NOT NULL, video_name VARCHAR(256), video_type VARCHAR(32),
+    file_path_or_url VARCHAR(512), upload_date DATETIME DEFAULT CURRENT_TIMESTAMP, file_size INTEGER, duration INTEGER,
+    thumbnail_path VARCHAR(512), is_processed BOOLEAN, is_favorite BOOLEAN, PRIMARY KEY (id),
+    FOREIGN KEY(user_id) REFERENCES user (id));
+CREATE TABLE whats_app_link_token (token VARCHAR(16) NOT NULL, user_id INTEGER NOT NULL, expires_at DATETIME NOT NULL,
+    used BOOLEAN NOT NULL, created_at DATETIME DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (token),
+    FOREIGN KEY(user_id) REFERENCES user (id));
+CREATE TABLE chat_history (id INTEGER NOT NULL, video_id INTEGER NOT NULL, user_id INTEGER NOT NULL, question TEXT NOT NULL,
+    answer TEXT, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP, model_used VARCHAR(64), PRIMARY KEY (id),
+    FOREIGN KEY(video_id) REFERENCES video (id), FOREIGN KEY(user_id) REFERENCES user (id));
+INSERT INTO user (id, email, password_hash, username) VALUES (1, 'old@example.com', 'unused', 'old');
+INSERT INTO video (id, user_id, video_name, video_type, file_path_or_url, is_processed, is_favorite)
+    VALUES (1, 1, 'lobby.mp4', 'url', 'https://example.com/lobby.mp4', 1, 0);
+INSERT INTO chat_history (id, video_id, user_id, question, answer) VALUES (1, 1, 1, 'Who came in?', 'A courier.');
+"""
+
+def test_baseline_database_is_upgraded_to_head():
+    """A database from before migrations keeps its rows and gains every later table and column"""
+    path = os.path.join(tempfile.mkdtemp(dir=TEST_DIR), 'baseline.db')
+    with sqlite3.connect(path) as connection:
+        connection.executescript(BASELINE_SCHEMA)
+    script = (
+        "import backend\n"
+        "with backend.app.app_context():\n"
+        "    backend.init_database()\n"
+        "    video = backend.Video.query.one()\n"
+        "    print(video.video_name, video.content_hash, video.index_status, backend.ChatHistory.query.one().answer)\n"
+        "    print(backend.AnalysisJob.query.count(), backend.AnswerCache.query.count())\n"
+    )
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{path}')
+    result = subprocess.run([sys.executable, '-c', script], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            env=env, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines()[-2:] == ['lobby.mp4 None None A courier.', '0 0']
+    with sqlite3.connect(path) as connection:
+        video_columns = {row[1] for row in connection.execute('PRAGMA table_info(video)')}
+        revision = connection.execute('SELECT version_num FROM alembic_version').fetchone()[0]
+    assert {'content_hash', 'index_status', 'ingest_started_at'} <= video_columns
+    assert revision == ScriptDirectory(load_backend().MIGRATIONS_DIR).get_current_head()
+
+def test_stream_batch_sends_at_most_max_frames(monkeypatch):
+    """A long stream batch is thinned evenly to MAX_FRAMES_PER_REQUEST frames, keeping both ends"""
+    backend = load_backend()
+    sent = []
+
+    def run_qwen_analysis(video_url, question, route=None, frames=None, **kwargs):
+        sent.append(frames)
+        route['model'] = 'stub-model'
+        return 'A person crosses the yard.'
+
+    monkeypatch.setattr(backend, 'run_qwen_analysis', run_qwen_analysis)
+    with backend.app.app_context():
+        user_id = make_user(backend).id
+    started = backend.datetime.utcnow()
+    batch = {'started_at': started, 'ended_at': started + backend.timedelta(seconds=60),
+             'frames': [{'timestamp': float(i), 'jpeg': b'jpeg'} for i in range(60)]}
+    event_id = backend.run_stream_batch(user_id, 'yard', batch)
+
+    assert len(sent[0]) == backend.MAX_FRAMES_PER_REQUEST
+    assert sent[0][0]['timestamp'] == 0.0 and sent[0][-1]['timestamp'] == 59.0
+    with backend.app.app_context():
+        event = backend.db.session.get(backend.StreamEvent, event_id)
+        assert (event.frame_count, event.stream_offset_start, event.stream_offset_end) == (60, 0.0, 59.0)
+
+def make_clip(path, frame_count=70, moving_from=50, fps=10):
+    """Write a small MJPG clip: a static grey scene, then a white box sliding across it"""
+    import cv2
+    import numpy as np
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (160, 120))
+    for i in range(frame_count):
+        frame = np.full((120, 160, 3), 90, np.uint8)
+        if i >= moving_from:
+            x = (i - moving_from) * 6
+            cv2.rectangle(frame, (x, 40), (x + 30, 80), (255, 255, 255), -1)
+        writer.write(frame)
+    writer.release()
+    return path
+
+def ingest_clip(path, **options):
+    """Run a StreamIngestor over a local clip to its end; returns (ingestor, batches)"""
+    from stream_ingest import StreamIngestor
+    batches = []
+    ingestor = StreamIngestor(path, batches.append, sampling_rate=2, batch_interval=2, **options).start()
+    ingestor.thread.join(timeout=30)
+    ingestor.executor.shutdown(wait=True)
+    return ingestor, batches
+
+def test_stream_ingestor_splits_a_clip_into_batches():
+    """Sampled frames are handed over once each, in stream order, in batches of batch_interval seconds"""
+    ingestor, batches = ingest_clip(make_clip(os.path.join(tempfile.mkdtemp(dir=TEST_DIR), 'clip.avi')))
+    assert ingestor.state == 'finished'
+    assert ingestor.stats['frames_read'] == 70 and ingestor.stats['frames_sampled'] == 14
+    timestamps = [[frame['timestamp'] for frame in batch['frames']] for batch in batches]
+    # The frame reaching the interval closes its batch; the rest of the file is flushed as a final partial batch
+    assert timestamps == [[0.0, 0.5, 1.0, 1.5, 2.0], [2.5, 3.0, 3.5, 4.0], [4.5, 5.0, 5.5, 6.0], [6.5]]
+    assert all(frame['jpeg'] for batch in batches for frame in batch['frames'])
+    assert all(batch['started_at'] <= batch['ended_at'] for batch in batches)
+
+def test_stream_ingestor_motion_gate_skips_static_frames():
+    """With a motion gate, idle frames are dropped and a batch with no activity is never submitted"""
+    from motion_gate import MotionGate
+    ingestor, batches = ingest_clip(make_clip(os.path.join(tempfile.mkdtemp(dir=TEST_DIR), 'clip.avi')), gate=MotionGate(0.5))
+    sent = [frame['timestamp'] for batch in batches for frame in batch['frames']]
+    # 2.5-4.0 is a wholly static batch; only the first frame (no reference yet) and the frame before motion starts get through
+    assert ingestor.stats['batches_skipped'] == 1
+    assert not [timestamp for timestamp in sent if 0.0 < timestamp < 4.5]
+    assert {5.0, 5.5, 6.0} <= set(sent)
+    assert ingestor.stats['frames_gated'] == ingestor.stats['frames_sampled'] - len(sent)
+
+def test_stream_ingestor_stops_promptly_and_flushes():
+    """stop() on a looping live-paced source returns at once, flushes the partial batch and leaves the ingestor stopped"""
+    from stream_ingest import StreamIngestor
+    path = make_clip(os.path.join(tempfile.mkdtemp(dir=TEST_DIR), 'clip.avi'))
+    batches = []
+    ingestor = StreamIngestor(path, batches.append, sampling_rate=2, batch_interval=60, loop=True, realtime=True).start()
+    deadline = time.monotonic() + 10
+    while ingestor.stats['frames_sampled'] < 2 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    started = time.monotonic()
+    ingestor.stop(wait=True)
+    assert time.monotonic() - started < 2
+    ingestor.executor.shutdown(wait=True)
+    assert not ingestor.is_running() and ingestor.state == 'stopped'
+    assert len(batches) == 1 and len(batches[0]['frames']) >= 2
+
+def test_supervisor_worker_shutdown_stops_its_cameras(monkeypatch):
+    """A camera worker runs an ingestor per started camera and stops them all on shutdown"""
+    import queue
+    import stream_supervisor
+    monkeypatch.setattr(stream_supervisor, 'STATUS_INTERVAL', 0.2)
+    path = make_clip(os.path.join(tempfile.mkdtemp(dir=TEST_DIR), 'clip.avi'))
+    commands, statuses, handled = queue.Queue(), queue.Queue(), []
+    camera = {'id': 1, 'user_id': 1, 'name': 'yard', 'rtsp_url': path, 'sampling_rate': 2.0,
+              'batch_interval': 60.0, 'motion_sensitivity': None}
+    worker = threading.Thread(target=stream_supervisor.camera_worker, args=(commands, statuses, lambda camera, batch: handled.append(batch)))
+    worker.start()
+    commands.put(('start', camera))
+    reports = []
+    while not any(report.get('frames_sampled') for _, report in reports):
+        reports.append(statuses.get(timeout=10))
+    commands.put(('shutdown', None))
+    worker.join(timeout=10)
+    assert not worker.is_alive()
+    while not statuses.empty():
+        reports.append(statuses.get())
+    assert reports[-1] == (1, {'state': 'stopped'})
+
+class FakeTwilioHandler(BaseHTTPRequestHandler):
+    """Local stand-in for the Twilio Messages API: answers each POST with the next scripted
+    (status, headers, delay) response, then 201 with a message SID, and records the forms it got"""
+    responses = []
+    received = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        form = dict(parse_qsl(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()))
+        FakeTwilioHandler.received.append((self.path, form))
+        status, headers, delay = FakeTwilioHandler.responses.pop(0) if FakeTwilioHandler.responses else (201, {}, 0)
+        time.sleep(delay)
+        payload = json.dumps({'sid': f'SM{len(FakeTwilioHandler.received)}'} if status < 400 else {'message': 'failed'}).encode()
+        try:
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except OSError:
+            pass  # the client gave up waiting
+
+def fake_twilio(responses=(), timeout=2.0):
+    """Serve FakeTwilioHandler locally and point the shared Twilio client at it"""
+    from twilio_client import configure_twilio_client
+    FakeTwilioHandler.responses = list(responses)
+    FakeTwilioHandler.received = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeTwilioHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = configure_twilio_client(account_sid='ACtest', auth_token='secret', from_number='whatsapp:+15550000000',
+                                     base_url=f'http://127.0.0.1:{server.server_port}', timeout=timeout,
+                                     max_retries=3, backoff_base=0.01)
+    return server, client
+
+def test_twilio_client_retries_rate_limits_and_server_errors():
+    server, client = fake_twilio([(429, {'Retry-After': '0'}, 0), (503, {}, 0)])
+    try:
+        assert client.send_message('whatsapp:+15551234567', 'Hello') == 'SM3'
+    finally:
+        server.shutdown()
+    assert len(FakeTwilioHandler.received) == 3
+    path, form = FakeTwilioHandler.received[-1]
+    assert path == '/2010-04-01/Accounts/ACtest/Messages.json'
+    assert form == {'From': 'whatsapp:+15550000000', 'To': 'whatsapp:+15551234567', 'Body': 'Hello'}
+
+def test_twilio_client_does_not_retry_client_errors_or_read_timeouts():
+    import httpx
+    from twilio_client import TwilioError
+    server, client = fake_twilio([(400, {}, 0)])
+    try:
+        with pytest.raises(TwilioError) as error:
+            client.send_message('whatsapp:+15551234567', 'Hello')
+        assert error.value.status_code == 400 and len(FakeTwilioHandler.received) == 1
+    finally:
+        server.shutdown()
+
+    # Twilio may have sent a message whose response timed out, so resending could deliver it twice
+    server, client = fake_twilio([(201, {}, 1.0)], timeout=0.2)
+    try:
+        with pytest.raises(httpx.ReadTimeout):
+            client.send_message('whatsapp:+15551234567', 'Hello')
+        assert len(FakeTwilioHandler.received) == 1
+    finally:
+        server.shutdown()
+
+def whatsapp_delivery(backend, sid, body='what happened at the gate?', number='whatsapp:+15551234567'):
+    return backend.app.test_client().post('/twilio/webhook', data={'From': number, 'Body': body, 'MessageSid': sid})
+
+def wait_for_whatsapp_message(backend, sid, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with backend.app.app_context():
+            message = backend.db.session.get(backend.WhatsAppMessage, sid)
+            if message is not None and message.status in ('replied', 'failed'):
+                return message
+        time.sleep(0.05)
+    raise AssertionError(f'WhatsApp message {sid} was not answered in time')
+
+def test_twilio_webhook_acks_at_once_and_replies_through_rest_api(monkeypatch):
+    backend = load_backend()
+    monkeypatch.setenv('TWILIO_AUTH_TOKEN', 'secret')
+    monkeypatch.setenv('TWILIO_ACCOUNT_SID', 'ACtest')
+    monkeypatch.setenv('SKIP_TWILIO_VALIDATION', 'true')
+    number = f'whatsapp:+1555{uuid.uuid4().int % 10 ** 7:07d}'
+    with backend.app.app_context():
+        user = make_user(backend)
+        user.whatsapp_number = number
+        backend.db.session.commit()
+    queries = []
+
+    def process_whatsapp_query(user, query):
+        queries.append(query)
+        time.sleep(0.5)  # a slow model call
+        return 'A courier left a parcel.'
+
+    monkeypatch.setattr(backend, 'process_whatsapp_query', process_whatsapp_query)
+    server, _ = fake_twilio()
+    try:
+        sid = f'SM{uuid.uuid4().hex}'
+        started = time.monotonic()
+        response = whatsapp_delivery(backend, sid, number=number)
+        assert time.monotonic() - started < 0.4
+        assert response.status_code == 200 and response.data == b'<Response></Response>'
+
+        # Twilio retrying the delivery does not answer the message twice
+        assert whatsapp_delivery(backend, sid, number=number).data == b'<Response></Response>'
+        message = wait_for_whatsapp_message(backend, sid)
+        time.sleep(0.2)
+    finally:
+        server.shutdown()
+    assert queries == ['what happened at the gate?']
+    assert (message.status, message.reply, message.reply_sid) == ('replied', 'A courier left a parcel.', 'SM1')
+    assert [form for _, form in FakeTwilioHandler.received] == [
+        {'From': 'whatsapp:+15550000000', 'To': number, 'Body': 'A courier left a parcel.'}]
+
+def logged_in_client(backend):
+    """Test client with a session for a new user; returns (client, user_id)"""
+    with backend.app.app_context():
+        user_id = make_user(backend).id
+    client = backend.app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return client, user_id
+
+def start_chunked_upload(backend, monkeypatch, data):
+    monkeypatch.setattr(backend, 'submit_ingestion', lambda video_id: None)
+    client, _ = logged_in_client(backend)
+    response = client.post('/api/uploads', json={'filename': 'yard.mp4', 'total_size': len(data)})
+    assert response.status_code == 201
+    return client, response.json['upload_id']
+
+def test_chunked_upload_resumes_after_an_interrupted_chunk(monkeypatch):
+    backend = load_backend()
+    data = os.urandom(4000)
+    client, upload_id = start_chunked_upload(backend, monkeypatch, data)
+    assert client.put(f'/api/uploads/{upload_id}?offset=0', data=data[:1500]).json['received_bytes'] == 1500
+    # The connection drops 500 bytes into a 1500 byte chunk; what arrived is kept
+    client.put(f'/api/uploads/{upload_id}?offset=1500', input_stream=io.BytesIO(data[1500:2000]), content_length=1500)
+    offset = client.get(f'/api/uploads/{upload_id}').json['received_bytes']
+    assert offset == 2000
+
+    response = client.put(f'/api/uploads/{upload_id}', data=data[offset:], headers={'Upload-Offset': str(offset)})
+    assert response.json['received_bytes'] == len(data)
+    response = client.post(f'/api/uploads/{upload_id}/finalize', json={'sha256': hashlib.sha256(data).hexdigest()})
+    assert response.status_code == 201
+    with backend.app.app_context():
+        video = backend.db.session.get(backend.Video, response.json['video_id'])
+        assert (video.file_size, video.content_hash) == (len(data), hashlib.sha256(data).hexdigest())
+        with open(video.file_path_or_url, 'rb') as f:
+            assert f.read() == data
+
+def test_chunked_upload_rejects_out_of_order_offsets(monkeypatch):
+    backend = load_backend()
+    data = os.urandom(1000)
+    client, upload_id = start_chunked_upload(backend, monkeypatch, data)
+    client.put(f'/api/uploads/{upload_id}?offset=0', data=data[:400])
+    # A chunk from the future and a replayed chunk are both refused, with the offset to resume from
+    for offset in (700, 0):
+        response = client.put(f'/api/uploads/{upload_id}?offset={offset}', data=data[offset:offset + 300])
+        assert response.status_code == 409 and response.json['received_bytes'] == 400
+    response = client.put(f'/api/uploads/{upload_id}?offset=400', data=data[400:] + b'extra')
+    assert response.status_code == 400
+    assert client.get(f'/api/uploads/{upload_id}').json['received_bytes'] == 400
+
+def test_chunked_upload_finalize_checks_size_and_hash(monkeypatch):
+    backend = load_backend()
+    data = os.urandom(3000)
+    client, upload_id = start_chunked_upload(backend, monkeypatch, data)
+    client.put(f'/api/uploads/{upload_id}?offset=0', data=data[:1000])
+    response = client.post(f'/api/uploads/{upload_id}/finalize', json={})
+    assert response.status_code == 409 and response.json['received_bytes'] == 1000
+
+    client.put(f'/api/uploads/{upload_id}?offset=1000', data=data[1000:])
+    # Another process took the remaining chunks, so this one has no running hash and rereads the file
+    backend.upload_hashers.pop(upload_id, None)
+    response = client.post(f'/api/uploads/{upload_id}/finalize', json={'sha256': hashlib.sha256(b'other').hexdigest()})
+    assert response.status_code == 400 and response.json['sha256'] == hashlib.sha256(data).hexdigest()
+    assert client.get(f'/api/uploads/{upload_id}').json['status'] == 'active'
+
+    response = client.post(f'/api/uploads/{upload_id}/finalize', json={'sha256': hashlib.sha256(data).hexdigest().upper()})
+    assert response.status_code == 201 and response.json['sha256'] == hashlib.sha256(data).hexdigest()
+    # Finalizing again (e.g. a retried request) returns the same video
+    assert client.post(f'/api/uploads/{upload_id}/finalize', json={}).json['video_id'] == response.json['video_id']
+
+def make_uploaded_file(backend, user_id, data):
+    """An uploaded video file and its row; returns the file name served by /api/video_file/"""
+    filename = f'{uuid.uuid4().hex}.mp4'
+    path = os.path.join(backend.app.config['UPLOAD_FOLDER'], filename)
+    with open(path, 'wb') as f:
+        f.write(data)
+    with backend.app.app_context():
+        backend.db.session.add(backend.Video(user_id=user_id, video_name=filename, video_type='upload', file_path_or_url=path,
+                                             content_hash=hashlib.sha256(data).hexdigest(), is_processed=True))
+        backend.db.session.commit()
+    return filename
+
+def test_video_file_is_served_to_its_owner_with_ranges_and_etags():
+    backend = load_backend()
+    data = os.urandom(1000)
+    client, user_id = logged_in_client(backend)
+    filename = make_uploaded_file(backend, user_id, data)
+    url = f'/api/video_file/{filename}'
+
+    response = client.get(url)
+    assert response.status_code == 200 and response.data == data
+    assert response.headers['ETag'] == f'"{hashlib.sha256(data).hexdigest()}"'
+    assert response.headers['Accept-Ranges'] == 'bytes' and 'private' in response.headers['Cache-Control']
+
+    response = client.get(url, headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 206 and response.data == data[100:200]
+    assert response.headers['Content-Range'] == 'bytes 100-199/1000'
+    assert client.get(url, headers={'Range': 'bytes=900-'}).headers['Content-Range'] == 'bytes 900-999/1000'
+
+    assert client.get(url, headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+def test_video_file_needs_a_session_or_a_valid_signature(monkeypatch):
+    backend = load_backend()
+    _, user_id = logged_in_client(backend)
+    filename = make_uploaded_file(backend, user_id, os.urandom(100))
+    url = f'/api/video_file/{filename}'
+    anonymous = backend.app.test_client()
+    other_user, _ = logged_in_client(backend)
+    assert anonymous.get(url).status_code == 404
+    assert other_user.get(url).status_code == 404
+
+    with backend.app.app_context():
+        signed = backend.sign_video_url(url)
+        expires = int(time.time()) - 1
+        expired = f'{url}?expires={expires}&sig={backend.video_file_signature(filename, expires)}'
+        other_file_sig = backend.video_file_signature('other.mp4', int(time.time()) + 60)
+    assert anonymous.get(signed).status_code == 200
+    assert anonymous.get(expired).status_code == 404
+    # A signature for another file, or one whose expiry was pushed back, is refused
+    assert anonymous.get(f'{url}?expires={int(time.time()) + 60}&sig={other_file_sig}').status_code == 404
+    extended = signed.replace('expires=', 'expires=9')
+    assert anonymous.get(extended).status_code == 404
+
+    monkeypatch.setattr(backend, 'PUBLIC_VIDEO_FILES', True)
+    assert anonymous.get(url).status_code == 200
+
+def test_video_list_keyset_pages_are_stable_with_equal_timestamps():
+    """Cursor pages walk every video exactly once in (favorite, upload date, id) order, even when upload dates tie"""
+    backend = load_backend()
+    client, user_id = logged_in_client(backend)
+    with backend.app.app_context():
+        for i in range(7):
+            backend.db.session.add(backend.Video(user_id=user_id, video_name=f'cam{i}.mp4', video_type='url',
+                                                 file_path_or_url=f'https://example.com/{i}.mp4', is_favorite=i in (2, 5)))
+        backend.db.session.commit()
+        # Stored the way the server default writes them, all in the same second
+        backend.db.session.execute(backend.db.text("UPDATE video SET upload_date = '2026-01-01 12:00:00' WHERE user_id = :user_id"),
+                                   {'user_id': user_id})
+        backend.db.session.commit()
+        expected = [video.id for video in backend.Video.query.filter_by(user_id=user_id).order_by(
+            backend.Video.is_favorite.desc(), backend.Video.id.desc())]
+
+    first = client.get('/api/videos?per_page=3&include_total=false').json
+    assert first['pagination']['has_prev'] is False and first['pagination']['has_next'] is True
+    seen, pages, page = [video['id'] for video in first['videos']], 1, first
+    while page['pagination']['next_cursor']:
+        page = client.get(f"/api/videos?per_page=3&cursor={page['pagination']['next_cursor']}").json
+        assert page['pagination']['has_prev'] is True and page['pagination']['total'] is None
+        seen += [video['id'] for video in page['videos']]
+        pages += 1
+    assert seen == expected and pages == 3
+    # The last page says so and offers no cursor
+    assert page['pagination']['has_next'] is False and page['pagination']['next_cursor'] is None
+
+    last_full = client.get('/api/videos?per_page=7').json['pagination']
+    assert last_full['has_next'] is False and last_full['next_cursor'] is None and last_full['total'] == 7
+    assert client.get('/api/videos?cursor=not-a-cursor').status_code == 400
+
+def test_chat_history_keyset_pages_are_stable_with_equal_timestamps():
+    backend = load_backend()
+    client, user_id = logged_in_client(backend)
+    with backend.app.app_context():
+        video = backend.Video(user_id=user_id, video_name='lobby.mp4', video_type='url', file_path_or_url='https://example.com/lobby.mp4')
+        backend.db.session.add(video)
+        backend.db.session.commit()
+        video_id = video.id
+        backend.db.session.add_all([backend.ChatHistory(video_id=video_id, user_id=user_id, question=f'Q{i}', answer=f'A{i}') for i in range(5)])
+        backend.db.session.commit()
+        backend.db.session.execute(backend.db.text("UPDATE chat_history SET timestamp = '2026-01-01 12:00:00' WHERE video_id = :video_id"),
+                                   {'video_id': video_id})
+        backend.db.session.commit()
+
+    page = client.get(f'/api/chat_history/{video_id}?limit=2').json
+    questions = [chat['question'] for chat in page['chats']]
+    while page['next_cursor']:
+        page = client.get(f"/api/chat_history/{video_id}?limit=2&cursor={page['next_cursor']}").json
+        questions += [chat['question'] for chat in page['chats']]
+    assert questions == ['Q0', 'Q1', 'Q2', 'Q3', 'Q4']
+    assert len(page['chats']) == 1 and page['next_cursor'] is None
+
 if __name__ == "__main__":
     test_backend_connection()
+
+ROUTER_NOW = datetime(2026, 10, 15, 14, 30)  # a Thursday
+ROUTER_NAMES = [(1, 'Front Door Camera'), (2, 'Back Garden Camera'), (3, 'driveway.mp4'), (4, 'Camera 1'),
+                (5, 'Camera 2'), (6, 'Front Gate'), (7, 'driveway.mp4'), (8, 'delivery at front door.mp4')]
+
+@pytest.mark.parametrize('text, expected', [
+    ('front door', [1]),
+    ('anything on the back gardn', [2]),  # misspelt
+    ('garden camera', [2]),
+    ('camera 2', [5]),
+    ('camera 3', []),  # numbers only match exactly
+    ('drivway yesterday', [7, 3]),  # two videos with one name: the newer first
+    ('front', []),  # a word shared by several names is not enough
+    ('hello', []),
+])
+def test_name_index_resolves_fuzzy_and_ambiguous_names(text, expected):
+    from whatsapp_router import NameIndex
+    assert [key for key, _ in NameIndex(ROUTER_NAMES).match(text)] == expected
+
+@pytest.mark.parametrize('text, start, end', [
+    ('what happened yesterday', datetime(2026, 10, 14), datetime(2026, 10, 15)),
+    ('today', datetime(2026, 10, 15), datetime(2026, 10, 16)),
+    ('last night', datetime(2026, 10, 14, 18), datetime(2026, 10, 15, 6)),
+    ('yesterday evening', datetime(2026, 10, 14, 18), datetime(2026, 10, 15)),
+    ('this morning', datetime(2026, 10, 15, 6), datetime(2026, 10, 15, 12)),
+    ('monday', datetime(2026, 10, 12), datetime(2026, 10, 13)),
+    ('last monday', datetime(2026, 10, 12), datetime(2026, 10, 13)),
+    ('thursday', datetime(2026, 10, 15), datetime(2026, 10, 16)),
+    ('last thursday', datetime(2026, 10, 8), datetime(2026, 10, 9)),
+    ('this week', datetime(2026, 10, 12), datetime(2026, 10, 16)),
+    ('last week', datetime(2026, 10, 5), datetime(2026, 10, 12)),
+    ('3 hours ago', datetime(2026, 10, 15, 11, 30), datetime(2026, 10, 15, 12, 30)),
+    ('2 days ago', datetime(2026, 10, 13), datetime(2026, 10, 14)),
+    ('last 6 hours', datetime(2026, 10, 15, 8, 30), ROUTER_NOW),
+    ('on 2026-10-03', datetime(2026, 10, 3), datetime(2026, 10, 4)),
+    ('12 october', datetime(2026, 10, 12), datetime(2026, 10, 13)),
+    ('3rd of march', datetime(2026, 3, 3), datetime(2026, 3, 4)),
+    ('october 20', datetime(2025, 10, 20), datetime(2025, 10, 21)),  # not yet this year: last year's
+])
+def test_date_phrases_resolve_to_local_ranges(text, start, end):
+    from whatsapp_router import resolve_date_phrase
+    assert resolve_date_phrase(text, ROUTER_NOW)[:2] == (start, end)
+
+@pytest.mark.parametrize('text', ['2026-02-30', 'any cars at the gate'])
+def test_invalid_or_missing_dates_are_ignored(text):
+    from whatsapp_router import resolve_date_phrase
+    assert resolve_date_phrase(text, ROUTER_NOW) is None
+
+def test_route_message_strips_the_date_phrase_before_matching():
+    from whatsapp_router import route_message
+    route = route_message('What happened on the front gate cam last monday?', ROUTER_NOW)
+    assert route['intent'] == 'analyze' and route['target'] == 'cameras'
+    assert route['date'] == (datetime(2026, 10, 12), datetime(2026, 10, 13), 'last monday')
+    assert 'monday' not in route['text']
+    assert route_message('list my videos', ROUTER_NOW)['intent'] == 'list'
+
+@pytest.mark.parametrize('reply, expected', [
+    ('{"answers": [{"id": 1, "answer": "A car."}, {"id": 2, "answer": "Nobody."}]}', ['A car.', 'Nobody.']),
+    ('Sure:\n```json\n{"answers": [{"id": "2", "answer": " Nobody. "}, {"id": 1, "answer": "A car."}]}\n```',
+     ['A car.', 'Nobody.']),
+    ('{"answers": [{"id": 1, "answer": "A car."}]}', ['A car.', None]),  # fewer answers than questions
+    ('{"answers": [{"id": 3, "answer": "Extra."}, {"id": "x", "answer": "?"}, {"id": 2, "answer": "  "}]}', [None, None]),
+    ('{"answers": [{"id": 1, "answer": "A car."}, "Nobody."]}', ['A car.', None]),
+    ('{"answers": [{"id": 1, "answer": "A car."}', [None, None]),  # cut off
+    ('A car parks, then nobody comes.', [None, None]),
+    ('[{"id": 1, "answer": "A car."}]', [None, None]),
+    (None, [None, None]),
+])
+def test_split_batch_answers_handles_malformed_replies(reply, expected):
+    backend = load_backend()
+    assert backend.split_batch_answers(reply, 2) == expected
+
+def stub_batch_model(backend, monkeypatch, reply):
+    """Batch calls get `reply`; questions asked alone are recorded and answered by 'single-model'"""
+    batch_calls, single_calls = [], []
+
+    def run_qwen_analysis(video_url, prompt, route=None, **kwargs):
+        batch_calls.append(prompt)
+        route['model'] = 'batch-model'
+        return reply
+
+    def answer_question(video, question, video_url, tier, sampling, max_frames, use_index=True, route=None, **kwargs):
+        single_calls.append(question)
+        route['model'] = 'single-model'
+        return f'Alone: {question}', False
+    monkeypatch.setattr(backend, 'prepare_video_frames', lambda video, sampling, max_frames: None)
+    monkeypatch.setattr(backend, 'run_qwen_analysis', run_qwen_analysis)
+    monkeypatch.setattr(backend, 'answer_question', answer_question)
+    return batch_calls, single_calls
+
+def test_answer_questions_asks_unanswered_questions_alone(monkeypatch):
+    """One call for the batch; only the questions its reply missed are asked again"""
+    backend = load_backend()
+    batch_calls, single_calls = stub_batch_model(
+        backend, monkeypatch, '{"answers": [{"id": 1, "answer": "A car."}, {"id": 3, "answer": "At noon."}]}')
+    questions = ['Any cars?', 'Any people?', 'When?']
+    with backend.app.app_context():
+        video = make_video(backend, make_user(backend))
+        answers, models, from_index = backend.answer_questions(video, questions, video.file_path_or_url, 'fast', 'none', 8)
+    assert len(batch_calls) == 1 and all(question in batch_calls[0] for question in questions)
+    assert single_calls == ['Any people?']
+    assert answers == ['A car.', 'Alone: Any people?', 'At noon.']
+    assert models == ['batch-model', 'single-model', 'batch-model']
+    assert from_index is False
+
+def test_answer_questions_falls_back_to_single_questions_on_a_malformed_reply(monkeypatch):
+    backend = load_backend()
+    batch_calls, single_calls = stub_batch_model(backend, monkeypatch, 'I cannot format that as JSON.')
+    with backend.app.app_context():
+        video = make_video(backend, make_user(backend))
+        answers, models, _ = backend.answer_questions(video, ['Any cars?', 'Any people?'], video.file_path_or_url, 'fast', 'none', 8)
+    assert len(batch_calls) == 1
+    assert single_calls == ['Any cars?', 'Any people?']
+    assert answers == ['Alone: Any cars?', 'Alone: Any people?']
+    assert models == ['single-model', 'single-model']
+
+def test_answer_questions_asks_a_single_question_directly(monkeypatch):
+    backend = load_backend()
+    batch_calls, single_calls = stub_batch_model(backend, monkeypatch, None)
+    with backend.app.app_context():
+        video = make_video(backend, make_user(backend))
+        assert backend.answer_questions(video, ['Any cars?'], video.file_path_or_url, 'fast', 'none', 8) == (
+            ['Alone: Any cars?'], ['single-model'], False)
+    assert batch_calls == [] and single_calls == ['Any cars?']
+
+def test_answer_cache_key_covers_footage_question_tier_prompt_and_variant():
+    backend = load_backend()
+    with backend.app.app_context():
+        user = make_user(backend)
+        video, other = make_video(backend, user), make_video(backend, user)
+        prompt, frames = backend.ANALYSIS_SYSTEM_PROMPT, backend.frames_variant('none', 8)
+        key = backend.answer_cache_key(video, 'Any cars?', 'fast', prompt, frames)
+        # Equivalent wording shares the key
+        assert backend.answer_cache_key(video, '  any   CARS ', 'fast', prompt, frames) == key
+        assert len({key,
+                    backend.answer_cache_key(other, 'Any cars?', 'fast', prompt, frames),
+                    backend.answer_cache_key(video, 'Any people?', 'fast', prompt, frames),
+                    backend.answer_cache_key(video, 'Any cars?', 'quality', prompt, frames),
+                    backend.answer_cache_key(video, 'Any cars?', 'fast', backend.TIMELINE_SYSTEM_PROMPT, frames),
+                    backend.answer_cache_key(video, 'Any cars?', 'fast', prompt, backend.frames_variant('keyframes', 8))}) == 6
+
+def test_answer_cache_entries_expire_after_the_ttl(monkeypatch):
+    backend = load_backend()
+    monkeypatch.setattr(backend, 'ANSWER_CACHE_TTL', 60)
+    key = uuid.uuid4().hex
+    with backend.app.app_context():
+        backend.store_cached_answer(key, 'A car.', 'stub-model')
+        backend.db.session.commit()
+        assert backend.get_cached_answer(key).answer == 'A car.'
+
+        backend.db.session.get(backend.AnswerCache, key).created_at -= backend.timedelta(seconds=61)
+        backend.db.session.commit()
+        assert backend.get_cached_answer(key) is None
+        assert backend.db.session.get(backend.AnswerCache, key) is None
+
+def test_answer_cache_evicts_least_recently_used_at_capacity(monkeypatch):
+    backend = load_backend()
+    monkeypatch.setattr(backend, 'ANSWER_CACHE_MAX_ENTRIES', 2)
+    keys = [uuid.uuid4().hex for _ in range(3)]
+    with backend.app.app_context():
+        backend.AnswerCache.query.delete()
+        backend.store_cached_answer(keys[0], 'first', 'stub-model')
+        backend.store_cached_answer(keys[1], 'second', 'stub-model')
+        backend.db.session.commit()
+        for key in keys[:2]:
+            backend.db.session.get(backend.AnswerCache, key).last_accessed_at -= backend.timedelta(seconds=10)
+        backend.db.session.commit()
+        # Reading the first entry makes the second the least recently used
+        assert backend.get_cached_answer(keys[0]).hit_count == 1
+
+        backend.store_cached_answer(keys[2], 'third', 'stub-model')
+        backend.db.session.commit()
+        assert backend.db.session.get(backend.AnswerCache, keys[1]) is None
+        assert {entry.key for entry in backend.AnswerCache.query} == {keys[0], keys[2]}
+
+class FakeModelHandler(BaseHTTPRequestHandler):
+    """Local OpenAI-compatible chat completions endpoint: answers each POST with the next scripted
+    (status, headers, delay) response, then 200; streams `stream_pieces` when asked to stream"""
+    protocol_version = 'HTTP/1.1'
+    responses = []
+    received = []
+    stream_pieces = ['Two ', '', None, 'cars']
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status, headers, payload):
+        payload = json.dumps(payload).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        FakeModelHandler.received.append(body)
+        status, headers, delay = FakeModelHandler.responses.pop(0) if FakeModelHandler.responses else (200, {}, 0)
+        time.sleep(delay)
+        try:
+            if status >= 400:
+                self.send_json(status, headers, {'error': {'message': 'scripted failure', 'type': 'error'}})
+            elif body.get('stream'):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.end_headers()
+                for piece in FakeModelHandler.stream_pieces:
+                    chunk = {'id': 'fake', 'object': 'chat.completion.chunk', 'created': 0, 'model': body.get('model'),
+                             'choices': [{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}]}
+                    self.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode())
+                # Usage arrives in a final chunk without choices
+                chunk = {'id': 'fake', 'object': 'chat.completion.chunk', 'created': 0, 'model': body.get('model'), 'choices': []}
+                self.wfile.write(f'data: {json.dumps(chunk)}\n\ndata: [DONE]\n\n'.encode())
+                self.close_connection = True
+            else:
+                self.send_json(200, headers, {
+                    'id': 'fake', 'object': 'chat.completion', 'created': 0, 'model': body.get('model'),
+                    'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': 'Two cars.'}, 'finish_reason': 'stop'}],
+                })
+        except OSError:
+            pass  # the client gave up waiting
+
+def fake_model(responses=(), **settings):
+    """Serve FakeModelHandler locally and return a ModelClient pointed at it"""
+    from model_client import ModelClient
+    FakeModelHandler.responses = list(responses)
+    FakeModelHandler.received = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeModelHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    settings = {'max_retries': 3, 'backoff_base': 0.01, **settings}
+    return server, ModelClient('test-key', base_url=f'http://127.0.0.1:{server.server_port}/v1', **settings)
+
+def ask_model(client, **kwargs):
+    return client.chat_completion(model='qwen-vl-plus', messages=[{'role': 'user', 'content': 'Any cars?'}], **kwargs)
+
+def test_model_client_retries_rate_limits_and_server_errors_honouring_retry_after():
+    server, client = fake_model([(429, {'Retry-After': '0.3'}, 0), (503, {}, 0)])
+    try:
+        started = time.monotonic()
+        assert ask_model(client).choices[0].message.content == 'Two cars.'
+        assert time.monotonic() - started >= 0.3
+        assert len(FakeModelHandler.received) == 3
+    finally:
+        client.close()
+        server.shutdown()
+
+def test_model_client_does_not_retry_client_errors_or_past_max_retries():
+    from openai import APIStatusError
+    server, client = fake_model([(400, {}, 0)])
+    try:
+        with pytest.raises(APIStatusError) as error:
+            ask_model(client)
+        assert error.value.status_code == 400 and len(FakeModelHandler.received) == 1
+
+        FakeModelHandler.responses = [(503, {}, 0)] * 3
+        FakeModelHandler.received = []
+        with pytest.raises(APIStatusError):
+            ask_model(client, retries=2)
+        assert len(FakeModelHandler.received) == 3
+    finally:
+        client.close()
+        server.shutdown()
+
+def test_model_client_gives_up_at_the_work_deadline():
+    """Queued calls past their deadline are dropped; a slow answer fails at its timeout, without retries"""
+    from openai import APITimeoutError
+    from scheduler import WHATSAPP, DeadlineExceeded, scheduled
+    server, client = fake_model([(200, {}, 0.6)], max_concurrency=1)
+    try:
+        busy = threading.Thread(target=ask_model, args=(client,))
+        busy.start()
+        time.sleep(0.1)
+        with scheduled(WHATSAPP, deadline=0.2), pytest.raises(DeadlineExceeded):
+            ask_model(client)
+        busy.join(5)
+        assert len(FakeModelHandler.received) == 1
+
+        FakeModelHandler.responses = [(200, {}, 1.0)]
+        with pytest.raises(APITimeoutError):
+            ask_model(client, timeout=0.2, retries=0)
+        assert len(FakeModelHandler.received) == 2
+    finally:
+        client.close()
+        server.shutdown()
+
+def test_model_client_streams_text_pieces_and_retries_before_the_first():
+    server, client = fake_model([(503, {}, 0)])
+    try:
+        pieces = list(client.stream_chat_completion(model='qwen-vl-plus', messages=[{'role': 'user', 'content': 'Any cars?'}]))
+        assert pieces == ['Two ', 'cars']
+        assert len(FakeModelHandler.received) == 2 and FakeModelHandler.received[-1]['stream'] is True
+    finally:
+        client.close()
+        server.shutdown()
+
+def add_embedding(backend, user, video, text, id=None):
+    vector = backend.get_embedder().embed([text])[0]
+    row = backend.Embedding(id=id, user_id=user.id, video_id=video.id, kind='chat', ref_id=uuid.uuid4().int % 10 ** 9,
+                            model=backend.get_embedder().name, vector=vector.tobytes())
+    backend.db.session.add(row)
+    backend.db.session.commit()
+    return row.id
+
+def test_vector_index_loads_rows_committed_out_of_id_order():
+    """A row whose id was taken before an already loaded one, but committed after it, is still loaded"""
+    backend = load_backend()
+    with backend.app.app_context():
+        user = make_user(backend)
+        video = make_video(backend, user)
+        top = backend.db.session.query(backend.db.func.max(backend.Embedding.id)).scalar() or 0
+        later = add_embedding(backend, user, video, 'a red car parks by the gate', id=top + 100)
+        backend.refresh_vector_index()
+        earlier = add_embedding(backend, user, video, 'a dog runs across the garden', id=top + 50)
+        index = backend.refresh_vector_index()
+        assert {key for key, _ in index.search(user.id, backend.get_embedder().embed(['car dog'])[0], k=10)} == {earlier, later}
+
+        # Rows already loaded inside the overlap window are not added twice
+        assert len(backend.refresh_vector_index()) == len(index)
+
+def test_deleted_embeddings_leave_the_index_only_after_commit():
+    backend = load_backend()
+    with backend.app.app_context():
+        user = make_user(backend)
+        video = make_video(backend, user)
+        key = add_embedding(backend, user, video, 'a delivery van stops at the entrance')
+        query = backend.get_embedder().embed(['delivery van'])[0]
+        index = backend.refresh_vector_index()
+        assert key in [hit for hit, _ in index.search(user.id, query)]
+
+        # A rolled back deletion keeps its vectors searchable
+        backend.delete_embeddings(video_id=video.id)
+        backend.db.session.rollback()
+        assert key in [hit for hit, _ in backend.refresh_vector_index().search(user.id, query)]
+
+        removed = backend.delete_embeddings(video_id=video.id)
+        backend.db.session.commit()
+        backend.drop_from_vector_index(removed)
+        assert key not in [hit for hit, _ in backend.refresh_vector_index().search(user.id, query)]
+
+def test_motion_gate_flags_moving_frames_and_counts_avoided_calls():
+    import cv2
+    from motion_gate import MotionGate
+    capture = cv2.VideoCapture(make_clip(os.path.join(tempfile.mkdtemp(dir=TEST_DIR), 'clip.avi')))
+    gate, flags = MotionGate(0.5), []
+    while True:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        flags.append(gate.check(frame))
+    capture.release()
+    # The first frame has nothing to compare with and always counts as active
+    assert flags == [True] + [False] * 49 + [True] * 20
+    assert gate.select_window(flags[10:40]) == []
+    # A burst keeps the idle frame just before it, for context
+    assert gate.select_window(flags[45:55]) == [4, 5, 6, 7, 8, 9]
+    assert gate.report() == {'frames_seen': 70, 'frames_active': 21, 'windows_seen': 2, 'windows_forwarded': 1,
+                             'frames_skipped': 49, 'model_calls_avoided': 1}
+
+def test_motion_gate_keeps_idle_footage_out_of_keyframes_and_segments():
+    from frame_sampler import extract_keyframes, extract_segments
+    workdir = tempfile.mkdtemp(dir=TEST_DIR)
+    clip = make_clip(os.path.join(workdir, 'clip.avi'))
+    stats = {}
+    frames = extract_keyframes(clip, os.path.join(workdir, 'keyframes'), strategy='uniform', max_frames=4,
+                               motion_sensitivity=0.5, stats=stats)
+    assert stats == {'frames_considered': 14, 'frames_idle': 9}
+    assert [frame['timestamp'] for frame in frames] == [0.0, 5.0, 6.0, 6.5]
+
+    segments = extract_segments(clip, os.path.join(workdir, 'segments'), segment_seconds=2, frames_per_segment=2,
+                                motion_sensitivity=0.5)
+    assert [(segment['start'], segment['active'], len(segment['frames'])) for segment in segments] == [
+        (0, True, 2), (2, False, 0), (4, True, 2), (6, True, 2)]
+
+def test_motion_gate_counters_are_exact_under_concurrent_updates(monkeypatch):
+    backend = load_backend()
+    monkeypatch.setattr(backend, 'motion_gate_stats', {'frames_considered': 0, 'frames_skipped': 0, 'segments_skipped': 0})
+
+    def count():
+        for _ in range(2000):
+            backend.count_motion_gate_event('frames_considered', 2)
+            backend.count_motion_gate_event('frames_skipped')
+    threads = [threading.Thread(target=count) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert backend.motion_gate_stats == {'frames_considered': 32000, 'frames_skipped': 16000, 'segments_skipped': 0}
+
+def make_upload(backend, **fields):
+    with backend.app.app_context():
+        video = make_video(backend, make_user(backend))
+        video.video_type, video.is_processed = 'upload', False
+        for name, value in fields.items():
+            setattr(video, name, value)
+        backend.db.session.commit()
+        return video.id
+
+def test_ingestion_and_indexing_claims_leave_live_work_to_its_process(monkeypatch):
+    """Uploads claimed by a live process are skipped by others; claims older than STALE_WORK_SECONDS are retaken"""
+    backend = load_backend()
+    probed, captioned = [], []
+    monkeypatch.setattr(backend, 'probe_video', lambda path: probed.append(path) or {'duration': 7})
+    monkeypatch.setattr(backend.os.path, 'getsize', lambda path: 1024)
+    monkeypatch.setattr(backend, 'make_thumbnail', lambda path, thumbnail_path: False)
+    monkeypatch.setattr(backend, 'prepare_video_frames', lambda video, sampling, max_frames: None)
+    monkeypatch.setattr(backend, 'extract_segments', lambda *args, **kwargs: captioned.append(args[0]) or [])
+    now = backend.datetime.utcnow()
+    stale = now - backend.timedelta(seconds=backend.STALE_WORK_SECONDS + 60)
+    live_id = make_upload(backend, ingest_started_at=now)
+    stale_id = make_upload(backend, ingest_started_at=stale)
+    indexing_live_id = make_upload(backend, is_processed=True, index_status='indexing', index_started_at=now)
+    indexing_stale_id = make_upload(backend, is_processed=True, index_status='indexing', index_started_at=stale)
+    submitted = []
+    monkeypatch.setattr(backend, 'submit_ingestion', lambda video_id: submitted.append(('ingest', video_id)))
+    monkeypatch.setattr(backend, 'submit_indexing', lambda video_id: submitted.append(('index', video_id)))
+    with backend.app.app_context():
+        backend.resume_pending_ingestion()
+    assert {('ingest', stale_id), ('index', indexing_stale_id)} <= set(submitted)
+    assert not {('ingest', live_id), ('index', indexing_live_id)} & set(submitted)
+
+    for video_id in (live_id, stale_id):
+        backend.run_ingestion(video_id)
+    for video_id in (indexing_live_id, indexing_stale_id):
+        backend.run_video_indexing(video_id)
+    assert len(probed) == 1 and len(captioned) == 1
+    with backend.app.app_context():
+        assert backend.db.session.get(backend.Video, live_id).is_processed is False
+        assert backend.db.session.get(backend.Video, stale_id).is_processed is True
+        assert backend.db.session.get(backend.Video, indexing_live_id).index_status == 'indexing'
+        assert backend.db.session.get(backend.Video, indexing_stale_id).index_status == 'indexed'
+
+def test_gunicorn_config_serves_the_app_with_several_workers():
+    """gunicorn.conf.py migrates once in the master, then every worker serves the app"""
+    import socket
+    workdir = tempfile.mkdtemp(dir=TEST_DIR)
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    database = os.path.join(workdir, 'gunicorn.db')
+    env = dict(os.environ, PORT=str(port), WEB_CONCURRENCY='2', GUNICORN_THREADS='2', GUNICORN_ACCESS_LOG='',
+               DATABASE_URL=f'sqlite:///{database}', UPLOAD_FOLDER=os.path.join(workdir, 'upload'),
+               PROMETHEUS_MULTIPROC_DIR=os.path.join(workdir, 'metrics'))
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'backend:app'],
+                              cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    try:
+        # Idle keep-alive connections would hold up the graceful shutdown below
+        close = {'Connection': 'close'}
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                # Connections are accepted once the master listens, and answered once a worker has booted
+                response = requests.get(f'http://127.0.0.1:{port}/health', headers=close, timeout=30)
+                break
+            except requests.exceptions.ConnectionError:
+                assert server.poll() is None and time.monotonic() < deadline, server.stderr.read() if server.poll() is not None else 'timed out'
+                time.sleep(0.3)
+        assert response.status_code == 200 and response.json()['status'] == 'healthy'
+        assert all(requests.get(f'http://127.0.0.1:{port}/api/profile', headers=close, timeout=5).status_code == 401 for _ in range(6))
+        with sqlite3.connect(database) as connection:
+            revision = connection.execute('SELECT version_num FROM alembic_version').fetchone()[0]
+        assert revision == ScriptDirectory(load_backend().MIGRATIONS_DIR).get_current_head()
+    finally:
+        server.terminate()
+        _, errors = server.communicate(timeout=60)
+    assert server.returncode == 0, errors
+    assert errors.count('Booting worker') == 2
+
+def test_metrics_endpoint_needs_the_token_and_reports_request_latency(monkeypatch):
+    from prometheus_client import REGISTRY
+    backend = load_backend()
+    monkeypatch.setattr(backend, 'METRICS_TOKEN', 'scrape-me')
+    client, _ = logged_in_client(backend)
+    labels = {'method': 'GET', 'endpoint': '/api/videos', 'status': '200'}
+    before = REGISTRY.get_sample_value('cctv_http_request_duration_seconds_count', labels) or 0
+    assert client.get('/api/videos').status_code == 200
+    assert REGISTRY.get_sample_value('cctv_http_request_duration_seconds_count', labels) == before + 1
+
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    response = client.get('/metrics', headers={'Authorization': 'Bearer scrape-me'})
+    assert response.status_code == 200 and response.content_type.startswith('text/plain')
+    assert 'cctv_http_request_duration_seconds_bucket{endpoint="/api/videos"' in response.get_data(as_text=True)
+
+def test_slow_requests_are_logged_with_their_stages(monkeypatch, capsys):
+    from prometheus_client import REGISTRY
+    backend = load_backend()
+    client, _ = logged_in_client(backend)
+    before = REGISTRY.get_sample_value('cctv_slow_operations_total', {'kind': 'request'}) or 0
+    monkeypatch.setattr(backend, 'SLOW_REQUEST_SECONDS', 0.0)
+    client.get('/api/videos')
+    line = [line for line in capsys.readouterr().out.splitlines() if line.startswith('Slow request GET /api/videos 200:')][-1]
+    # Queries made while serving the request are timed as the db stage: seconds/calls
+    assert ' db=' in line and line.rstrip().split('db=')[1].split('/')[1].isdigit()
+    assert REGISTRY.get_sample_value('cctv_slow_operations_total', {'kind': 'request'}) == before + 1
+
+    monkeypatch.setattr(backend, 'SLOW_REQUEST_SECONDS', 3600.0)
+    client.get('/api/videos')
+    assert 'Slow request' not in capsys.readouterr().out
+
+def test_traced_jobs_record_latency_and_log_slow_runs(capsys):
+    from prometheus_client import REGISTRY
+    from metrics import span, traced_job
+
+    @traced_job('test_job', 0.05)
+    def job(name, seconds):
+        with span('model'):
+            time.sleep(seconds)
+    before = REGISTRY.get_sample_value('cctv_job_duration_seconds_count', {'kind': 'test_job'}) or 0
+    job('fast', 0)
+    assert capsys.readouterr().out == ''
+    job('slow', 0.06)
+    line = capsys.readouterr().out
+    assert line.startswith('Slow test_job job slow 0.06: ') and line.rstrip().endswith('/1') and ' model=0.' in line
+    assert REGISTRY.get_sample_value('cctv_job_duration_seconds_count', {'kind': 'test_job'}) == before + 2
+
+@pytest.mark.parametrize('values, fraction, expected', [
+    ([], 0.5, None),
+    ([0.3], 0.99, 0.3),
+    ([float(i) for i in range(1, 11)], 0.5, 5.0),
+    ([float(i) for i in range(1, 11)], 0.9, 9.0),
+    ([float(i) for i in range(1, 11)], 0.99, 10.0),
+    ([float(i) for i in range(1, 101)], 0.99, 99.0),
+])
+def test_benchmark_percentile_is_nearest_rank(values, fraction, expected):
+    from benchmark import percentile
+    assert percentile(values, fraction) == expected
+
+def test_benchmark_summary_counts_errors_apart_from_latencies():
+    from benchmark import summarize
+    assert summarize([0.004, 0.001, 0.002, 0.003], 1, 2.0) == {
+        'requests': 5, 'errors': 1, 'seconds': 2.0, 'throughput_rps': 2.0, 'mean_ms': 2.5,
+        'p50_ms': 2.0, 'p90_ms': 4.0, 'p99_ms': 4.0, 'max_ms': 4.0}
+    assert summarize([], 3, 1.0)['p99_ms'] is None
+
+def test_benchmark_comparison_flags_p99_and_throughput_regressions(capsys):
+    from benchmark import compare_results
+    baseline = {'scenarios': {
+        'login': {'p50_ms': 10, 'p99_ms': 20, 'throughput_rps': 100},
+        'list_videos': {'p50_ms': 10, 'p99_ms': 20, 'throughput_rps': 100},
+        'upload': {'p50_ms': 10, 'p99_ms': 20, 'throughput_rps': 100},
+    }}
+    current = {'scenarios': {
+        'login': {'p50_ms': 30, 'p99_ms': 24, 'throughput_rps': 90},  # p50 alone and changes within tolerance pass
+        'list_videos': {'p50_ms': 10, 'p99_ms': 30, 'throughput_rps': 100},
+        'upload': {'p50_ms': 10, 'p99_ms': 20, 'throughput_rps': 70},
+        'analyze_video': {'p50_ms': 500, 'p99_ms': 900, 'throughput_rps': 1},  # not in the baseline
+    }}
+    assert compare_results(baseline, current, 0.25) == ['list_videos p99_ms', 'upload throughput_rps']
+    assert 'analyze_video' not in capsys.readouterr().out
+
+def test_benchmark_runs_end_to_end_against_a_baseline():
+    workdir = tempfile.mkdtemp(dir=TEST_DIR)
+    scenarios = ['login', 'list_videos_cursor', 'chat_history', 'analyze_video']
+    baseline, output = os.path.join(workdir, 'baseline.json'), os.path.join(workdir, 'bench.json')
+    with open(baseline, 'w') as f:
+        json.dump({'scenarios': {name: {'p50_ms': 60000, 'p99_ms': 60000, 'throughput_rps': 0.01} for name in scenarios}}, f)
+    env = {key: value for key, value in os.environ.items() if key not in ('DATABASE_URL', 'UPLOAD_FOLDER')}
+    result = subprocess.run([sys.executable, 'benchmark.py', '--scenarios', ','.join(scenarios), '--users', '2',
+                             '--videos-per-user', '30', '--chat-videos-per-user', '1', '--chats-per-video', '20',
+                             '--requests', '8', '--concurrency', '2', '--model-delay', '0.01',
+                             '--output', output, '--compare', baseline],
+                            cwd=os.path.dirname(os.path.abspath(__file__)), env=env, capture_output=True, text=True, timeout=300)
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert 'Regressions' not in result.stdout
+    with open(output) as f:
+        results = json.load(f)
+    assert results['seed'] == {'users': 2, 'videos': 60, 'chats': 40}
+    for name in scenarios:
+        assert results['scenarios'][name]['requests'] == 8 and results['scenarios'][name]['errors'] == 0
+
+def test_batch_analysis_answers_new_questions_with_one_model_call(monkeypatch):
+    """Blank and repeated questions are dropped, cached ones are answered from the cache, the rest in one call"""
+    backend = load_backend()
+    monkeypatch.setenv('DASHSCOPE_API_KEY', 'test-key')
+    monkeypatch.setattr(backend, 'prepare_video_frames', lambda video, sampling, max_frames: None)
+    prompts = []
+
+    def run_qwen_analysis(video_url, prompt, route=None, **kwargs):
+        prompts.append(prompt)
+        route['model'] = 'stub-model'
+        if len(prompts) == 1:
+            return '{"answers": [{"id": 1, "answer": "A red car."}, {"id": 2, "answer": "Two people."}]}'
+        return 'At noon.'
+    monkeypatch.setattr(backend, 'run_qwen_analysis', run_qwen_analysis)
+    client, user_id = logged_in_client(backend)
+    with backend.app.app_context():
+        video_id = make_video(backend, backend.db.session.get(backend.User, user_id)).id
+
+    response = client.post('/api/analyze_video/batch', json={
+        'video_id': video_id, 'questions': ['Any cars?', '  ', 'Any people?', 'Any cars?']})
+    assert response.status_code == 200
+    assert [(a['question'], a['answer'], a['cached']) for a in response.json['answers']] == [
+        ('Any cars?', 'A red car.', False), ('Any people?', 'Two people.', False)]
+    assert len(prompts) == 1 and 'Any people?' in prompts[0]
+
+    response = client.post('/api/analyze_video/batch', json={'video_id': video_id, 'questions': ['any cars', 'When?']})
+    assert [(a['answer'], a['cached']) for a in response.json['answers']] == [('A red car.', True), ('At noon.', False)]
+    assert prompts[1:] == ['When?']
+    with backend.app.app_context():
+        assert backend.ChatHistory.query.filter_by(video_id=video_id).count() == 4
+
+@pytest.mark.parametrize('body, status', [
+    ({'video_id': None, 'questions': ['Any cars?']}, 400),
+    ({'questions': 'Any cars?'}, 400),
+    ({'questions': ['', '   ']}, 400),
+    ({'questions': [f'Question {i}?' for i in range(11)]}, 400),
+    ({'questions': ['Any cars?'], 'max_frames': -1}, 400),
+    ({'questions': ['Any cars?'], 'sampling': 'sideways'}, 400),
+    ({'video_id': 10 ** 9, 'questions': ['Any cars?']}, 404),
+])
+def test_batch_analysis_rejects_invalid_requests(monkeypatch, body, status):
+    backend = load_backend()
+    monkeypatch.setattr(backend, 'BATCH_MAX_QUESTIONS', 10)
+    client, user_id = logged_in_client(backend)
+    with backend.app.app_context():
+        video_id = make_video(backend, backend.db.session.get(backend.User, user_id)).id
+    assert client.post('/api/analyze_video/batch', json={'video_id': video_id, **body}).status_code == status
+
+def test_keyframe_selection_is_bounded_and_follows_scene_changes():
+    import numpy as np
+    from frame_sampler import SCENE_THRESHOLD, select_motion, select_scene, select_uniform
+    indices = list(range(0, 200, 5))
+    assert select_uniform(indices, 50) == indices
+    assert select_uniform(indices, 5) == [0, 50, 100, 145, 195]
+
+    scores = np.zeros(len(indices), dtype=np.float32)
+    scores[[10, 30]] = SCENE_THRESHOLD * 2  # two cuts
+    scores[20] = SCENE_THRESHOLD / 2  # a change too small to count
+    assert select_scene(indices, scores, 8, min_frames=0) == [0, 50, 150]
+    # Static footage is padded with evenly spaced frames
+    assert select_scene(indices, np.zeros(len(indices), dtype=np.float32), 8) == [0, 65, 130, 195]
+    assert len(select_scene(indices, np.full(len(indices), SCENE_THRESHOLD * 2, dtype=np.float32), 8)) == 8
+
+    busy = np.zeros(len(indices), dtype=np.float32)
+    busy[30:] = 40.0  # all the motion is in the last quarter
+    selected = select_motion(indices, busy, 8)
+    assert len(selected) <= 8 and sum(index >= 150 for index in selected) >= 6
+
+def test_extract_keyframes_writes_bounded_jpegs_once(monkeypatch):
+    import cv2
+    import frame_sampler
+    workdir = tempfile.mkdtemp(dir=TEST_DIR)
+    clip = make_clip(os.path.join(workdir, 'clip.avi'))
+    output_dir = os.path.join(workdir, 'frames')
+    frames = frame_sampler.extract_keyframes(clip, output_dir, strategy='uniform', max_frames=4, max_width=100)
+    assert [frame['timestamp'] for frame in frames] == [0.0, 2.0, 4.5, 6.5]
+    assert all(cv2.imread(frame['path']).shape[:2] == (75, 100) for frame in frames)
+
+    # Later calls read the manifest instead of decoding the video again
+    def score_frames(*args, **kwargs):
+        raise AssertionError('video decoded again')
+    with monkeypatch.context() as patch:
+        patch.setattr(frame_sampler, 'score_frames', score_frames)
+        assert frame_sampler.extract_keyframes(clip, output_dir, strategy='uniform', max_frames=4, max_width=100) == frames
+    # A missing frame file means the extraction is redone
+    os.remove(frames[1]['path'])
+    assert frame_sampler.extract_keyframes(clip, output_dir, strategy='uniform', max_frames=4, max_width=100) == frames
+    assert os.path.exists(frames[1]['path'])
+
+def test_uploaded_video_questions_send_keyframes_instead_of_the_video(monkeypatch):
+    from types import SimpleNamespace
+    backend = load_backend()
+    requests_made = []
+
+    def chat_completion(**kwargs):
+        requests_made.append(kwargs)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content='A box slides past.'))])
+    monkeypatch.setattr(backend, 'get_model_client', lambda: SimpleNamespace(chat_completion=chat_completion))
+    monkeypatch.setattr(backend, 'MOTION_SENSITIVITY', None)
+    with backend.app.app_context():
+        video = make_video(backend, make_user(backend))
+        video.video_type = 'upload'
+        video.file_path_or_url = make_clip(os.path.join(tempfile.mkdtemp(dir=TEST_DIR), 'clip.avi'))
+        backend.db.session.commit()
+        for sampling in ('uniform', 'none'):
+            answer, _ = backend.answer_question(video, 'What moves?', 'https://example.com/clip.avi', 'fast', sampling, 4, use_index=False)
+            assert answer == 'A box slides past.'
+
+    def part_types(request):
+        return [part['type'] for part in request['messages'][-1]['content']]
+    assert part_types(requests_made[0]) == ['text', 'text'] + ['image_url'] * 4
+    assert requests_made[0]['messages'][-1]['content'][1]['text'].endswith('at: 0.0s, 2.0s, 4.5s, 6.5s.')
+    assert part_types(requests_made[1]) == ['text', 'video_url']
+
+def test_probe_thumbnail_and_hash_read_the_uploaded_file():
+    import cv2
+    from video_ingest import hash_file, make_thumbnail, probe_video
+    workdir = tempfile.mkdtemp(dir=TEST_DIR)
+    clip = make_clip(os.path.join(workdir, 'clip.avi'))
+    assert probe_video(clip) == {'fps': 10.0, 'frame_count': 70, 'width': 160, 'height': 120, 'duration': 7}
+    thumbnail = os.path.join(workdir, 'thumb.jpg')
+    assert make_thumbnail(clip, thumbnail, max_width=80)
+    assert cv2.imread(thumbnail).shape[:2] == (60, 80)
+    with open(clip, 'rb') as f:
+        assert hash_file(clip) == hashlib.sha256(f.read()).hexdigest()
+
+    broken = os.path.join(workdir, 'broken.mp4')
+    with open(broken, 'wb') as f:
+        f.write(b'not a video')
+    with pytest.raises(ValueError):
+        probe_video(broken)
+    assert make_thumbnail(broken, os.path.join(workdir, 'none.jpg')) is False
+
+def test_upload_returns_at_once_and_ingestion_fills_in_the_metadata(monkeypatch):
+    backend = load_backend()
+    monkeypatch.setattr(backend, 'AUTO_INDEX_VIDEOS', False)
+    submitted = []
+    monkeypatch.setattr(backend, 'submit_ingestion', submitted.append)
+    client, _ = logged_in_client(backend)
+    with open(make_clip(os.path.join(tempfile.mkdtemp(dir=TEST_DIR), 'clip.avi')), 'rb') as f:
+        data = f.read()
+    name = f'{uuid.uuid4().hex}.avi'
+    response = client.post('/api/upload_video', data={'file': (io.BytesIO(data), name)}, content_type='multipart/form-data')
+    assert response.status_code == 201 and response.json['is_processed'] is False
+    video_id = response.json['video_id']
+    assert submitted == [video_id]
+    assert client.get(f'/api/video/{video_id}/thumbnail').status_code == 404
+
+    backend.run_ingestion(video_id)
+    with backend.app.app_context():
+        video = backend.db.session.get(backend.Video, video_id)
+        assert (video.is_processed, video.duration, video.file_size, video.processing_error) == (True, 7, len(data), None)
+        assert video.content_hash == hashlib.sha256(data).hexdigest()
+        # The default keyframes are extracted ahead of the first question
+        assert os.path.isdir(os.path.join(backend.FRAMES_FOLDER, video.content_hash))
+    response = client.get(f'/api/video/{video_id}/thumbnail')
+    assert response.status_code == 200 and response.data[:2] == b'\xff\xd8'
+
+def test_failed_ingestion_is_recorded_and_not_resumed(monkeypatch):
+    backend = load_backend()
+    path = os.path.join(tempfile.mkdtemp(dir=TEST_DIR), 'broken.mp4')
+    with open(path, 'wb') as f:
+        f.write(b'not a video')
+    video_id = make_upload(backend, file_path_or_url=path)
+    backend.run_ingestion(video_id)
+    with backend.app.app_context():
+        video = backend.db.session.get(backend.Video, video_id)
+        assert video.is_processed is False and 'Could not open video' in video.processing_error
+        submitted = []
+        monkeypatch.setattr(backend, 'submit_ingestion', submitted.append)
+        monkeypatch.setattr(backend, 'submit_indexing', lambda video_id: None)
+        backend.resume_pending_ingestion()
+        assert video_id not in submitted
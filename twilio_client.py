@@ -0,0 +1,124 @@
+import os
+import random
+import threading
+import time
+
+import httpx
+
+from metrics import span
+
+DEFAULT_BASE_URL = 'https://api.twilio.com'
+
+# Status codes worth retrying (rate limiting and Twilio-side failures)
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Twilio rejects WhatsApp bodies longer than this
+MAX_BODY_LENGTH = 1600
+
+
+class TwilioError(Exception):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def is_retryable(error):
+    """Return True for errors where the message was certainly not sent, or Twilio asked us to retry"""
+    if isinstance(error, TwilioError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    # Only failures before the request went out; a read timeout may have sent the message already
+    return isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+
+
+class TwilioClient:
+    """Process-wide client for the Twilio Messages REST API with pooled keep-alive connections and retries"""
+
+    def __init__(self, account_sid, auth_token, from_number, base_url=DEFAULT_BASE_URL, timeout=15.0,
+                 connect_timeout=5.0, max_connections=10, max_keepalive_connections=5,
+                 max_retries=3, backoff_base=0.5, backoff_max=10.0):
+        self.account_sid = account_sid
+        self.from_number = from_number
+        self.base_url = base_url.rstrip('/')
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.http_client = httpx.Client(
+            auth=(account_sid, auth_token),
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections),
+        )
+
+    def backoff_delay(self, attempt, retry_after=None):
+        """Full-jitter exponential backoff, honouring Retry-After when Twilio sends one"""
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def send_message(self, to, body):
+        """Send a WhatsApp message and return its Twilio SID"""
+        url = f'{self.base_url}/2010-04-01/Accounts/{self.account_sid}/Messages.json'
+        data = {'From': self.from_number, 'To': to, 'Body': body[:MAX_BODY_LENGTH]}
+        attempt = 0
+        while True:
+            retry_after = None
+            try:
+                with span('twilio'):
+                    response = self.http_client.post(url, data=data)
+                if response.status_code >= 400:
+                    retry_after = response.headers.get('retry-after')
+                    raise TwilioError(f'Twilio returned {response.status_code}: {response.text[:200]}', response.status_code)
+                return response.json().get('sid')
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = self.backoff_delay(attempt, retry_after)
+                print(f"Twilio request failed ({e.__class__.__name__}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+                attempt += 1
+
+    def close(self):
+        self.http_client.close()
+
+
+_twilio_client = None
+_twilio_client_lock = threading.Lock()
+
+
+def client_settings_from_env():
+    return {
+        'account_sid': os.environ.get('TWILIO_ACCOUNT_SID'),
+        'auth_token': os.environ.get('TWILIO_AUTH_TOKEN'),
+        'from_number': os.environ.get('TWILIO_WHATSAPP_NUMBER', 'whatsapp:+1234567890'),
+        # Point at a local stand-in for tests
+        'base_url': os.environ.get('TWILIO_API_BASE_URL', DEFAULT_BASE_URL),
+        'timeout': float(os.environ.get('TWILIO_TIMEOUT', 15)),
+        'max_retries': int(os.environ.get('TWILIO_MAX_RETRIES', 3)),
+    }
+
+
+def get_twilio_client():
+    """Return the shared Twilio client, creating it from the environment on first use"""
+    global _twilio_client
+    if _twilio_client is None:
+        with _twilio_client_lock:
+            if _twilio_client is None:
+                settings = client_settings_from_env()
+                if not settings['account_sid'] or not settings['auth_token']:
+                    raise RuntimeError('TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN must be configured')
+                _twilio_client = TwilioClient(**settings)
+    return _twilio_client
+
+
+def configure_twilio_client(**overrides):
+    """Replace the shared client, e.g. to point it at a local fake endpoint"""
+    global _twilio_client
+    settings = client_settings_from_env()
+    settings.update(overrides)
+    with _twilio_client_lock:
+        if _twilio_client is not None:
+            _twilio_client.close()
+        _twilio_client = TwilioClient(**settings)
+    return _twilio_client
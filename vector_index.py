@@ -0,0 +1,133 @@
+import hashlib
+import re
+import threading
+
+import numpy as np
+
+
+# Function words that carry no meaning for search
+STOPWORDS = {
+    'the', 'and', 'was', 'were', 'are', 'is', 'did', 'does', 'what', 'who', 'how', 'any', 'there', 'this',
+    'that', 'with', 'from', 'into', 'for', 'have', 'has', 'had', 'its', 'their', 'then', 'than', 'some',
+}
+
+
+def tokenize(text):
+    """Lowercased content words with common English suffixes stripped"""
+    words = []
+    for word in re.findall(r'[a-z0-9]+', (text or '').lower()):
+        if len(word) < 3 or word in STOPWORDS:
+            continue
+        if len(word) > 4:
+            word = re.sub(r'(ing|ed|es|s)$', '', word)
+        words.append(word)
+    return words
+
+
+def normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32)
+
+
+class HashingEmbedder:
+    """Deterministic local stand-in for an embedding model.
+
+    Words and word pairs are hashed into a fixed number of signed buckets, so texts
+    sharing vocabulary land close together. No network or model download is needed,
+    which keeps search usable offline and in tests.
+    """
+
+    def __init__(self, dim=384):
+        self.dim = dim
+        self.name = f'hashing-{dim}'
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = tokenize(text)
+            for feature in words + [f'{a} {b}' for a, b in zip(words, words[1:])]:
+                value = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+                vectors[row, value % self.dim] += 1.0 if value >> 63 else -1.0
+        return normalize(vectors)
+
+
+class ModelEmbedder:
+    """Embeddings from an OpenAI-compatible endpoint (e.g. DashScope text-embedding-v3)"""
+
+    def __init__(self, client, model='text-embedding-v3', dim=1024, batch_size=10):
+        self.client = client
+        self.model = model
+        self.dim = dim
+        self.batch_size = batch_size
+        self.name = f'{model}-{dim}'
+
+    def embed(self, texts):
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = [text or ' ' for text in texts[start:start + self.batch_size]]
+            response = self.client.embeddings(model=self.model, input=batch, dimensions=self.dim)
+            vectors.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+        return normalize(np.array(vectors, dtype=np.float32).reshape(len(texts), self.dim))
+
+
+class VectorIndex:
+    """In-memory cosine similarity index, partitioned by owner so a search only scans one user's vectors.
+
+    Vectors are expected to be L2-normalised, so a dot product is the cosine similarity.
+    Each partition grows by doubling, making incremental adds amortised O(1).
+    """
+
+    def __init__(self, dim):
+        self.dim = dim
+        self.partitions = {}  # owner -> {'keys': [...], 'matrix': ndarray, 'size': int, 'positions': {key: row}}
+        self.lock = threading.Lock()
+
+    def add(self, owner, keys, vectors):
+        """Insert or replace vectors for the given keys"""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        with self.lock:
+            partition = self.partitions.setdefault(owner, {
+                'keys': [], 'matrix': np.zeros((16, self.dim), dtype=np.float32), 'size': 0, 'positions': {}
+            })
+            for key, vector in zip(keys, vectors):
+                row = partition['positions'].get(key)
+                if row is None:
+                    if partition['size'] == len(partition['matrix']):
+                        grown = np.zeros((len(partition['matrix']) * 2, self.dim), dtype=np.float32)
+                        grown[:partition['size']] = partition['matrix'][:partition['size']]
+                        partition['matrix'] = grown
+                    row = partition['size']
+                    partition['size'] += 1
+                    partition['keys'].append(key)
+                    partition['positions'][key] = row
+                partition['matrix'][row] = vector
+
+    def remove(self, owner, keys):
+        """Drop keys from search results (their rows are zeroed and reused by nothing)"""
+        with self.lock:
+            partition = self.partitions.get(owner)
+            if partition is None:
+                return
+            for key in keys:
+                row = partition['positions'].pop(key, None)
+                if row is not None:
+                    partition['matrix'][row] = 0.0
+                    partition['keys'][row] = None
+
+    def search(self, owner, vector, k=10, min_score=0.0):
+        """Return up to k (key, score) pairs, best first"""
+        with self.lock:
+            partition = self.partitions.get(owner)
+            if partition is None or partition['size'] == 0:
+                return []
+            scores = partition['matrix'][:partition['size']] @ np.asarray(vector, dtype=np.float32)
+            keys = list(partition['keys'])
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(keys[i], float(scores[i])) for i in top if keys[i] is not None and scores[i] > min_score]
+
+    def __len__(self):
+        with self.lock:
+            return sum(len(p['positions']) for p in self.partitions.values())
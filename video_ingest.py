@@ -0,0 +1,55 @@
+import hashlib
+
+import cv2
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path):
+    """SHA-256 of a file, read in chunks so memory use stays flat"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def probe_video(path):
+    """Return basic stream metadata read from the container headers"""
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise ValueError(f'Could not open video: {path}')
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        return {
+            'fps': fps,
+            'frame_count': frame_count,
+            'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 0),
+            'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 0),
+            'duration': round(frame_count / fps) if fps and frame_count else None,
+        }
+    finally:
+        cap.release()
+
+
+def make_thumbnail(path, output_path, position=0.1, max_width=320, jpeg_quality=75):
+    """Save a JPEG thumbnail taken `position` of the way into the video; returns False if no frame could be read"""
+    cap = cv2.VideoCapture(path)
+    try:
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        if frame_count > 1:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int(frame_count * position))
+        ret, frame = cap.read()
+        if not ret:
+            # Seeking is unreliable in some containers, fall back to the first frame
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = cap.read()
+        if not ret:
+            return False
+    finally:
+        cap.release()
+    height, width = frame.shape[:2]
+    if width > max_width:
+        frame = cv2.resize(frame, (max_width, int(height * max_width / width)), interpolation=cv2.INTER_AREA)
+    return cv2.imwrite(output_path, frame, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
@@ -0,0 +1,208 @@
+import difflib
+import math
+import re
+from datetime import datetime, timedelta
+
+# Intents are tried in order; the first pattern found in the message wins
+INTENT_PATTERNS = [
+    ('analyze', re.compile(r'\b(what happen\w*|happen\w*|analy[sz]e|describe|summar\w*|anything|anyone|anybody|'
+                           r'who|was there|were there|activity|events?)\b')),
+    ('list', re.compile(r'\b(list|show|which|my (videos?|cameras?|recordings?|clips?))\b')),
+    ('help', re.compile(r'\b(help|hi|hello|hey|commands?|menu|start)\b')),
+]
+CAMERA_WORDS = re.compile(r'\bcam(era)?s?\b')
+
+# Words in a message that never name a video or camera
+FILLER_WORDS = {
+    'a', 'an', 'the', 'in', 'on', 'at', 'of', 'to', 'for', 'from', 'my', 'me', 'i', 'is', 'was', 'were', 'are',
+    'what', 'happen', 'happened', 'happening', 'analyze', 'analyse', 'describe', 'summary', 'summarize',
+    'summarise', 'show', 'list', 'which', 'did', 'anything', 'anyone', 'anybody', 'who', 'there', 'see', 'seen',
+    'please', 'can', 'you', 'tell', 'about', 'video', 'videos', 'footage', 'clip', 'recording', 'any', 'and',
+}
+
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+MONTHS = ['january', 'february', 'march', 'april', 'may', 'june', 'july', 'august', 'september', 'october',
+          'november', 'december']
+MONTH_PATTERN = '|'.join(month[:3] + r'[a-z]*' for month in MONTHS)
+PARTS_OF_DAY = {'morning': (6, 12), 'afternoon': (12, 18), 'evening': (18, 24)}
+
+# Minimum similarity for a misspelt word to count as a name word
+FUZZY_CUTOFF = 0.8
+
+
+def words(text):
+    return re.findall(r'[a-z0-9]+', (text or '').lower())
+
+
+def trigrams(word):
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NameIndex:
+    """Token index over entity names (videos, cameras) for resolving mentions in free text.
+
+    Each name is split into words; postings map words to names, and a trigram index over
+    the vocabulary finds misspelt words. A lookup only touches the names sharing a word
+    with the message, so its cost follows the message, not the number of names.
+    """
+
+    def __init__(self, entries=()):
+        self.names = {}  # key -> name words
+        self.postings = {}  # word -> set of keys
+        self.grams = {}  # trigram -> set of vocabulary words
+        for key, name in entries:
+            self.add(key, name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, key, name):
+        tokens = words(name)
+        if not tokens:
+            return
+        self.names[key] = tokens
+        for token in tokens:
+            if token not in self.postings:
+                self.postings[token] = set()
+                for gram in trigrams(token):
+                    self.grams.setdefault(gram, set()).add(token)
+            self.postings[token].add(key)
+
+    def weight(self, token):
+        """Inverse document frequency: words shared by many names ('camera') count for little"""
+        return math.log(1 + len(self.names) / len(self.postings[token]))
+
+    def similar(self, token):
+        """Vocabulary words equal or close to `token`, with their similarity"""
+        if token in self.postings:
+            return {token: 1.0}
+        if len(token) < 4 or token.isdigit():
+            # Short words and numbers ('camera 1' vs 'camera 2') must match exactly
+            return {}
+        candidates = set()
+        for gram in trigrams(token):
+            candidates |= self.grams.get(gram, set())
+        matches = {}
+        for candidate in candidates:
+            score = difflib.SequenceMatcher(None, token, candidate).ratio()
+            if score >= FUZZY_CUTOFF:
+                matches[candidate] = score
+        return matches
+
+    def match(self, text, min_score=0.45, limit=5):
+        """Names mentioned in `text` as [(key, score)], best first.
+
+        The score is the weighted share of the name's words found in the text; ties go to
+        the name with more matched words, then to the higher key (the newer entry).
+        """
+        found = {}
+        for token in set(words(text)) - FILLER_WORDS:
+            for word, similarity in self.similar(token).items():
+                found[word] = max(found.get(word, 0.0), similarity)
+        candidates = {}
+        for word, similarity in found.items():
+            for key in self.postings[word]:
+                candidates.setdefault(key, {})[word] = similarity
+        results = []
+        for key, matched in candidates.items():
+            tokens = self.names[key]
+            total = sum(self.weight(token) for token in tokens)
+            covered = sum(self.weight(token) * matched.get(token, 0.0) for token in tokens)
+            score = covered / total if total else 0.0
+            if score >= min_score:
+                results.append((key, round(score, 3), covered))
+        results.sort(key=lambda result: (result[1], result[2], result[0]), reverse=True)
+        return [(key, score) for key, score, _ in results[:limit]]
+
+
+def day_start(moment):
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def resolve_date_phrase(text, now):
+    """Find a date phrase in `text` and resolve it against `now` (naive local time).
+
+    Returns (start, end, label) with `end` exclusive, or None. Understands today/tonight,
+    yesterday, last night, parts of the day, weekdays, this/last week, "N hours/days ago",
+    "last N hours/days" and dates like 2026-10-15 or 15 October.
+    """
+    text = (text or '').lower()
+    today = day_start(now)
+
+    match = re.search(r'\b(\d{4})-(\d{2})-(\d{2})\b', text)
+    if match:
+        try:
+            start = datetime(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+            return start, start + timedelta(days=1), match.group(0)
+        except ValueError:
+            pass
+    match = (re.search(rf'\b(\d{{1,2}})(?:st|nd|rd|th)?\s+(?:of\s+)?({MONTH_PATTERN})\b', text)
+             or re.search(rf'\b({MONTH_PATTERN})\s+(\d{{1,2}})(?:st|nd|rd|th)?\b', text))
+    if match:
+        day, month = match.groups() if match.group(1).isdigit() else reversed(match.groups())
+        month = next(i for i, name in enumerate(MONTHS, 1) if month.startswith(name[:3]))
+        try:
+            start = datetime(now.year, month, int(day))
+            if start > now:
+                start = start.replace(year=now.year - 1)
+            return start, start + timedelta(days=1), match.group(0)
+        except ValueError:
+            pass
+
+    match = re.search(r'\b(?:last|past)\s+(\d+)\s+(hour|day)s?\b', text) or re.search(r'\b(\d+)\s+(hour|day)s?\s+ago\b', text)
+    if match:
+        amount, unit = int(match.group(1)), match.group(2)
+        if 'ago' in match.group(0):
+            if unit == 'hour':
+                start = now - timedelta(hours=amount)
+                return start, start + timedelta(hours=1), match.group(0)
+            start = today - timedelta(days=amount)
+            return start, start + timedelta(days=1), match.group(0)
+        return now - timedelta(**{f'{unit}s': amount}), now, match.group(0)
+
+    if re.search(r'\blast night\b', text):
+        return today - timedelta(hours=6), today + timedelta(hours=6), 'last night'
+    if re.search(r'\btonight\b', text):
+        return today + timedelta(hours=18), today + timedelta(hours=30), 'tonight'
+    match = re.search(r'\b(today|yesterday|this)\s+(morning|afternoon|evening)\b', text)
+    if match:
+        base = today - timedelta(days=1) if match.group(1) == 'yesterday' else today
+        first, last = PARTS_OF_DAY[match.group(2)]
+        return base + timedelta(hours=first), base + timedelta(hours=last), match.group(0)
+    if re.search(r'\btoday\b', text):
+        return today, today + timedelta(days=1), 'today'
+    if re.search(r'\byesterday\b', text):
+        return today - timedelta(days=1), today, 'yesterday'
+    if re.search(r'\bthis week\b', text):
+        return today - timedelta(days=today.weekday()), today + timedelta(days=1), 'this week'
+    if re.search(r'\blast week\b', text):
+        monday = today - timedelta(days=today.weekday())
+        return monday - timedelta(days=7), monday, 'last week'
+    match = re.search(r'\b(last\s+)?(' + '|'.join(WEEKDAYS) + r')\b', text)
+    if match:
+        back = (today.weekday() - WEEKDAYS.index(match.group(2))) % 7
+        if back == 0 and match.group(1):
+            back = 7
+        start = today - timedelta(days=back)
+        return start, start + timedelta(days=1), match.group(0)
+    return None
+
+
+def route_message(text, now):
+    """Classify a WhatsApp message.
+
+    Returns {'intent': 'analyze'|'list'|'help'|None, 'target': 'cameras'|'videos',
+    'date': (start, end, label) or None, 'text': the message without its date phrase}
+    for entity matching against the user's name indexes.
+    """
+    lowered = (text or '').lower()
+    date = resolve_date_phrase(lowered, now)
+    remainder = lowered.replace(date[2], ' ') if date else lowered
+    intent = next((name for name, pattern in INTENT_PATTERNS if pattern.search(remainder)), None)
+    return {
+        'intent': intent,
+        'target': 'cameras' if CAMERA_WORDS.search(remainder) and not re.search(r'\bvideos?\b', remainder) else 'videos',
+        'date': date,
+        'text': remainder,
+    }